@@ -0,0 +1,136 @@
+"""
+benchmarks.bootstrap
+~~~~~~~~~~~~~~~~~~~~
+
+Measures how long a statefulset of `--size` pods takes to form a cluster,
+running a `ClusterManager` for every pod on a thread of its own against the
+stand-ins in `fakes`.
+
+Reports the seconds until the cluster was finished and until every pod was
+done bootstrapping, the requests made to each endpoint and to the master and
+the peak RSS of the process.  Run it once per process so the peak RSS is its
+own, eg:
+
+    python3 -m benchmarks.bootstrap --size 10 --engine async --json
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+from benchmarks import fakes
+
+
+def configure(proxy, log_level, wait_timeout):
+    """Points couchdiscover at `proxy`, it must run before importing it as
+    its config is read on import.
+    """
+    os.environ.update(
+        HTTP_PROXY=proxy.url, http_proxy=proxy.url, NO_PROXY='', no_proxy='',
+        KUBE_API_URL='http://{}'.format(fakes.KUBE_HOST),
+        LOG_LEVEL=log_level, WAIT_TIMEOUT=str(wait_timeout))
+
+
+def run(size, engine='sync', join_mode='peer', log_level='WARNING',
+        timeout=300):
+    """Bootstraps `size` pods at once, returning a dict of results."""
+    couch = fakes.FakeCouchCluster(size)
+    kube = fakes.FakeKube(size)
+    proxy = fakes.FakeProxy(couch, kube).start()
+    configure(proxy, log_level, timeout)
+
+    from couchdiscover import couch as couch_, manage, tracing
+
+    # the fake pods have no DNS records
+    couch_.CouchInitClient.host_is_valid = staticmethod(lambda host: True)
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+
+    errors = []
+
+    def pod(index):
+        try:
+            with tracing.span('boot'):
+                manager = manage.ClusterManager(
+                    host=fakes.pod_host(index), engine=engine,
+                    join_mode=join_mode)
+                manager.run_bootstrap()
+        except Exception as err:
+            errors.append('{}: {!r}'.format(fakes.pod_host(index), err))
+
+    threads = [threading.Thread(target=pod, args=(index,), daemon=True)
+               for index in range(size)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    deadline = start + timeout
+    for thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+    bootstrapped = time.monotonic() - start
+    proxy.shutdown()
+
+    finished = couch.finished
+    if not finished and not errors:
+        errors.append('timed out after {}s'.format(timeout))
+    return dict(
+        size=size, engine=engine, join_mode=join_mode, finished=finished,
+        time_to_finished=(couch.finished_at - start
+                          if couch.finished_at else None),
+        time_to_bootstrapped=bootstrapped,
+        requests=sum(proxy.counts.values()),
+        master_requests=proxy.host_counts[fakes.pod_host(0)],
+        endpoints=dict(proxy.counts.most_common()),
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        errors=errors)
+
+
+def report(result, out=sys.stdout):
+    """Writes `result` out for humans."""
+    write = out.write
+    write('size: {size}  engine: {engine}  join_mode: {join_mode}  '
+          'finished: {finished}\n'.format(**result))
+    for key in ('time_to_finished', 'time_to_bootstrapped'):
+        value = result[key]
+        write('  {}: {}\n'.format(
+            key, 'n/a' if value is None else '{:.3f}s'.format(value)))
+    write('  peak_rss: {:.1f}MiB\n'.format(result['peak_rss_kb'] / 1024))
+    write('  requests: {}\n'.format(result['requests']))
+    write('  master_requests: {}\n'.format(result['master_requests']))
+    for endpoint, count in result['endpoints'].items():
+        write('    {:>7}  {}\n'.format(count, endpoint))
+    for error in result['errors']:
+        write('  error: {}\n'.format(error))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--size', type=int, default=3)
+    parser.add_argument('--engine', choices=('sync', 'async'),
+                        default='sync')
+    parser.add_argument('--join-mode',
+                        choices=('peer', 'coordinator', 'lease'),
+                        default='peer')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--json', action='store_true',
+                        help='write the results as json')
+    args = parser.parse_args(argv)
+    result = run(args.size, args.engine, args.join_mode, args.log_level,
+                 args.timeout)
+    if args.json:
+        json.dump(result, sys.stdout)
+        sys.stdout.write('\n')
+    else:
+        report(result)
+    return 0 if result['finished'] and not result['errors'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
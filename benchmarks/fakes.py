@@ -0,0 +1,403 @@
+"""
+benchmarks.fakes
+~~~~~~~~~~~~~~~~
+
+In-process stand-ins for the CouchDB nodes of a statefulset and for the
+kubernetes apiserver, served by a single HTTP proxy.
+
+Clients are pointed at the proxy with `HTTP_PROXY`, so every request arrives
+with the absolute url it was meant for and the host in it picks the fake
+node, or the apiserver when it's `KUBE_HOST`.  Only as much of each api as
+couchdiscover uses is implemented, and every request is counted per
+endpoint and per host.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import base64
+import collections
+import collections.abc
+import json
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+KUBE_HOST = 'kube.bench'
+NAMESPACE = 'default'
+STATEFULSET = 'couchdb'
+PORTS = (5984, 5986)
+CREDS = ('admin', 'secret')
+VERSION = '2.1.0'
+
+
+def pod_host(index, statefulset=STATEFULSET, namespace=NAMESPACE):
+    """Returns the fqdn of the pod with ordinal `index`."""
+    return '{0}-{1}.{0}.{2}.svc.cluster.local'.format(
+        statefulset, index, namespace)
+
+
+def _endpoint_name(method, path):
+    path = re.sub(r'^/_nodes/(?!_all_docs|_bulk_docs|_changes)[^/]+',
+                  '/_nodes/{id}', path)
+    path = re.sub(r'/namespaces/[^/]+', '', path)
+    return '{} {}'.format(method, path)
+
+
+class FakeNode:
+    """The cluster_setup state and `_nodes` db of one CouchDB node."""
+
+    def __init__(self, host):
+        self.host = host
+        self.state = 'cluster_disabled'
+        self.admin = None
+        self.nodes = {self.node_name(host)}
+
+    @staticmethod
+    def node_name(host):
+        return 'couchdb@{}'.format(host)
+
+
+class FakeCouchCluster:
+    """The CouchDB nodes of a statefulset of `size` pods.
+
+    `finished_at` is set to the time of `clock` when the first
+    `finish_cluster` succeeded.
+    """
+
+    def __init__(self, size, creds=CREDS, clock=time.monotonic):
+        self.size = size
+        self.creds = tuple(creds)
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.nodes = {}
+        self.finished_at = None
+
+    def node(self, host):
+        with self.lock:
+            if host not in self.nodes:
+                self.nodes[host] = FakeNode(host)
+            return self.nodes[host]
+
+    @property
+    def finished(self):
+        with self.lock:
+            return (len(self.nodes) == self.size and
+                    all(n.state == 'cluster_finished'
+                        for n in self.nodes.values()))
+
+    def _cluster_setup(self, node, method, body):
+        if method == 'GET':
+            return 200, {'state': node.state}
+        data = json.loads(body or '{}')
+        action = data.get('action')
+        if action == 'enable_cluster':
+            node.admin = (data['username'], data['password'])
+            node.state = 'cluster_enabled'
+        elif action == 'add_node':
+            node.nodes.add(node.node_name(data['host']))
+            other = self.node(data['host'])
+            other.nodes |= node.nodes
+        elif action == 'finish_cluster':
+            if node.state == 'cluster_finished':
+                return 400, {'error': 'bad_request',
+                             'reason': 'Cluster is already finished.'}
+            for other in self.nodes.values():
+                if other.node_name(other.host) in node.nodes:
+                    other.state = 'cluster_finished'
+            if self.finished_at is None:
+                self.finished_at = self.clock()
+        else:
+            return 400, {'error': 'bad_request'}
+        return 201, {'ok': True}
+
+    @staticmethod
+    def _all_dbs(port, query):
+        dbs = ['_dbs', '_nodes'] if port == 5986 else ['_replicator',
+                                                       '_users']
+        start = json.loads(query.get('start_key', ['null'])[0])
+        end = json.loads(query.get('end_key', ['null'])[0])
+        return 200, [db for db in dbs if (start is None or db >= start) and
+                     (end is None or db <= end)]
+
+    @staticmethod
+    def _nodes(node, method, path, body):
+        if path == '/_nodes':
+            return 200, {'db_name': '_nodes', 'update_seq': len(node.nodes)}
+        if path == '/_nodes/_changes':
+            rows = [{'id': name, 'seq': seq}
+                    for seq, name in enumerate(sorted(node.nodes))]
+            return 200, '\n'.join(json.dumps(row) for row in rows) + '\n'
+        doc_id = unquote(path[len('/_nodes/'):])
+        if doc_id == '_all_docs':
+            keys = json.loads(body)['keys'] if body else sorted(node.nodes)
+            rows = [{'id': key, 'key': key, 'value': {'rev': '1-0'}}
+                    if key in node.nodes else {'key': key,
+                                               'error': 'not_found'}
+                    for key in keys]
+            return 200, {'total_rows': len(node.nodes), 'rows': rows}
+        if doc_id == '_bulk_docs':
+            results = []
+            for doc in json.loads(body)['docs']:
+                if doc.get('_deleted') and doc['_id'] in node.nodes:
+                    node.nodes.discard(doc['_id'])
+                    results.append({'id': doc['_id'], 'rev': '2-0'})
+                else:
+                    results.append({'id': doc['_id'], 'error': 'conflict'})
+            return 201, results
+        if doc_id not in node.nodes:
+            return 404, {'error': 'not_found', 'reason': 'missing'}
+        if method == 'DELETE':
+            node.nodes.discard(doc_id)
+            return 200, {'ok': True}
+        return 200, {'_id': doc_id, '_rev': '1-0'}
+
+    def handle(self, host, port, method, path, query, body, auth):
+        node = self.node(host)
+        with self.lock:
+            authed = node.admin is None or auth == node.admin
+            if path == '/':
+                return 200, {'couchdb': 'Welcome', 'version': VERSION}
+            if path == '/_all_dbs' and (authed or port != 5986):
+                return self._all_dbs(port, query)
+            if not authed:
+                return 401, {'error': 'unauthorized'}
+            if path == '/_cluster_setup':
+                return self._cluster_setup(node, method, body)
+            if path == '/_membership':
+                nodes = sorted(node.nodes)
+                return 200, {'all_nodes': nodes, 'cluster_nodes': nodes}
+            if path == '/_dbs/_all_docs' and port == 5986:
+                return 200, {'total_rows': 0, 'rows': []}
+            if path.startswith('/_nodes') and port == 5986:
+                return self._nodes(node, method, path, body)
+            return 404, {'error': 'not_found', 'reason': 'missing'}
+
+
+class FakeKube:
+    """The apiserver's view of a statefulset of `size` pods, where the pods
+    for which `ready(index)` is True are in the endpoint, all of them when
+    it isn't passed.
+    """
+
+    def __init__(self, size, name=STATEFULSET, creds=CREDS, ready=None):
+        self.size = size
+        self.name = name
+        self.creds = tuple(creds)
+        self.ready = ready or (lambda index: True)
+        self.leases = {}
+        self.lease_version = 1
+        self.lease_changed = threading.Condition()
+
+    @staticmethod
+    def _meta(name):
+        return {'name': name, 'namespace': NAMESPACE, 'resourceVersion': '1'}
+
+    def endpoint(self):
+        addresses = [{'hostname': '{}-{}'.format(self.name, i),
+                      'ip': '10.0.0.{}'.format(i)}
+                     for i in range(self.size) if self.ready(i)]
+        meta = self._meta(self.name)
+        # changes whenever a pod becomes ready
+        meta['resourceVersion'] = str(len(addresses) + 1)
+        return {'kind': 'Endpoints', 'metadata': meta,
+                'subsets': [{'addresses': addresses,
+                             'ports': [{'port': port} for port in PORTS]}]}
+
+    def statefulset(self):
+        def ref(env, key):
+            return {'name': env, 'valueFrom': {
+                'secretKeyRef': {'name': self.name, 'key': key}}}
+        container = {'name': self.name, 'env': [
+            ref('COUCHDB_ADMIN_USER', 'user'),
+            ref('COUCHDB_ADMIN_PASS', 'pass')]}
+        return {'kind': 'StatefulSet', 'metadata': self._meta(self.name),
+                'spec': {'replicas': self.size, 'template': {
+                    'spec': {'containers': [container]}}}}
+
+    def secret(self):
+        def encode(value):
+            return base64.b64encode(value.encode()).decode()
+        user, password = self.creds
+        return {'kind': 'Secret', 'metadata': self._meta(self.name),
+                'data': {'user': encode(user), 'pass': encode(password)}}
+
+    def _store_lease(self, obj):
+        self.lease_version += 1
+        obj['metadata']['resourceVersion'] = str(self.lease_version)
+        self.leases[obj['metadata']['name']] = obj
+        self.lease_changed.notify_all()
+        return obj
+
+    def changed_leases(self, name, since):
+        """Returns the leases, or the one named `name`, changed after
+        resourceVersion `since`, oldest first.
+        """
+        with self.lease_changed:
+            return sorted((obj for obj in self.leases.values()
+                           if int(obj['metadata']['resourceVersion']) > since
+                           and name in (None, obj['metadata']['name'])),
+                          key=lambda obj: int(
+                              obj['metadata']['resourceVersion']))
+
+    @staticmethod
+    def watch_line(objs):
+        """Returns the watch events for `objs` as lines of json."""
+        return ''.join(json.dumps({'type': 'MODIFIED', 'object': obj}) + '\n'
+                       for obj in objs)
+
+    def _watch_leases(self, name, since, timeout):
+        """Yields a line for every change to the leases after `since`,
+        until `timeout` seconds have passed.
+        """
+        deadline = time.monotonic() + timeout
+
+        def changed():
+            return self.changed_leases(name, since)
+
+        while True:
+            with self.lease_changed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.lease_changed.wait_for(
+                        changed, remaining):
+                    return
+                objs = changed()
+            since = int(objs[-1]['metadata']['resourceVersion'])
+            yield self.watch_line(objs)
+
+    def lease(self, method, path, query, body):
+        """The `coordination.k8s.io/v1` leases, where replacing one checks
+        its resourceVersion.
+        """
+        name = path.rpartition('/leases')[2].strip('/') or None
+        selector = query.get('fieldSelector', [''])[0]
+        if selector.startswith('metadata.name='):
+            name = selector.split('=', 1)[1]
+        if method == 'GET' and query.get('watch') == ['true']:
+            since = int(query.get('resourceVersion', ['0'])[0])
+            timeout = float(query.get('timeoutSeconds', ['300'])[0])
+            return 200, self._watch_leases(name, since, timeout)
+        with self.lease_changed:
+            current = self.leases.get(name)
+            if method == 'GET' and path.endswith('/leases'):
+                items = [obj for obj in self.leases.values()
+                         if name in (None, obj['metadata']['name'])]
+                return 200, {'kind': 'LeaseList', 'items': items, 'metadata': {
+                    'resourceVersion': str(self.lease_version)}}
+            if method == 'GET':
+                if current is None:
+                    return 404, {'kind': 'Status', 'code': 404,
+                                 'reason': 'NotFound'}
+                return 200, current
+            obj = json.loads(body)
+            name = obj['metadata']['name']
+            current = self.leases.get(name)
+            version = obj['metadata'].get('resourceVersion')
+            if method == 'POST' and current is not None:
+                return 409, {'kind': 'Status', 'code': 409,
+                             'reason': 'AlreadyExists'}
+            if method == 'PUT' and (current is None or version !=
+                                    current['metadata']['resourceVersion']):
+                return 409, {'kind': 'Status', 'code': 409,
+                             'reason': 'Conflict'}
+            return (201 if method == 'POST' else 200), self._store_lease(obj)
+
+    def handle(self, method, path, query, body=None):
+        if '/leases' in path:
+            return self.lease(method, path, query, body)
+        kind, _, name = path.rpartition('/')
+        kind = kind.rpartition('/')[2]
+        objects = {'endpoints': self.endpoint,
+                   'statefulsets': self.statefulset,
+                   'secrets': self.secret}
+        if kind in objects and name == self.name:
+            return 200, objects[kind]()
+        if name == 'endpoints':
+            return 200, {'kind': 'EndpointsList',
+                         'metadata': {'resourceVersion': '1'},
+                         'items': [self.endpoint()]}
+        return 404, {'kind': 'Status', 'code': 404, 'reason': 'NotFound'}
+
+
+class FakeProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _auth(self):
+        header = self.headers.get('Authorization', '')
+        if header.startswith('Basic '):
+            return tuple(base64.b64decode(header[6:]).decode().split(':', 1))
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else None
+        query = parse_qs(url.query)
+        server = self.server
+        server.counts[_endpoint_name(self.command, url.path)] += 1
+        server.host_counts[url.hostname] += 1
+        if url.hostname == KUBE_HOST:
+            status, obj = server.kube.handle(
+                self.command, url.path, query, body)
+        else:
+            status, obj = server.couch.handle(
+                url.hostname, url.port, self.command, url.path, query, body,
+                self._auth())
+        if isinstance(obj, collections.abc.Iterator):
+            self._stream(status, obj)
+            return
+        data = (obj if isinstance(obj, str) else json.dumps(obj)).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, status, lines):
+        """Sends each of `lines` as it's produced, as a chunk of its own."""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for line in lines:
+                data = line.encode()
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except OSError:
+            self.close_connection = True
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class FakeProxy(socketserver.ThreadingMixIn, HTTPServer):
+    """Serves `couch` and `kube` to clients using it as their HTTP proxy on
+    a free port of localhost, until `shutdown`.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, couch, kube):
+        super().__init__(('127.0.0.1', 0), FakeProxyHandler)
+        self.couch = couch
+        self.kube = kube
+        self.counts = collections.Counter()
+        self.host_counts = collections.Counter()
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
@@ -0,0 +1,522 @@
+"""
+benchmarks.simulate
+~~~~~~~~~~~~~~~~~~~
+
+A discrete event simulation of bootstrapping a statefulset of `--size` pods
+on a virtual clock, for studying load at scales real time can't reach.
+
+Every pod runs the real `ClusterManager` on a thread of its own, but time
+is read from and slept on a `VirtualClock` installed with `util.set_clock`,
+and HTTP goes through `SimAdapter` to the stand-ins in `fakes` instead of
+the network.  The clock only moves forward once every pod is asleep, then
+jumps straight to the earliest wake up, so an hour of polling by hundreds
+of pods takes seconds.
+
+Latencies, request failures, how long CouchDB takes to boot and the order
+pods start in are injected, pods that crash are restarted after a delay
+like the kubelet would.  Reports the request rate over time at the master
+and at the apiserver, eg:
+
+    python3 -m benchmarks.simulate --size 500 --start-order random
+
+Only the sync engine is simulated, asyncio's sleeps run on real time.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import argparse
+import base64
+import collections
+import collections.abc
+import heapq
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+
+from benchmarks import fakes
+
+
+START_ORDERS = ('parallel', 'ordered', 'reverse', 'random')
+JOIN_MODES = ('peer', 'coordinator', 'lease')
+log = logging.getLogger('benchmarks.simulate')
+
+
+class _Sleeper:
+    __slots__ = ('event', 'participant')
+
+    def __init__(self, participant):
+        self.event = threading.Event()
+        self.participant = participant
+
+
+class VirtualClock:
+    """A clock whose time only passes when `run` advances it.
+
+    Threads that `participate` are the simulation, time advances to the
+    earliest wake up as soon as all of them are asleep.  When participants
+    block on anything but the clock, like a pool's futures, pass `settle` to
+    also advance once nothing has touched the clock for that many real
+    seconds.
+
+    Threads in `wait` look at their event every `poll` real seconds.  With
+    `settle`, time doesn't advance again after waking threads outside the
+    simulation until nothing has touched the clock for two polls, so the
+    events they set reach the participants waiting on them first.
+    """
+    poll = 0.001
+
+    def __init__(self, settle=None):
+        self.settle = settle
+        self._now = 0.0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._local = threading.local()
+        self._sleepers = []
+        self._seq = itertools.count()
+        self._participants = 0
+        self._sleeping = 0
+        self._activity = 0
+
+    def monotonic(self):
+        """Returns the virtual time in seconds."""
+        return self._now
+
+    def _push(self, seconds):
+        sleeper = _Sleeper(getattr(self._local, 'participant', False))
+        with self._lock:
+            wake = self._now + max(0.0, seconds)
+            heapq.heappush(self._sleepers, (wake, next(self._seq), sleeper))
+            if sleeper.participant:
+                self._sleeping += 1
+            self._activity += 1
+            self._changed.notify()
+        return sleeper
+
+    def sleep(self, seconds):
+        """Blocks the calling thread until `seconds` of virtual time pass."""
+        self._push(seconds).event.wait()
+
+    def wait(self, event, timeout=None):
+        """Blocks the calling thread until `event` is set or `timeout`
+        seconds of virtual time pass, returning whether it's set.
+        """
+        if timeout is None:
+            return event.wait()
+        sleeper = self._push(timeout)
+        while not sleeper.event.is_set():
+            if event.wait(self.poll):
+                self._cancel(sleeper)
+                break
+        return event.is_set()
+
+    def _cancel(self, sleeper):
+        """Wakes `sleeper` up before its time, unless it already was."""
+        with self._lock:
+            if sleeper.event.is_set():
+                return
+            self._sleepers = [s for s in self._sleepers if s[2] is not sleeper]
+            heapq.heapify(self._sleepers)
+            if sleeper.participant:
+                self._sleeping -= 1
+            self._activity += 1
+            self._changed.notify()
+            sleeper.event.set()
+
+    def add_participants(self, count):
+        """Counts `count` threads about to `participate`, so time can't pass
+        before they've started.
+        """
+        with self._lock:
+            self._participants += count
+
+    def participate(self):
+        """Marks the calling thread as one counted by `add_participants`."""
+        self._local.participant = True
+
+    def leave(self):
+        """Marks the calling participant as finished."""
+        self._local.participant = False
+        with self._lock:
+            self._participants -= 1
+            self._activity += 1
+            self._changed.notify()
+
+    def _advance(self):
+        """Wakes the earliest sleepers, returning whether any of them is
+        outside the simulation.
+        """
+        outside = False
+        self._now = max(self._now, self._sleepers[0][0])
+        while self._sleepers and self._sleepers[0][0] <= self._now:
+            _, _, sleeper = heapq.heappop(self._sleepers)
+            if sleeper.participant:
+                self._sleeping -= 1
+            else:
+                outside = True
+            sleeper.event.set()
+        return outside
+
+    def _settle(self):
+        activity = None
+        while activity != self._activity:
+            activity = self._activity
+            self._changed.wait(self.poll * 2)
+
+    def run(self, until=None):
+        """Advances time until every participant has left, or the next wake
+        up is past `until` seconds.  Returns the virtual time it stopped at.
+        """
+        with self._lock:
+            while self._participants:
+                if not self._sleepers:
+                    self._changed.wait(self.settle)
+                    continue
+                if until is not None and self._sleepers[0][0] > until:
+                    break
+                if self._sleeping >= self._participants:
+                    if self._advance() and self.settle is not None:
+                        self._settle()
+                    continue
+                if self.settle is None:
+                    self._changed.wait()
+                    continue
+                activity = self._activity
+                if (not self._changed.wait(self.settle) and
+                        activity == self._activity and self._advance()):
+                    self._settle()
+            return self._now
+
+
+class _Stream:
+    """The body of a streamed response, produced by `lines` as it's read."""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def stream(self, amt=None, decode_content=None):
+        for line in self.lines:
+            yield line.encode()
+
+    def close(self):
+        pass
+
+
+class SimAdapter(requests.adapters.BaseAdapter):
+    """Serves requests from `sim`'s backends after its injected latency,
+    failing them at its injected rate.
+    """
+
+    def __init__(self, sim):
+        super().__init__()
+        self.sim = sim
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        url = urlsplit(request.url)
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode()
+        status, obj = self.sim.handle(
+            request.method, url, body, request.headers.get('Authorization'))
+        if status is None:
+            raise requests.ConnectionError(obj, request=request)
+        resp = requests.Response()
+        resp.status_code = status
+        if isinstance(obj, collections.abc.Iterator):
+            resp.headers = CaseInsensitiveDict({
+                'Content-Type': 'application/json'})
+            resp.raw = _Stream(obj)
+        else:
+            data = (obj if isinstance(obj, str) else json.dumps(obj)).encode()
+            resp.headers = CaseInsensitiveDict({
+                'Content-Type': 'application/json',
+                'Content-Length': str(len(data))})
+            resp.raw = io.BytesIO(data)
+        resp.encoding = 'utf-8'
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+        return resp
+
+    def close(self):
+        pass
+
+
+class Simulation:
+    """Bootstraps `size` pods on a `VirtualClock`.
+
+    Pods start according to `start_order`: all at once ('parallel'), one
+    after the other once the previous one is ready ('ordered'), in reverse
+    so the master is last ('reverse'), or at random within `spread` seconds
+    ('random').  CouchDB in each pod takes `boot` seconds to come up and
+    join the endpoint.  Requests take around `couch_latency` or
+    `kube_latency` seconds and fail with probability `failure_rate`.
+
+    In 'lease' `join_mode`, watches of the Lease see its changes every
+    `watch_poll` seconds.
+    """
+    watch_poll = 0.1
+
+    def __init__(self, size, start_order='parallel', spread=30.0, boot=5.0,
+                 couch_latency=0.005, kube_latency=0.02, failure_rate=0.0,
+                 restart_delay=10.0, join_mode='peer', horizon=3600.0,
+                 bucket=1.0, seed=0):
+        if start_order not in START_ORDERS:
+            raise ValueError('Unknown start order: {}'.format(start_order))
+        if join_mode not in JOIN_MODES:
+            raise ValueError('Unknown join mode: {}'.format(join_mode))
+        self.size = size
+        self.start_order = start_order
+        self.spread = spread
+        self.boot = boot
+        self.couch_latency = couch_latency
+        self.kube_latency = kube_latency
+        self.failure_rate = failure_rate
+        self.restart_delay = restart_delay
+        self.join_mode = join_mode
+        self.horizon = horizon
+        self.bucket = bucket
+        self.random = random.Random(seed)
+        # the master blocks on its pool's futures, and in lease mode on the
+        # Lease's watch too
+        self.clock = VirtualClock(0.005 if join_mode in ('coordinator',
+                                                         'lease') else None)
+        self.starts = self._start_times()
+        self.couch = fakes.FakeCouchCluster(size, clock=self.clock.monotonic)
+        self.kube = fakes.FakeKube(size, ready=self._couch_up)
+        self.master = fakes.pod_host(0)
+        self.events = []
+        self.restarts = 0
+        self.done_at = {}
+        self._lock = threading.Lock()
+        self._hosts = {fakes.pod_host(i): i for i in range(size)}
+        random.seed(seed)
+
+    def _start_times(self):
+        if self.start_order == 'parallel':
+            return [0.0] * self.size
+        if self.start_order == 'ordered':
+            return [i * self.boot for i in range(self.size)]
+        if self.start_order == 'reverse':
+            return [(self.size - 1 - i) * self.boot for i in range(self.size)]
+        return [self.random.uniform(0, self.spread)
+                for _ in range(self.size)]
+
+    def _couch_up(self, index):
+        return self.clock.monotonic() >= self.starts[index] + self.boot
+
+    def _latency(self, mean):
+        with self._lock:
+            return self.random.uniform(mean / 2, mean * 1.5)
+
+    def _failed(self):
+        with self._lock:
+            return self.random.random() < self.failure_rate
+
+    def _target(self, host):
+        if host == fakes.KUBE_HOST:
+            return 'apiserver'
+        return 'master' if host == self.master else 'peers'
+
+    def handle(self, method, url, body, auth):
+        """Handles a request to `url`, returning (status, object), or
+        (None, reason) when the connection fails.
+        """
+        target = self._target(url.hostname)
+        latency = (self.kube_latency if target == 'apiserver' else
+                   self.couch_latency)
+        self.clock.sleep(self._latency(latency))
+        with self._lock:
+            self.events.append((self.clock.monotonic(), target))
+        if target == 'apiserver':
+            if self._failed():
+                return 503, {'kind': 'Status', 'code': 503}
+            query = parse_qs(url.query)
+            if query.get('watch') == ['true'] and '/leases' in url.path:
+                return 200, self._watch_leases(query)
+            return self.kube.handle(method, url.path, query, body)
+        index = self._hosts.get(url.hostname)
+        if index is None or not self._couch_up(index):
+            return None, 'connection refused'
+        if self._failed():
+            return None, 'connection reset'
+        if auth:
+            auth = tuple(base64.b64decode(auth.split()[1])
+                         .decode().split(':', 1))
+        return self.couch.handle(
+            url.hostname, url.port, method, url.path, parse_qs(url.query),
+            body, auth)
+
+    def _watch_leases(self, query):
+        """Yields a line for every change to the watched leases, looking
+        for them every `watch_poll` seconds until the watch times out.
+        """
+        selector = query.get('fieldSelector', [''])[0]
+        name = selector.split('=', 1)[1] if '=' in selector else None
+        since = int(query.get('resourceVersion', ['0'])[0])
+        deadline = self.clock.monotonic() + float(
+            query.get('timeoutSeconds', ['300'])[0])
+        while self.clock.monotonic() < deadline:
+            objs = self.kube.changed_leases(name, since)
+            if objs:
+                since = int(objs[-1]['metadata']['resourceVersion'])
+                yield self.kube.watch_line(objs)
+            else:
+                self.clock.sleep(self.watch_poll)
+
+    def _pod(self, index, manage):
+        self.clock.participate()
+        try:
+            self.clock.sleep(self.starts[index])
+            while True:
+                try:
+                    manager = manage.ClusterManager(
+                        host=fakes.pod_host(index), engine='sync',
+                        join_mode=self.join_mode)
+                    manager.run_bootstrap()
+                    break
+                except Exception as err:
+                    log.debug('pod %s crashed: %r', index, err)
+                    with self._lock:
+                        self.restarts += 1
+                    self.clock.sleep(self.restart_delay)
+            self.done_at[index] = self.clock.monotonic()
+        finally:
+            self.clock.leave()
+
+    def _install(self):
+        """Points couchdiscover at the simulation, returning `manage`."""
+        os.environ['KUBE_API_URL'] = 'http://{}'.format(fakes.KUBE_HOST)
+        from couchdiscover import couch, kube, manage, transport, util
+
+        adapter = SimAdapter(self)
+        util.set_clock(self.clock)
+        transport.get_transport().session.mount('http://', adapter)
+        get_api = kube.KubeAPIClient._get_api
+
+        def _get_api(client):
+            api = get_api(client)
+            api.session.mount('http://', adapter)
+            return api
+
+        kube.KubeAPIClient._get_api = _get_api
+        # the simulated pods have no DNS records
+        couch.CouchInitClient.host_is_valid = staticmethod(
+            lambda host: True)
+        return manage
+
+    def run(self):
+        """Runs the simulation, returning a dict of results."""
+        manage = self._install()
+        self.clock.add_participants(self.size)
+        for index in range(self.size):
+            threading.Thread(target=self._pod, args=(index, manage),
+                             daemon=True).start()
+        end = self.clock.run(self.horizon)
+        finished = self.couch.finished
+        return dict(
+            size=self.size, start_order=self.start_order,
+            join_mode=self.join_mode, finished=finished,
+            time_to_finished=self.couch.finished_at,
+            time_to_bootstrapped=(max(self.done_at.values())
+                                  if len(self.done_at) == self.size
+                                  else None),
+            simulated=end, restarts=self.restarts,
+            requests=dict(collections.Counter(t for _, t in self.events)),
+            rates=self.rates())
+
+    def rates(self):
+        """Returns rows of [start, master, apiserver, peers] requests per
+        second over each `bucket` seconds.
+        """
+        counts = collections.defaultdict(collections.Counter)
+        for time_, target in self.events:
+            counts[int(time_ // self.bucket)][target] += 1
+        if not counts:
+            return []
+        return [[i * self.bucket] +
+                [counts[i][t] / self.bucket
+                 for t in ('master', 'apiserver', 'peers')]
+                for i in range(max(counts) + 1)]
+
+
+def report(result, out=sys.stdout):
+    """Writes `result` out for humans."""
+    write = out.write
+
+    def seconds(value):
+        return 'n/a' if value is None else '{:.2f}s'.format(value)
+
+    write('size: {size}  start_order: {start_order}  join_mode: {join_mode}'
+          '  finished: {finished}\n'.format(**result))
+    write('  time_to_finished: {}\n'.format(
+        seconds(result['time_to_finished'])))
+    write('  time_to_bootstrapped: {}\n'.format(
+        seconds(result['time_to_bootstrapped'])))
+    write('  simulated: {}  restarts: {}\n'.format(
+        seconds(result['simulated']), result['restarts']))
+    write('  requests: {}\n'.format(', '.join(
+        '{}={}'.format(k, v) for k, v in sorted(result['requests'].items()))))
+    rates = result['rates']
+    if rates:
+        peaks = [max(row[i] for row in rates) for i in (1, 2, 3)]
+        write('  peak req/s: master={:.0f} apiserver={:.0f} peers={:.0f}\n'
+              .format(*peaks))
+        write('  {:>8} {:>10} {:>10} {:>10}\n'.format(
+            'time', 'master', 'apiserver', 'peers'))
+        for row in rates:
+            write('  {:>8.1f} {:>10.1f} {:>10.1f} {:>10.1f}\n'.format(*row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--size', type=int, default=50)
+    parser.add_argument('--start-order', choices=START_ORDERS,
+                        default='parallel')
+    parser.add_argument('--spread', type=float, default=30.0,
+                        help='seconds random starts are spread over')
+    parser.add_argument('--boot', type=float, default=5.0,
+                        help='seconds CouchDB takes to come up')
+    parser.add_argument('--couch-latency', type=float, default=0.005)
+    parser.add_argument('--kube-latency', type=float, default=0.02)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--restart-delay', type=float, default=10.0)
+    parser.add_argument('--join-mode', choices=JOIN_MODES, default='peer')
+    parser.add_argument('--horizon', type=float, default=3600.0,
+                        help='seconds of virtual time to give up after')
+    parser.add_argument('--bucket', type=float, default=1.0,
+                        help='seconds the request rates are averaged over')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--json', action='store_true',
+                        help='write the results as json')
+    args = parser.parse_args(argv)
+    os.environ['LOG_LEVEL'] = args.log_level
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+    sim = Simulation(
+        args.size, args.start_order, args.spread, args.boot,
+        args.couch_latency, args.kube_latency, args.failure_rate,
+        args.restart_delay, args.join_mode, args.horizon, args.bucket,
+        args.seed)
+    result = sim.run()
+    if args.json:
+        json.dump(result, sys.stdout)
+        sys.stdout.write('\n')
+    else:
+        report(result)
+    return 0 if result['finished'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
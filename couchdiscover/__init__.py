@@ -9,15 +9,28 @@ Example:
     >>> couchdiscover.entrypoints.main()
 """
 
-from . import config, util, exceptions, kube, couch, manage, entrypoints
+import importlib
+
+from . import (
+    config, metrics, tracing, util, hooks, exceptions, transport, kube,
+    convergence, couch, reconcile, coordination, manage, entrypoints)
 from .kube import KubeHostname, KubeAPIClient, KubeInterface
+from .transport import Transport
+from .hooks import RequestEvent, RequestHooks, RequestRecorder
+from .convergence import MembershipWaiter
 from .couch import CouchServer, CouchInitClient, CouchManager
+from .reconcile import Reconciler
+from .coordination import JoinLease
 from .manage import ClusterManager, ContainerEnvironment
 from .exceptions import (
     CouchDiscGeneralError,
     CouchDiscHTTPError,
+    CouchEnableError,
+    CouchFinishError,
     CouchAddNodeError,
-    InvalidKubeHostnameError
+    CouchRemoveNodeError,
+    InvalidKubeHostnameError,
+    WaitTimeoutError
 )
 
 __title__ = 'couchdiscover'
@@ -26,6 +39,23 @@ __author__ = "Joe Black <me@joeblack.nyc>"
 __license__ = 'Apache 2.0'
 __copyright__ = 'Copyright 2017 Joe Black'
 
+# the asyncio engine is imported on first use, it's the bulk of startup time
+_LAZY_ATTRS = {
+    'aio': ('.aio', None),
+    'AsyncCouchServer': ('.aio', 'AsyncCouchServer'),
+    'AsyncCouchInitClient': ('.aio', 'AsyncCouchInitClient'),
+    'AsyncCouchManager': ('.aio', 'AsyncCouchManager'),
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    module, attr = _LAZY_ATTRS[name]
+    module = importlib.import_module(module, __name__)
+    return module if attr is None else getattr(module, attr)
+
 
 util.setup_logging(
     level=config.LOG_LEVEL, fmt=config.LOG_FORMAT, date=config.DATE_FORMAT)
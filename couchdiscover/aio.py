@@ -0,0 +1,359 @@
+"""
+couchdiscover.aio
+~~~~~~~~~~~~~~~~~
+
+This module contains asyncio counterparts of the objects in `couch`, which
+overlap the independent steps of bootstrapping a node on one event loop.
+
+The underlying clients are blocking, so each operation runs in the loop's
+executor while the coroutines here decide what can run concurrently: the
+admin and data ports are probed together, and the tests run against a node
+before adding it run together.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import asyncio
+import functools
+import logging
+
+from . import config, convergence, couch, tracing, util
+from .exceptions import CouchAddNodeError, CouchDiscHTTPError
+
+
+log = logging.getLogger(__name__)
+
+
+def run_blocking(func, *args, **kwargs):
+    """Runs `func` in the running loop's executor, returning a future."""
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(
+        None, tracing.bind(functools.partial(func, *args, **kwargs)))
+
+
+async def wait_until(predicate, target='condition',
+                     timeout=config.WAIT_TIMEOUT, backoff=None):
+    """Coroutine version of `util.wait_until`, `predicate` being a coroutine
+    function.
+    """
+    wait = util.Wait(target, timeout, backoff)
+    with tracing.span('wait', target=target) as span:
+        while True:
+            span.set_attribute('attempts', wait.attempts + 1)
+            result = wait.step(await predicate())
+            if isinstance(result, util.WaitResult):
+                return result
+            await asyncio.sleep(result)
+
+
+class AsyncCouchServer(util.ReprMixin):
+    """Coroutine interface to a `couch.CouchServer`."""
+    _public_attrs = ('server',)
+
+    def __init__(self, server):
+        self.server = server
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        """Creates the wrapped `CouchServer` and detects its type without
+        blocking the loop.
+        """
+        server = couch.CouchServer(*args, **kwargs)
+        await run_blocking(getattr, server, 'type')
+        return cls(server)
+
+    @property
+    def type(self):
+        """Returns the type of the wrapped server."""
+        return self.server.type
+
+    async def up(self):
+        """Returns True if server is up."""
+        return await run_blocking(getattr, self.server, 'up')
+
+    async def version(self):
+        """Gets version of CouchDB."""
+        return await run_blocking(self.server.version)
+
+    async def request(self, *args, **kwargs):
+        """Send a low level HTTP request."""
+        return await run_blocking(self.server.request, *args, **kwargs)
+
+
+class AsyncCouchInitClient:
+    """Coroutine interface to a `couch.CouchInitClient`.
+
+    `connect` must be awaited before use.
+    """
+
+    def __init__(self, env=None, host='localhost', ports=config.DEFAULT_PORTS,
+                 creds=config.DEFAULT_CREDS, proto='http', transport=None):
+        self.client = couch.CouchInitClient(
+            env, host, ports, creds, proto, transport, connect=False)
+        self.servers = {}
+
+    def __repr__(self):
+        clss = type(self).__name__
+        return '{}({!r})'.format(clss, self.client)
+
+    def __str__(self):
+        return str(self.client)
+
+    async def connect(self, phase=None):
+        """Waits for CouchDB, then sets up both servers concurrently.
+
+        The wait is recorded as bootstrap phase `phase` if given, which is
+        only meant for the local node.
+        """
+        client = self.client
+        with util.timed_phase(phase):
+            await run_blocking(client._wait_for_couch)
+        servers = await asyncio.gather(*[
+            AsyncCouchServer.create(
+                client._args['proto'], client._args['host'], port, None,
+                client._transport)
+            for port in client._args['ports']])
+        ports = client._args['ports']
+        self.servers = dict(zip(ports, servers))
+        client._by_port = {port: s.server for port, s in zip(ports, servers)}
+        await run_blocking(client._upgrade_auth_if_enabled)
+        return self
+
+    @property
+    def status(self):
+        """Returns the last fetched cluster_setup state."""
+        return self.client._status
+
+    @property
+    def disabled(self):
+        """Returns True if status is `cluster_disabled`."""
+        return 'disabled' in (self.status or '')
+
+    @property
+    def enabled(self):
+        """Returns True if status is `cluster_enabled`"""
+        return self.status == 'cluster_enabled'
+
+    @property
+    def finished(self):
+        """Returns True if status is `cluster_finished`"""
+        return self.status == 'cluster_finished'
+
+    async def refresh(self):
+        """Fetches the cluster_setup state again and returns it."""
+        return await run_blocking(self.client.refresh)
+
+    async def up(self):
+        """Returns True if both servers are up, probing them concurrently."""
+        results = await asyncio.gather(
+            *[s.up() for s in self.servers.values()])
+        return all(results)
+
+    async def _test_node(self, node):
+        """Runs the tests against `node` concurrently, returning True if it
+        passes all of them.
+        """
+        client = self.client
+        host = node.client._args['host']
+        valid, up, present = await asyncio.gather(
+            run_blocking(client.host_is_valid, host),
+            node.up(),
+            run_blocking(client._node_in_nodes, client.node_name(host)))
+        return valid and up and not present
+
+    async def enable(self):
+        """Enables the current node."""
+        return await run_blocking(self.client.enable)
+
+    async def add_node(self, remote):
+        """Add's a new node to the current node."""
+        if await self._test_node(remote):
+            return await run_blocking(self.client._add_node, remote.client)
+
+    async def finish(self):
+        """Finish the cluster."""
+        return await run_blocking(self.client.finish)
+
+
+class AsyncCouchManager:
+    """Coroutine counterpart of `couch.CouchManager`.
+
+    `connect` must be awaited before use, it connects to the local node,
+    the master is only connected to once it's waited for.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.host = env.host
+        self.ports = env.ports
+        self.creds = env.creds
+        self.local = AsyncCouchInitClient(env, env.host, env.ports, env.creds)
+        self.master = None
+        if not self.is_master:
+            mhost = env.host.clone(master=True)
+            self.master = AsyncCouchInitClient(
+                env, mhost, env.ports, env.creds)
+
+    def __repr__(self):
+        clss = type(self).__name__
+        attrs = ['status: {}'.format(self.status or util.UNRESOLVED)]
+        attrs.extend('{}: {}'.format(a, getattr(self, a)) for a in
+                     ('is_master', 'ports', 'creds'))
+        attrs = ', '.join(attrs)
+        return '{}({})'.format(clss, attrs)
+
+    @property
+    def is_master(self):
+        """Returns whether local node is the `master`."""
+        return self.host.index == 0
+
+    @property
+    def status(self):
+        """Returns the `status` of wrapped local node."""
+        return self.local.status
+
+    @property
+    def enabled(self):
+        """Returns the `enabled` of wrapped local node."""
+        return self.local.enabled
+
+    @property
+    def disabled(self):
+        """Returns the `disabled` of wrapped local node."""
+        return self.local.disabled
+
+    @property
+    def finished(self):
+        """Returns the `finished` of wrapped local node."""
+        return self.local.finished
+
+    def _clients(self):
+        return [c for c in (self.local, self.master)
+                if c is not None and c.servers]
+
+    async def connect(self):
+        """Connects to the local node and fetches its cluster_setup state."""
+        await self.local.connect('wait_for_couch')
+        await self.local.refresh()
+        return self
+
+    async def refresh(self):
+        """Fetches the cluster_setup state of every connected node
+        concurrently.
+        """
+        await asyncio.gather(*[c.refresh() for c in self._clients()])
+
+    @util.phase('enable')
+    async def enable(self):
+        """Enable the local node but with error checking and logging."""
+        if self.enabled:
+            log.warning('Already enabled')
+        elif self.finished:
+            log.warning("Can't enable finished cluster: %s", self.local)
+        else:
+            log.info('Enabling local: %s', self.local)
+            return await self.local.enable()
+
+    @util.phase('finish')
+    async def finish(self):
+        """Finish cluster but with error checking and logging, retrying until
+        the master reports it finished.
+        """
+        await self.refresh()
+        if self.disabled:
+            log.warning("Can't finish cluster when disabled: %s", self.local)
+            return
+        elif self.finished:
+            log.warning('Cluster already finished: %s', self.local)
+            return
+
+        log.info('Finishing cluster: %s', self.local)
+        master = self.local if self.is_master else self.master
+
+        async def master_finished():
+            try:
+                if await master.refresh() != 'cluster_finished':
+                    await master.finish()
+                return await master.refresh() == 'cluster_finished'
+            except CouchDiscHTTPError as err:
+                log.warning('Failed finishing: %s', err)
+                return False
+
+        await wait_until(master_finished, target='finished cluster')
+
+    @util.phase('wait_for_master')
+    async def wait_for_enabled_master(self):
+        """Wait until master is enabled without blocking the loop."""
+        if self.is_master:
+            log.warning("Can't wait for master when master: %s", self.local)
+        else:
+            async def master_enabled():
+                try:
+                    if not self.master.servers:
+                        await self.master.connect()
+                    await self.master.refresh()
+                except CouchDiscHTTPError as err:
+                    log.debug('Master unavailable: %s', err)
+                    return False
+                return self.master.enabled or self.master.finished
+
+            log.info('Waiting for master: %s to be enabled', self.master)
+            await wait_until(master_enabled, target='enabled master')
+
+    async def _join_master(self, node):
+        """Adds `node` to master unless it's already in master's _nodes,
+        returning True once it is.
+        """
+        client = self.master.client
+        name = client.node_name(node)
+        if await run_blocking(client._node_in_nodes, name):
+            return True
+        log.info(util.KeyValueMessage(
+            'adding node to master', node=node, master=self.master))
+        try:
+            await self.master.add_node(node)
+        except CouchAddNodeError as err:
+            log.warning('Failed adding node: %s', err)
+        return await run_blocking(client._node_in_nodes, name)
+
+    async def add_to_master(self, node=None):
+        """Add the local node to master with error checking and logging,
+        idempotently retrying until it shows up in the master's _nodes.
+        """
+        if not node:
+            node = self.local
+        if self.is_master:
+            log.warning("Can't add self to self, master: %s", self.master)
+        else:
+            await self.wait_for_enabled_master()
+            await self._add_to_enabled_master(node)
+
+    @util.phase('add')
+    async def _add_to_enabled_master(self, node):
+        await wait_until(
+            lambda: self._join_master(node),
+            target='{} joined to master'.format(node))
+
+    @util.phase('wait_for_membership')
+    async def wait_for_membership(self, size, timeout=config.WAIT_TIMEOUT):
+        """Wait until the local node's membership has `size` nodes, following
+        the changes feed in the loop's executor.
+        """
+        waiter = convergence.MembershipWaiter(
+            self.local.client, size, timeout)
+        return await run_blocking(waiter.wait)
+
+
+def run(coro):
+    """Runs `coro` to completion on a new event loop, shutting down the
+    loop's executor along with it.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        # before 3.9, closing the loop doesn't wait for the executor
+        if hasattr(loop, 'shutdown_default_executor'):
+            loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
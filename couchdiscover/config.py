@@ -10,6 +10,11 @@ This module holds configuration constants.
 
 import os
 
+
+def _getbool(key, default='false', getenv=os.getenv):
+    return getenv(key, default).lower() in ('1', 'true', 'yes', 'on')
+
+
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'production')
 
 LOG_FORMAT = '%(asctime)s %(levelname)s %(module)s.%(funcName)s] %(message)s'
@@ -19,6 +24,71 @@ LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
 DEFAULT_CREDS = ('admin', 'secret')
 DEFAULT_PORTS = (5984, 5986)
 
+# connections kept alive per CouchDB host, and number of hosts pooled
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '32'))
+# seconds before a request to CouchDB times out
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))
+
+# seconds between readiness polls start at WAIT_INITIAL, backing off to
+# WAIT_CAP, and give up after WAIT_TIMEOUT, which waits forever when 0
+WAIT_INITIAL = float(os.getenv('WAIT_INITIAL', '0.25'))
+WAIT_CAP = float(os.getenv('WAIT_CAP', '5'))
+WAIT_TIMEOUT = float(os.getenv('WAIT_TIMEOUT', '0')) or None
+
+# bootstrap engine, either 'sync' or 'async'
+ENGINE = os.getenv('ENGINE', 'sync')
+
+# how pods join: 'peer' where each pod adds itself to the master,
+# 'coordinator' where the master adds every peer, or 'lease' where the master
+# adds the peers asking to join on a kubernetes Lease
+JOIN_MODE = os.getenv('JOIN_MODE', 'peer')
+# peers the master adds at once in coordinator and lease mode, and seconds
+# it waits for each
+COORDINATOR_WORKERS = int(os.getenv('COORDINATOR_WORKERS', '8'))
+PEER_TIMEOUT = float(os.getenv('PEER_TIMEOUT', '60'))
+
+# seconds a resolved kubernetes environment snapshot is reused for
+SNAPSHOT_TTL = float(os.getenv('SNAPSHOT_TTL', '30'))
+# seconds fetched kubernetes objects are reused before being fetched again
+KUBE_CACHE_TTL = float(os.getenv('KUBE_CACHE_TTL', '5'))
+# watch the service's endpoint instead of fetching it, requires `watch` rbac
+WATCH_ENDPOINTS = _getbool('WATCH_ENDPOINTS')
+
+# whether the master keeps reconciling membership once bootstrapped, every
+# RECONCILE_INTERVAL seconds, acting on a difference once it's been seen on
+# RECONCILE_HYSTERESIS passes and adding at most RECONCILE_MAX_ADDS nodes
+RECONCILE = _getbool('RECONCILE', 'true')
+RECONCILE_INTERVAL = float(os.getenv('RECONCILE_INTERVAL', '5'))
+RECONCILE_HYSTERESIS = int(os.getenv('RECONCILE_HYSTERESIS', '2'))
+RECONCILE_MAX_ADDS = int(os.getenv('RECONCILE_MAX_ADDS', '8'))
+# whether the reconciler removes nodes beyond the statefulset's size from
+# _nodes, once they've been gone SCALE_DOWN_GRACE seconds, SCALE_DOWN_BATCH
+# nodes at a time
+SCALE_DOWN = _getbool('SCALE_DOWN')
+SCALE_DOWN_GRACE = float(os.getenv('SCALE_DOWN_GRACE', '300'))
+SCALE_DOWN_BATCH = int(os.getenv('SCALE_DOWN_BATCH', '1'))
+
+# talk to the kubernetes api at this url instead of the service account's,
+# eg: through `kubectl proxy` or the benchmarks' fake apiserver
+KUBE_API_URL = os.getenv('KUBE_API_URL')
+
+# serve prometheus metrics on this port, 0 disables it
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# write tracing spans as json lines to 'stderr', 'stdout' or a file path,
+# unset disables tracing
+TRACE_OUTPUT = os.getenv('TRACE_OUTPUT')
+
+# keep the last this many requests to be dumped to stderr on SIGUSR1, 0
+# disables recording
+REQUEST_RECORDER_SIZE = int(os.getenv('REQUEST_RECORDER_SIZE', '256'))
+
+# once done, either release every client and sleep ('sleep') or exec into
+# a minimal sleeper process ('exec'), which falls back to 'sleep' while
+# metrics are served
+IDLE_MODE = os.getenv('IDLE_MODE', 'sleep')
+
 DEV_KUBECONFIG_PATH = "~/.kube/config"
 DEV_HOST = 'couchdb-0.couchdb.default.svc.cluster.local'
 
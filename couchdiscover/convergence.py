@@ -0,0 +1,142 @@
+"""
+couchdiscover.convergence
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the logic for waiting until a CouchDB 2.0 cluster's
+membership has converged on the expected number of nodes.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import collections
+import logging
+
+from . import config, util
+from .exceptions import WaitTimeoutError
+
+
+requests = util.LazyModule('requests')
+log = logging.getLogger(__name__)
+
+MembershipProgress = collections.namedtuple(
+    'MembershipProgress',
+    ('all_nodes', 'cluster_nodes', 'expected', 'elapsed', 'source'))
+
+
+class MembershipWaiter:
+    """Blocks until a node's `/_membership` reports `expected` nodes as both
+    known (`cluster_nodes`, the members of `_nodes`) and connected
+    (`all_nodes`, the connected Erlang nodes), or `timeout`.
+
+    Rather than polling blindly, membership is only checked when the
+    continuous `_changes` feed of the node's `_nodes` db reports a node being
+    added, or on its heartbeats.  Once every node is known, or when the feed
+    isn't available, `/_membership` is polled with backoff until they're all
+    connected.
+
+    Every change in progress is logged and passed to callables registered
+    with `subscribe` as a `MembershipProgress`.
+
+    Example:
+    >>> waiter = MembershipWaiter(client, expected=3, timeout=300)
+    >>> waiter.subscribe(print)
+    >>> waiter.wait()
+    MembershipProgress(all_nodes=3, cluster_nodes=3, expected=3, ...)
+    """
+    heartbeat = 10
+
+    def __init__(self, client, expected, timeout=config.WAIT_TIMEOUT):
+        self.client = client
+        self.expected = expected
+        self.timeout = timeout
+        self.progress = None
+        self._subscribers = []
+        self._start = None
+
+    def __repr__(self):
+        clss = type(self).__name__
+        return '{}(expected: {}, progress: {})'.format(
+            clss, self.expected, self.progress)
+
+    def subscribe(self, callback):
+        """Registers `callback(progress)` to be called on progress."""
+        self._subscribers.append(callback)
+
+    @property
+    def converged(self):
+        """Returns True once every expected node is known and connected."""
+        progress = self.progress
+        return progress is not None and (
+            min(progress.all_nodes, progress.cluster_nodes) >= self.expected)
+
+    def _elapsed(self):
+        return util.clock.monotonic() - self._start
+
+    def _remaining(self):
+        if self.timeout is not None:
+            return self.timeout - self._elapsed()
+
+    def _check(self, source):
+        """Fetches `/_membership`, publishing progress when it changed."""
+        members = self.client.membership() or {}
+        progress = MembershipProgress(
+            len(members.get('all_nodes') or ()),
+            len(members.get('cluster_nodes') or ()),
+            self.expected, self._elapsed(), source)
+        last = self.progress
+        self.progress = progress
+        if last is None or last[:3] != progress[:3]:
+            log.info(util.KeyValueMessage(
+                'membership progress', **progress._asdict()))
+            for callback in list(self._subscribers):
+                callback(progress)
+        return self.converged
+
+    def _all_known(self):
+        return self.progress.cluster_nodes >= self.expected
+
+    def _update_seq(self):
+        info = self.client.request(server='admin', uri='/_nodes')
+        if isinstance(info, dict) and info.get('update_seq') is not None:
+            return info['update_seq']
+        return 'now'
+
+    def _follow(self, since):
+        """Checks membership on every change to `_nodes` after `since`, and
+        on every heartbeat in case the nodes connected in between, until
+        every node is known, raising `WaitTimeoutError` at the deadline.
+        """
+        feed = self.client.follow_changes(
+            '_nodes', since=since, heartbeat=self.heartbeat)
+        for change in feed:
+            source = 'heartbeat' if change is None else 'changes'
+            if self._check(source):
+                return
+            if self._all_known():
+                return
+            remaining = self._remaining()
+            if remaining is not None and remaining <= 0:
+                raise WaitTimeoutError(
+                    target=self, elapsed=self._elapsed(), attempts=0)
+
+    def wait(self):
+        """Blocks until membership converges, returning the final progress.
+
+        Raises `WaitTimeoutError` once `timeout` seconds have passed.
+        """
+        self._start = util.clock.monotonic()
+        # taken before the first check so no change can slip in between
+        since = self._update_seq()
+        if self._check('initial'):
+            return self.progress
+        if not self._all_known():
+            try:
+                self._follow(since)
+            except (requests.RequestException, ValueError) as err:
+                log.info('Changes feed unavailable: %s, polling', err)
+        if not self.converged:
+            util.wait_until(
+                lambda: self._check('poll'), target=self,
+                timeout=self._remaining())
+        return self.progress
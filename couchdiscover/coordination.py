@@ -0,0 +1,243 @@
+"""
+couchdiscover.coordination
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the coordination of the 'lease' join mode through a
+kubernetes `coordination.k8s.io/v1` Lease named after the statefulset.
+
+Rather than every pod polling the master's `/_cluster_setup` and then adding
+itself to it all at once, the master publishes its state in the Lease's
+annotations and pods ask to join by adding their host to it.  The master
+watches the Lease and adds the hosts asking in batches, recording those it
+added, which the pods watch for in turn.  Every write carries the Lease's
+resourceVersion, so a write racing another pod's is rejected and retried on
+the new version instead of overwriting it.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import copy
+import json
+import logging
+import threading
+import time
+
+from . import config, kube, tracing, util
+
+
+ANNOTATION_PREFIX = 'couchdiscover/'
+log = logging.getLogger(__name__)
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime())
+
+
+def _annotations(obj):
+    return (obj or {}).get('metadata', {}).get('annotations') or {}
+
+
+def _get_hosts(obj, key):
+    value = _annotations(obj).get(ANNOTATION_PREFIX + key)
+    return frozenset(json.loads(value)) if value else frozenset()
+
+
+def _set_hosts(obj, key, hosts):
+    annotations = obj['metadata'].setdefault('annotations', {})
+    annotations[ANNOTATION_PREFIX + key] = json.dumps(sorted(hosts))
+
+
+class JoinLease(util.ReprMixin):
+    """The Lease through which the pods of a statefulset coordinate joining
+    the master.
+
+    Its annotations hold the master's `state`, the hosts that asked to join
+    as `requested` and the hosts the master added as `joined`, its holder is
+    the master.  Reads come from an `Informer` once `watch` is called.
+
+    Example:
+    >>> lease = JoinLease.for_env(env)
+    >>> lease.request_join('couchdb-1.couchdb.default.svc.cluster.local')
+    >>> lease.wait_until(lambda: lease.state == 'finished')
+    """
+    _public_attrs = ('name', 'state', 'requested', 'joined')
+    # a conflict only means another write landed first, so it's retried soon
+    conflict_backoff = util.Backoff(initial=0.05, cap=1)
+
+    def __init__(self, api, name, namespace=None):
+        self.api = api
+        self.name = name
+        self.namespace = namespace
+        self.informer = None
+        self._last = None
+        self._changed = threading.Event()
+
+    @classmethod
+    def for_env(cls, env):
+        """Returns the Lease of the statefulset of `env`, a
+        `manage.ContainerEnvironment`.
+        """
+        return cls(env.kube.api, '{}-couchdiscover'.format(env.statefulset),
+                   env.host.namespace)
+
+    @property
+    def resource(self):
+        """Returns the pykube type of the Lease."""
+        return kube.lease_resource()
+
+    def _peek(self, attr):
+        if attr in ('state', 'requested', 'joined'):
+            if self._last is None:
+                return util.UNRESOLVED
+            return self._read(self._last, attr)
+        return super()._peek(attr)
+
+    @staticmethod
+    def _read(obj, attr):
+        if attr == 'state':
+            return _annotations(obj).get(ANNOTATION_PREFIX + 'state')
+        return _get_hosts(obj, attr)
+
+    def get(self):
+        """Returns the Lease, or None if it hasn't been created yet."""
+        informer = self.informer
+        if informer is not None and informer.synced:
+            obj = informer.get()
+        else:
+            obj = self.api.get_lease(self.name, namespace=self.namespace)
+        self._last = obj
+        return obj
+
+    @property
+    def state(self):
+        """Returns the state the master last published, or None."""
+        return self._read(self.get(), 'state')
+
+    @property
+    def requested(self):
+        """Returns a frozenset of the hosts that asked to join."""
+        return self._read(self.get(), 'requested')
+
+    @property
+    def joined(self):
+        """Returns a frozenset of the hosts the master added."""
+        return self._read(self.get(), 'joined')
+
+    def _new(self):
+        return {'apiVersion': self.resource.version, 'kind': 'Lease',
+                'metadata': {'name': self.name, 'namespace': self.namespace},
+                'spec': {}}
+
+    def _try_update(self, mutate):
+        obj = self.get()
+        if obj is None:
+            obj = self._new()
+            mutate(obj)
+            return self.api.create_api_object(
+                self.resource, obj, self.namespace)
+        obj = copy.deepcopy(obj)
+        if mutate(obj) is False:
+            return obj
+        return self.api.replace_api_object(self.resource, obj, self.namespace)
+
+    def update(self, mutate, target='lease update'):
+        """Applies `mutate(obj)` to the Lease, creating it if it's missing,
+        and retries with backoff on the latest version whenever another pod
+        changed it in between.  `mutate` returning False skips the write.
+
+        Returns the Lease as stored.
+        """
+        with tracing.span('lease.update', lease=self.name):
+            result = util.wait_until(
+                lambda: self._try_update(mutate), target=target,
+                backoff=self.conflict_backoff)
+        self._last = result.value
+        return result.value
+
+    def publish(self, state, holder, clear=()):
+        """Publishes the master's `state` with `holder` as the Lease's
+        holder, emptying the lists of hosts named in `clear`.
+        """
+        def mutate(obj):
+            annotations = obj['metadata'].setdefault('annotations', {})
+            annotations[ANNOTATION_PREFIX + 'state'] = state
+            spec = obj.setdefault('spec', {})
+            if spec.get('holderIdentity') != holder:
+                spec['holderIdentity'] = holder
+                spec['acquireTime'] = _now()
+            spec['renewTime'] = _now()
+            for key in clear:
+                _set_hosts(obj, key, ())
+
+        log.info(util.KeyValueMessage(
+            'publishing state', lease=self.name, state=state))
+        return self.update(mutate, target='{} published'.format(state))
+
+    def request_join(self, host):
+        """Asks the master to add `host`, forgetting that it was added
+        before, as that was by a previous master.
+        """
+        def mutate(obj):
+            if (host in _get_hosts(obj, 'requested') and
+                    host not in _get_hosts(obj, 'joined')):
+                return False
+            _set_hosts(obj, 'requested', _get_hosts(obj, 'requested') | {host})
+            _set_hosts(obj, 'joined', _get_hosts(obj, 'joined') - {host})
+
+        log.info(util.KeyValueMessage(
+            'requesting join', lease=self.name, host=host))
+        return self.update(mutate, target='{} join requested'.format(host))
+
+    def mark_joined(self, hosts):
+        """Records `hosts` as added by the master."""
+        hosts = frozenset(hosts)
+
+        def mutate(obj):
+            joined = _get_hosts(obj, 'joined')
+            if hosts <= joined:
+                return False
+            _set_hosts(obj, 'joined', joined | hosts)
+
+        return self.update(mutate, target='joins recorded')
+
+    def _on_change(self, event_type, obj):
+        self._last = obj
+        self._changed.set()
+
+    def watch(self, timeout=None):
+        """Starts watching the Lease, blocking until the informer has synced
+        or `timeout`.
+        """
+        if self.informer is None:
+            self.informer = kube.Informer(
+                self.api, self.resource, self.name, self.namespace)
+            self.informer.subscribe(self._on_change)
+        self.informer.start()
+        self.informer.wait_for_sync(timeout)
+        return self.informer
+
+    def unwatch(self):
+        """Stops watching the Lease."""
+        if self.informer is not None:
+            self.informer.stop()
+            self.informer = None
+
+    def wait_until(self, predicate, target='condition',
+                   timeout=config.WAIT_TIMEOUT):
+        """Calls `predicate` every time the Lease changes until it returns
+        something truthy, see `util.wait_until`.
+
+        Changes are watched for, the backoff between attempts only bounding
+        how long a missed change goes unnoticed.
+        """
+        self.watch(config.WAIT_CAP)
+        wait = util.Wait(target, timeout)
+        with tracing.span('wait', target=target) as span:
+            while True:
+                self._changed.clear()
+                span.set_attribute('attempts', wait.attempts + 1)
+                result = wait.step(predicate())
+                if isinstance(result, util.WaitResult):
+                    return result
+                util.clock.wait(self._changed, result)
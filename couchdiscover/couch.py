@@ -9,57 +9,86 @@ working with and clustering CouchDB 2.0 as higher level objects.
 :license: Apache2.
 """
 
-import time
+import collections
 import json
 import logging
 import socket
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
 
-import requests
-import couchdb
+from . import config, convergence, hooks, kube, metrics, tracing, util
+from .transport import get_transport
+from .exceptions import (
+    CouchAddNodeError, CouchDiscGeneralError, CouchDiscHTTPError,
+    CouchEnableError, CouchFinishError, CouchRemoveNodeError,
+    InvalidKubeHostnameError)
 
-from . import config, util
-from .exceptions import CouchAddNodeError
 
+requests = util.LazyModule('requests')
 
 ADMIN_ONLY_DBS = ('_dbs', '_nodes', '_replicator', '_users')
+ALL_DBS_PAGE_SIZE = 1000
 log = logging.getLogger(__name__)
 
+JoinResult = collections.namedtuple(
+    'JoinResult', ('host', 'ok', 'elapsed', 'error'))
+
 
 class CouchServer(util.ReprMixin):
-    """Encapsulates the logic for interacting with CouchDB 2.0 Server"""
+    """Encapsulates the logic for interacting with CouchDB 2.0 Server
+
+    Requests go through the pooled `transport`, shared process wide by
+    default, with credentials sent per request so `set_creds` can change them
+    in place.  Construction does no I/O, the server's type is detected on
+    first use.
+    """
     _public_attrs = ('url', 'type', 'up')
 
     def __init__(self, proto='http', host='localhost',
-                 port=config.DEFAULT_PORTS[0], creds=config.DEFAULT_CREDS):
+                 port=config.DEFAULT_PORTS[0], creds=config.DEFAULT_CREDS,
+                 transport=None):
         self._args = dict(proto=proto, host=host, port=int(port), auth=creds)
+        self._up = None
+        self._type = None
+        self._type_detected = False
+        self._transport = transport or get_transport()
         self.url = self._get_url()
-        self._couch = couchdb.Server(self.url)
-        self._session = self._get_session()
-        self._wrapped = self._couch
-        self.type = self._detect_type()
+
+    @property
+    def type(self):
+        """Returns 'admin' or 'data' by the dbs the server has, or None if
+        they couldn't be listed, detecting it on first use and again for as
+        long as it's unknown.
+        """
+        if not self._type_detected:
+            server_type = self._detect_type()
+            if server_type is not None:
+                self.type = server_type
+            return server_type
+        return self._type
+
+    @type.setter
+    def type(self, value):
+        self._type = value
+        self._type_detected = True
 
     def _get_url(self):
         args = self._args
-        url = []
-        url.append('{}://'.format(args['proto']))
-        if args['auth']:
-            url.append('{}:{}@'.format(*args['auth']))
-        url.append(args['host'])
-        url.append(':{}'.format(args['port']))
-        url = ''.join(url)
-        return url
-
-    def _get_session(self):
-        sess = requests.Session()
-        sess.headers.update({'Content-Type': 'application/json'})
-        if self._args['auth']:
-            sess.auth = self._args['auth']
-        return sess
+        return '{}://{}:{}'.format(args['proto'], args['host'], args['port'])
+
+    def _get_creds(self):
+        creds = self._args['auth']
+        if creds:
+            return tuple(creds)
+
+    def set_creds(self, creds):
+        """Swaps the credentials used for requests to this server."""
+        self._args['auth'] = creds
 
     def _detect_type(self):
-        all_dbs = self.all_dbs()
-        if isinstance(all_dbs, list):
-            if '_nodes' in all_dbs:
+        dbs = self._all_dbs_range('_nodes', '_nodes')
+        if isinstance(dbs, list):
+            if '_nodes' in dbs:
                 return 'admin'
             else:
                 return 'data'
@@ -70,95 +99,283 @@ class CouchServer(util.ReprMixin):
                 uri = '/' + uri
         return self.url + uri
 
+    def _peek(self, attr):
+        if attr == 'up':
+            return self._up
+        if attr == 'type':
+            return self._type if self._type_detected else util.UNRESOLVED
+        return super()._peek(attr)
+
     @property
     def up(self):
         """Returns True if server is up."""
+        self._up = None
         try:
             if self.version():
-                return True
+                self._up = True
         except ConnectionRefusedError:
             pass
+        return self._up
 
     def __contains__(self, key):
-        all_dbs = self.all_dbs()
-        if all_dbs:
-            return key in all_dbs
+        dbs = self._all_dbs_range(key, key)
+        if isinstance(dbs, list):
+            return key in dbs
 
-    def __getitem__(self, key):
-        return self._couch[key]
+    def __getitem__(self, name):
+        """Returns the `Database` named `name`, without checking it exists."""
+        return Database(self, name)
 
-    def __delitem__(self, key):
-        del self._couch[key]
+    def __delitem__(self, name):
+        self.delete(name)
 
-    @util.passthrough
-    def config(self, *args, **kwargs):
+    def config(self):
         """Displays server configuration."""
-        pass
-
-    @util.passthrough
-    def create(self, *args, **kwargs):
-        """Create a database."""
-        pass
-
-    @util.passthrough
-    def delete(self, *args, **kwargs):
-        """Delete a database."""
-        pass
-
-    @util.passthrough
-    def stats(self, *args, **kwargs):
-        """Server stats."""
-        pass
+        return self.request(uri='/_config')
+
+    def create(self, name):
+        """Creates the database `name`, returning its `Database`."""
+        db = Database(self, name)
+        db.check(self.request('put', db.uri), 'creating')
+        return db
+
+    def delete(self, name):
+        """Deletes the database `name`."""
+        db = Database(self, name)
+        db.check(self.request('delete', db.uri), 'deleting')
+
+    def stats(self, name=None):
+        """Server stats, only those under `name` if given, eg:
+        'couchdb/request_time'.
+        """
+        uri = '/_stats/{}'.format(name) if name else '/_stats'
+        return self.request(uri=uri)
 
-    @util.passthrough
-    def version(self, *args, **kwargs):
+    def version(self):
         """Gets version of CouchDB."""
-        pass
-
-    def all_dbs(self):
-        """Returns a generator iterating all DB objects."""
-        return self.request(uri='/_all_dbs')
+        resp = self.request(uri='/')
+        if isinstance(resp, dict):
+            return resp.get('version')
+
+    def _all_dbs_range(self, start_key=None, end_key=None, limit=None,
+                       skip=None):
+        """Returns a bounded list of DB names from `/_all_dbs`."""
+        params = {}
+        if start_key is not None:
+            params['start_key'] = json.dumps(start_key)
+        if end_key is not None:
+            params['end_key'] = json.dumps(end_key)
+        if limit:
+            params['limit'] = limit
+        if skip:
+            params['skip'] = skip
+        return self.request(uri='/_all_dbs', params=params)
+
+    def all_dbs(self, page_size=ALL_DBS_PAGE_SIZE):
+        """Returns a generator iterating all DB names, fetched from the server
+        `page_size` names at a time.
+        """
+        start_key, skip = None, None
+        while True:
+            page = self._all_dbs_range(start_key, limit=page_size, skip=skip)
+            if not isinstance(page, list):
+                return
+            yield from page
+            # a short page is the last, a long one means limit was ignored
+            if len(page) != page_size:
+                return
+            start_key, skip = page[-1], 1
 
     def request(self, verb='get', uri='', params=None, data=None,
                 headers=None, files=None):
         """Send a low level HTTP request."""
         url = self._build_url(uri)
-        sess = self._session
-        try:
-            req = sess.request(verb, url, params, data, headers, files=files)
+        event = hooks.RequestEvent(
+            'couch', verb.upper(), util.uri_template(uri),
+            bytes_out=hooks.body_size(data), server=self.url)
+        with hooks.HOOKS.request(event):
+            try:
+                req = self._transport.request(
+                    verb, url, params=params, data=data, headers=headers,
+                    files=files, auth=self._get_creds())
+            except (requests.ConnectionError, requests.Timeout) as err:
+                event.exception = err
+                return None
+            event.status = req.status_code
+            event.bytes_in = len(req.content)
             try:
                 json_ = req.json()
                 return json_
-            except json.JSONDecodeError:
+            except json.JSONDecodeError as err:
+                event.exception = err
                 return {}
-        except requests.ConnectionError:
-            pass
+
+    def follow(self, uri, params=None, timeout=None):
+        """Streams a continuous feed, yielding each line decoded from JSON, or
+        None for every heartbeat so callers can check their deadlines.
+        """
+        url = self._build_url(uri)
+        req = self._transport.request(
+            'get', url, params=params, auth=self._get_creds(), stream=True,
+            timeout=timeout)
+        try:
+            req.raise_for_status()
+            for line in req.iter_lines():
+                yield json.loads(line.decode('utf-8')) if line else None
+        finally:
+            req.close()
+
+
+class Database(util.ReprMixin):
+    """A database on a `CouchServer`, its requests going through the server's
+    shared transport.
+
+    Methods raise `CouchDiscHTTPError` when CouchDB can't be reached or
+    answers with an error.
+    """
+    _public_attrs = ('name', 'server')
+
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.uri = '/' + quote(name, safe='')
+
+    def check(self, resp, action):
+        """Returns `resp`, raising if it's missing or an error."""
+        if resp is None or (isinstance(resp, dict) and resp.get('error')):
+            raise CouchDiscHTTPError(
+                'error %s: %s resp: %s', action, self.name, resp)
+        return resp
+
+    def _request(self, verb='get', path='', params=None, body=None):
+        data = json.dumps(body) if body is not None else None
+        return self.server.request(verb, self.uri + path, params, data)
+
+    def _doc_path(self, doc_id):
+        return '/' + quote(doc_id, safe='')
+
+    def info(self):
+        """Returns the database's info."""
+        return self.check(self._request(), 'fetching info of')
+
+    def get(self, doc_id, default=None):
+        """Returns the document `doc_id`, or `default` if it doesn't exist."""
+        doc = self._request(path=self._doc_path(doc_id))
+        if isinstance(doc, dict) and doc.get('error') == 'not_found':
+            return default
+        return self.check(doc, 'fetching {} from'.format(doc_id))
+
+    def __getitem__(self, doc_id):
+        doc = self.get(doc_id)
+        if doc is None:
+            raise KeyError(doc_id)
+        return doc
+
+    def __contains__(self, doc_id):
+        return self.get(doc_id) is not None
+
+    def save(self, doc):
+        """Creates or updates `doc`, setting its `_id` and `_rev`."""
+        if '_id' in doc:
+            resp = self._request('put', self._doc_path(doc['_id']), body=doc)
+        else:
+            resp = self._request('post', body=doc)
+        self.check(resp, 'saving {} to'.format(doc.get('_id', 'doc')))
+        doc.update(_id=resp['id'], _rev=resp['rev'])
+        return resp['id'], resp['rev']
+
+    def delete(self, doc):
+        """Deletes `doc`, which must have its `_id` and `_rev`."""
+        self.check(self._request(
+            'delete', self._doc_path(doc['_id']), {'rev': doc['_rev']}),
+            'deleting {} from'.format(doc['_id']))
+
+    def all_docs(self, keys=None, **params):
+        """Returns the rows of `_all_docs`, only those for `keys` if given,
+        fetched in a single request.  `params` are sent as query parameters,
+        booleans as 'true' or 'false'.
+        """
+        params = {k: json.dumps(v) if isinstance(v, bool) else v
+                  for k, v in params.items()}
+        if keys is None:
+            resp = self._request(path='/_all_docs', params=params)
+        else:
+            resp = self._request(
+                'post', '/_all_docs', params, body={'keys': list(keys)})
+        return self.check(resp, 'listing docs of')['rows']
+
+    def bulk_docs(self, docs):
+        """Creates, updates or deletes `docs` in a single request, returning
+        a result of id, rev or error for each.
+        """
+        return self.check(self._request(
+            'post', '/_bulk_docs', body={'docs': list(docs)}),
+            'saving docs to')
+
+    def changes(self, **params):
+        """Returns the changes since `since` from a normal `_changes` feed."""
+        return self.check(
+            self._request(path='/_changes', params=params),
+            'fetching changes of')
+
+    def follow_changes(self, since='now', heartbeat=10):
+        """Streams the continuous `_changes` feed from `since`, with a
+        heartbeat every `heartbeat` seconds.  See `CouchServer.follow`.
+        """
+        params = dict(
+            feed='continuous', since=since, heartbeat=int(heartbeat * 1000))
+        return self.server.follow(
+            self.uri + '/_changes', params, heartbeat * 3)
 
 
 class CouchInitClient:
-    """Encapsulates a pair of CouchServer objects for admin and data ports."""
+    """Encapsulates a pair of CouchServer objects for admin and data ports.
+
+    Blocks until CouchDB is up unless `connect` is False, in which case
+    `connect` must be called before use.  The servers are built on first
+    use.
+    """
+    SETUP_STATES = ('cluster_disabled', 'cluster_enabled', 'cluster_finished',
+                    'auth_required')
+
     def __init__(self, env=None, host='localhost', ports=config.DEFAULT_PORTS,
-                 creds=config.DEFAULT_CREDS, proto='http'):
+                 creds=config.DEFAULT_CREDS, proto='http', transport=None,
+                 connect=True):
         self.env = env
         self._secure = False
+        self._status = None
+        self._servers = None
+        self._by_port = None
+        self._transport = transport or get_transport()
         self._args = dict(
             proto=proto, host=str(host), ports=ports, creds=creds)
-        self._wait_for_couch()
-        self._servers = self._setup_servers()
+        if connect:
+            self.connect()
+
+    def connect(self, timeout=config.WAIT_TIMEOUT, phase=None):
+        """Waits for CouchDB, then upgrades auth if it's been enabled.
+
+        The wait is recorded as bootstrap phase `phase` if given, which is
+        only meant for the local node.
+        """
+        with util.timed_phase(phase):
+            self._wait_for_couch(timeout)
         self._upgrade_auth_if_enabled()
 
-    def _wait_for_couch(self):
+    def _couch_is_up(self, url):
+        try:
+            self._transport.request('get', url)
+            return True
+        except requests.RequestException:
+            return False
+
+    def _wait_for_couch(self, timeout=config.WAIT_TIMEOUT):
         args = self._args
         url = 'http://{}:{}'.format(args['host'], args['ports'][0])
         log.info('Waiting for host: %s to be up', url)
-        while True:
-            try:
-                req = requests.get(url)
-                log.info('Host is up')
-                break
-            except requests.RequestException:
-                log.info('Host: %s not up yet, retrying in 5s', url)
-                time.sleep(5)
+        util.wait_until(
+            lambda: self._couch_is_up(url), target=url, timeout=timeout)
+        log.info('Host is up')
 
     def _upgrade_auth_if_enabled(self):
         status = self.status
@@ -168,19 +385,54 @@ class CouchInitClient:
             self._upgrade_auth()
 
     def _upgrade_auth(self):
+        """Switches the existing servers over to the admin credentials."""
         self._secure = True
-        self._servers = self._setup_servers(auth=True)
+        for server in self._setup_servers().values():
+            server.set_creds(self._args['creds'])
+        self._servers = None
+        self.invalidate()
 
-    @property
-    def status(self):
-        """Returns the cluster_setup state string."""
+    def _fetch_status(self):
         req = self.cluster_setup(action='status')
+        if not isinstance(req, dict) or not (req.get('error') or
+                                             'state' in req):
+            raise CouchDiscHTTPError(
+                'error fetching cluster_setup status: %s resp: %s', self, req)
         if req.get('error'):
             state = 'auth_required'
         else:
             state = req['state']
+        metrics.CLUSTER_SETUP_STATE.set_state(
+            state, self.SETUP_STATES, host=self._args['host'])
         return state
 
+    @property
+    def status(self):
+        """Returns the cluster_setup state string.
+
+        The state is fetched once and reused until it's invalidated, which
+        happens automatically after this client changes the state.
+        """
+        if self._status is None:
+            self._status = self._fetch_status()
+        return self._status
+
+    def refresh(self):
+        """Fetches the cluster_setup state again and returns it.
+
+        Upgrades to the admin credentials first if the node has been enabled
+        since this client connected.
+        """
+        self._status = self._fetch_status()
+        if self._status == 'auth_required' and not self._secure:
+            self._upgrade_auth()
+            self._status = self._fetch_status()
+        return self._status
+
+    def invalidate(self):
+        """Forgets the cluster_setup state so the next read fetches it."""
+        self._status = None
+
     @property
     def disabled(self):
         """Returns True if status is `cluster_disabled`."""
@@ -198,9 +450,11 @@ class CouchInitClient:
 
     def __repr__(self):
         cls_name = self.__class__.__name__
-        servers = ['{}: {}'.format(k, v) for k, v in self._servers.items()]
+        servers = ['{}: {}'.format(k, v)
+                   for k, v in (self._servers or {}).items()]
         servers = ', '.join(servers)
-        attrs = 'status: {}, servers: {}'.format(self.status, servers)
+        status = self._status or util.UNRESOLVED
+        attrs = 'status: {}, servers: {}'.format(status, servers)
         return '{cls}({attrs})'.format(cls=cls_name, attrs=attrs)
 
     def __str__(self):
@@ -210,32 +464,62 @@ class CouchInitClient:
         server = self._server_for(key)
         return server[key]
 
-    def _setup_servers(self, auth=False):
-        servers = {}
+    def _setup_server(self, port, auth=False):
         args = self._args
-        for port in args['ports']:
-            this_auth = args['creds'] if auth else None
-            server = CouchServer(args['proto'], args['host'], port, this_auth)
-            servers[server.type] = server
-        return servers
+        this_auth = args['creds'] if auth else None
+        return CouchServer(
+            args['proto'], args['host'], port, this_auth, self._transport)
+
+    @property
+    def servers(self):
+        """Returns the CouchServer for each port by type, building them on
+        first use.
+
+        Only kept once the type of every server is known, until then their
+        types are detected again on every use.
+        """
+        if self._servers is None:
+            servers = {server.type: server
+                       for server in self._setup_servers().values()}
+            if None in servers:
+                return servers
+            self._servers = servers
+        return self._servers
+
+    def _setup_servers(self, auth=False):
+        """Returns the CouchServer for each port, building them once."""
+        if self._by_port is None:
+            self._by_port = {port: self._setup_server(port, auth)
+                             for port in self._args['ports']}
+        return self._by_port
+
+    def _server(self, key):
+        server = self.servers.get(key)
+        if server is None:
+            raise CouchDiscHTTPError(
+                'error detecting %s server of: %s', key, self)
+        return server
 
     def _server_for(self, db):
         if db in ADMIN_ONLY_DBS:
             key = 'admin'
         else:
             key = 'data'
-        return self._servers[key]
+        return self._server(key)
 
     def call(self, server, method, *args, **kwargs):
         """Call a bound method of the CouchServer object."""
-        server = self._servers.get(server)
+        server = self._server(server)
         bound_method = getattr(server, method)
         return bound_method(*args, **kwargs)
 
     def request(self, server='data', verb='get', uri=None, params=None,
                 data=None, headers=None, files=None):
-        """Wraps the `CouchServer.request`, dispatching by `server`."""
-        server = self._servers.get(server)
+        """Wraps the `CouchServer.request`, dispatching by `server`.
+
+        Raises `CouchDiscHTTPError` if the type of no server is `server`.
+        """
+        server = self._server(server)
         return server.request(verb, uri, params, data, headers, files)
 
     def _build_cluster_setup_payload(
@@ -278,6 +562,8 @@ class CouchInitClient:
         data = self._build_cluster_setup_payload(action, host, port, creds)
         req = self.request(
             server='data', verb=verb, uri='/_cluster_setup', data=data)
+        if verb == 'post':
+            self.invalidate()
         return req
 
     @staticmethod
@@ -293,39 +579,159 @@ class CouchInitClient:
         """Runs several tests and returns True if node passes."""
         host = node._args['host']
         if all([self.host_is_valid(host), node.up()]):
-            if not self._node_in_nodes('couchdb@{}'.format(host)):
+            if not self._node_in_nodes(self.node_name(host)):
                 return True
 
     def enable(self):
-        """Enables the current node."""
+        """Enables the current node, raising `CouchEnableError` unless
+        CouchDB answers ok.
+        """
         req = self.cluster_setup(action='enable')
-        if req.get('ok'):
-            self._upgrade_auth()
+        if not (isinstance(req, dict) and req.get('ok')):
+            raise CouchEnableError('error enabling: %s resp: %s', self, req)
+        self._upgrade_auth()
+        return req
 
     def add_node(self, remote):
         """Add's a new node to the current node."""
         if self._test_node(remote):
-            args = remote._args
-            req = self.cluster_setup(
-                'add', args['host'], args['ports'][0], args['creds'])
-            if req and isinstance(req, dict) and req.get('ok') is True:
-                return req
-            else:
-                raise CouchAddNodeError(
-                    'error adding node: %s resp: %s', remote, req)
+            return self._add_node(remote)
+
+    def _add_node(self, remote):
+        args = remote._args
+        req = self.cluster_setup(
+            'add', args['host'], args['ports'][0], args['creds'])
+        if req and isinstance(req, dict) and req.get('ok') is True:
+            return req
+        else:
+            raise CouchAddNodeError(
+                'error adding node: %s resp: %s', remote, req)
 
     def finish(self):
-        """Finish the cluster."""
-        return self.cluster_setup(action='finish')
+        """Finish the cluster, raising `CouchFinishError` unless CouchDB
+        answers ok.
+        """
+        req = self.cluster_setup(action='finish')
+        if not (isinstance(req, dict) and req.get('ok')):
+            raise CouchFinishError('error finishing: %s resp: %s', self, req)
+        return req
 
     def nodes(self):
-        """Get all nodes in the _nodes db of current node."""
-        return tuple([n for n in self['_nodes']])
+        """Get all nodes in the _nodes db of current node, or None if the
+        node couldn't be reached.
+        """
+        try:
+            rows = self['_nodes'].all_docs()
+        except CouchDiscHTTPError:
+            return None
+        return tuple(row['id'] for row in rows)
+
+    @staticmethod
+    def node_name(host):
+        """Returns the erlang node name used in `_nodes` for `host`."""
+        return 'couchdb@{}'.format(host)
 
     def _node_in_nodes(self, node):
         """Return True if `node` is in _nodes db of current node."""
-        nodes = self.nodes()
-        return node in nodes
+        try:
+            doc = self['_nodes'].get(node)
+        except CouchDiscHTTPError:
+            return False
+        return bool(doc) and doc.get('_id') == node
+
+    def remove_nodes(self, hosts):
+        """Deletes the documents of the nodes for `hosts` from the _nodes db
+        of current node with one `_all_docs` and one `_bulk_docs` request.
+
+        Returns a dict of host: bool for whether each node is gone, one that
+        wasn't there counts as removed.
+        """
+        names = {self.node_name(host): str(host) for host in hosts}
+        db = self['_nodes']
+        try:
+            rows = db.all_docs(keys=list(names))
+            docs = [dict(_id=row['id'], _rev=row['value']['rev'],
+                         _deleted=True)
+                    for row in rows
+                    if row.get('id') and not row['value'].get('deleted')]
+            results = db.bulk_docs(docs) if docs else []
+        except CouchDiscHTTPError as err:
+            raise CouchRemoveNodeError(
+                'error removing nodes: %s %s', sorted(names), err)
+        removed = dict.fromkeys(names.values(), True)
+        for result in results:
+            if result.get('error'):
+                removed[names[result['id']]] = False
+        return removed
+
+    def remove_node(self, host):
+        """Deletes the document of the node for `host` from the _nodes db of
+        current node, returning True once it's gone.
+        """
+        if not self.remove_nodes([host])[str(host)]:
+            raise CouchRemoveNodeError(
+                'error removing node: %s', self.node_name(host))
+        return True
+
+    def shard_maps(self, page_size=ALL_DBS_PAGE_SIZE):
+        """Returns a generator iterating tuples of (db, by_range) from the
+        shard map of every database in the _dbs db of current node, fetched
+        `page_size` documents at a time.
+
+        Raises `CouchDiscHTTPError` if a page can't be fetched rather than
+        ending early, as a missing shard map would look like a safe one.
+        """
+        params = dict(include_docs='true', limit=page_size)
+        while True:
+            page = self.request(
+                server='admin', uri='/_dbs/_all_docs', params=params)
+            if not isinstance(page, dict) or 'rows' not in page:
+                raise CouchDiscHTTPError(
+                    'error fetching shard maps: %s resp: %s', self, page)
+            rows = page['rows']
+            for row in rows:
+                if not row['id'].startswith('_design/'):
+                    yield row['id'], (row.get('doc') or {}).get('by_range', {})
+            if len(rows) < page_size:
+                return
+            params.update(start_key=json.dumps(rows[-1]['id']), skip=1)
+
+    def unsafe_shards(self, hosts):
+        """Returns a dict of db: ranges for every shard range that would have
+        no copy left on a member of _nodes once the nodes for `hosts` are
+        removed.
+        """
+        members = self.nodes()
+        if members is None:
+            raise CouchDiscHTTPError('error fetching nodes: %s', self)
+        remaining = set(members) - {self.node_name(host) for host in hosts}
+        unsafe = {}
+        for db, by_range in self.shard_maps():
+            ranges = [rng for rng, owners in by_range.items()
+                      if not remaining.intersection(owners)]
+            if ranges:
+                unsafe[db] = sorted(ranges)
+        return unsafe
+
+    def nodes_present(self, hosts):
+        """Returns a dict of host: bool for whether the node for each of
+        `hosts` is in the _nodes db of current node, using one request.
+        """
+        hosts = [str(host) for host in hosts]
+        try:
+            rows = self['_nodes'].all_docs(
+                keys=[self.node_name(h) for h in hosts])
+        except CouchDiscHTTPError:
+            rows = []
+        present = {row['key'] for row in rows
+                   if row.get('id') and not row['value'].get('deleted')}
+        return {h: self.node_name(h) in present for h in hosts}
+
+    def follow_changes(self, db, since='now', heartbeat=10):
+        """Streams the continuous `_changes` feed of `db` from `since`, with
+        a heartbeat every `heartbeat` seconds.  See `CouchServer.follow`.
+        """
+        return self[db].follow_changes(since, heartbeat)
 
     def membership(self):
         """Returns the results of the `/_membership` endpoint."""
@@ -333,25 +739,34 @@ class CouchInitClient:
 
     def up(self):
         """Returns if both CouchServer's return True for `s.up`"""
-        return all([s.up for s in self._servers.values()])
+        return all([s.up for s in self._setup_servers().values()])
 
 
 class CouchManager:
-    """Contains configuration data and topology of couch cluster."""
-    def __init__(self, env):
+    """Contains configuration data and topology of couch cluster.
+
+    Blocks until the local node is up unless `connect` is False, see
+    `CouchInitClient`.  The master's client is only built, and connected,
+    once it's used, as a node the master adds never has to.
+    """
+    def __init__(self, env, connect=True):
         self.env = env
         self.host = env.host
         self.ports = env.ports
         self.creds = env.creds
-        self.local = CouchInitClient(env, env.host, env.ports, env.creds)
-        if not self.is_master:
-            mhost = env.host.clone(master=True)
-            self.master = CouchInitClient(env, mhost, env.ports, env.creds)
+        self._connect = connect
+        self._master = None
+        self.local = CouchInitClient(
+            env, env.host, env.ports, env.creds, connect=False)
+        if connect:
+            self.local.connect(phase='wait_for_couch')
 
     def __repr__(self):
         clss = type(self).__name__
-        attrs = ['{}: {}'.format(a, getattr(self, a)) for a in
-                 ('status', 'is_master', 'ports', 'creds')]
+        status = self.local._status or util.UNRESOLVED
+        attrs = ['status: {}'.format(status)]
+        attrs.extend('{}: {}'.format(a, getattr(self, a)) for a in
+                     ('is_master', 'ports', 'creds'))
         attrs = ', '.join(attrs)
         return '{}({})'.format(clss, attrs)
 
@@ -380,6 +795,23 @@ class CouchManager:
         """Returns whether local node is the `master`."""
         return self.host.index == 0
 
+    @property
+    def master(self):
+        """Returns the client of the master node, building it on first use,
+        or None when the local node is the master.
+        """
+        if self._master is None and not self.is_master:
+            mhost = self.env.host.clone(master=True)
+            self._master = CouchInitClient(
+                self.env, mhost, self.ports, self.creds,
+                connect=self._connect)
+        return self._master
+
+    def refresh(self):
+        """Fetches the cluster_setup state of the local node again."""
+        return self.local.refresh()
+
+    @util.phase('enable')
     def enable(self):
         """Enable the local node but with error checking and logging."""
         if self.enabled:
@@ -390,16 +822,35 @@ class CouchManager:
             log.info('Enabling local: %s', self.local)
             return self.local.enable()
 
+    @util.phase('finish')
     def finish(self):
-        """Finish cluster but with error checking and logging."""
+        """Finish cluster but with error checking and logging, retrying until
+        the master reports it finished.
+        """
+        self.refresh()
         if self.disabled:
             log.warning("Can't finish cluster when disabled: %s", self.local)
+            return
         elif self.finished:
             log.warning('Cluster already finished: %s', self.local)
-        else:
-            log.info('Finishing cluster: %s', self.local)
-            return self.master.finish()
+            return
 
+        log.info('Finishing cluster: %s', self.local)
+        master = self.local if self.is_master else self.master
+
+        def master_finished():
+            try:
+                if not master.finished:
+                    master.finish()
+                return master.refresh() == 'cluster_finished'
+            except CouchDiscHTTPError as err:
+                log.warning('Failed finishing: %s', err)
+                master.invalidate()
+                return False
+
+        util.wait_until(master_finished, target='finished cluster')
+
+    @util.phase('wait_for_master')
     def wait_for_enabled_master(self):
         """Blocking wait until master is enabled.
 
@@ -409,17 +860,156 @@ class CouchManager:
         if self.is_master:
             log.warning("Can't wait for master when master: %s", self.local)
         else:
-            while not self.master.enabled:
-                log.info('Waiting for master: %s to be enabled', self.master)
-                time.sleep(5)
+            def master_enabled():
+                try:
+                    self.master.refresh()
+                except CouchDiscHTTPError as err:
+                    log.debug('Master unavailable: %s', err)
+                    return False
+                return self.master.enabled or self.master.finished
+
+            log.info('Waiting for master: %s to be enabled',
+                     self.host.clone(master=True))
+            util.wait_until(master_enabled, target='enabled master')
+
+    @util.phase('wait_for_membership')
+    def wait_for_membership(self, size, timeout=config.WAIT_TIMEOUT,
+                            subscribers=()):
+        """Blocking wait until the local node's membership has `size` nodes,
+        see `convergence.MembershipWaiter`.
+        """
+        waiter = convergence.MembershipWaiter(self.local, size, timeout)
+        for callback in subscribers:
+            waiter.subscribe(callback)
+        return waiter.wait()
+
+    def _add_peer(self, host, timeout=config.PEER_TIMEOUT):
+        """Waits for the peer at `host` to be up and enabled, then adds it to
+        the local node, returning a `JoinResult` that's only ok once the peer
+        is in the local node's _nodes.
+        """
+        start = util.clock.monotonic()
+        try:
+            peer = CouchInitClient(
+                self.env, host, self.ports, self.creds, connect=False)
+            peer.connect(timeout)
+
+            def peer_enabled():
+                return peer.refresh() in ('cluster_enabled',
+                                          'cluster_finished')
+
+            util.wait_until(
+                peer_enabled, target='enabled peer {}'.format(host),
+                timeout=timeout)
+            self.local.add_node(peer)
+            if not self.local._node_in_nodes(self.local.node_name(host)):
+                raise CouchAddNodeError('peer not in _nodes: %s', host)
+        except (CouchDiscGeneralError, requests.RequestException) as err:
+            log.warning('Failed adding peer: %s: %s', host, err)
+            return JoinResult(host, False, util.clock.monotonic() - start, err)
+        except Exception as err:
+            # a peer mid restart mustn't take the other joins down with it
+            log.exception('Unexpected error adding peer: %s', host)
+            return JoinResult(host, False, util.clock.monotonic() - start, err)
+        return JoinResult(host, True, util.clock.monotonic() - start, None)
+
+    def departed(self, hosts):
+        """Returns those of `hosts` that are pods of the local node's
+        statefulset with an ordinal beyond its cluster size, and that are no
+        longer ready in its endpoint.
+        """
+        ready = set(self.env.hosts)
+        size = self.env.cluster_size
+        departed = []
+        for host in hosts:
+            try:
+                khost = kube.KubeHostname(str(host))
+            except (InvalidKubeHostnameError, ValueError):
+                continue
+            same = ((khost.statefulset, khost.service, khost.namespace) ==
+                    (self.host.statefulset, self.host.service,
+                     self.host.namespace))
+            if same and khost.index >= size and str(host) not in ready:
+                departed.append(str(host))
+        return sorted(departed)
+
+    def remove_nodes(self, hosts, batch_size=config.SCALE_DOWN_BATCH):
+        """Removes the nodes for `hosts` from the local node's _nodes db,
+        `batch_size` at a time.
+
+        Before each batch, the shard maps are checked for ranges that would
+        be left without a copy on the remaining members, and the batch is
+        skipped if there are any.  Returns a dict of host: bool for
+        whether it was removed.
+        """
+        removed = {}
+        hosts = [str(host) for host in hosts]
+        for i in range(0, len(hosts), batch_size):
+            batch = hosts[i:i + batch_size]
+            unsafe = self.local.unsafe_shards(batch)
+            if unsafe:
+                log.warning(util.KeyValueMessage(
+                    'not removing nodes holding the only copy of shards',
+                    hosts=batch, dbs=sorted(unsafe)))
+                removed.update(dict.fromkeys(batch, False))
+                continue
+            log.info(util.KeyValueMessage('removing nodes', hosts=batch))
+            try:
+                removed.update(self.local.remove_nodes(batch))
+            except CouchRemoveNodeError as err:
+                log.warning('Failed removing nodes: %s', err)
+                removed.update(dict.fromkeys(batch, False))
+        return removed
+
+    def add_peers(self, hosts, workers=config.COORDINATOR_WORKERS):
+        """Adds every host in `hosts` to the local node using a pool of at most
+        `workers` threads.
+
+        Returns a dict of host: `JoinResult`, a host that was already a
+        member counts as added.
+        """
+        results = {}
+        if not hosts:
+            return results
+        with ThreadPoolExecutor(min(workers, len(hosts))) as pool:
+            futures = [pool.submit(tracing.bind(self._add_peer), host)
+                       for host in hosts]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.host] = result
+        return results
+
+    def _join_master(self, node):
+        """Adds `node` to master unless it's already in master's _nodes,
+        returning True once it is.
+        """
+        name = self.master.node_name(node)
+        if self.master._node_in_nodes(name):
+            return True
+        log.info(util.KeyValueMessage(
+            'adding node to master', node=node, master=self.master))
+        try:
+            self.master.add_node(node)
+        except CouchAddNodeError as err:
+            log.warning('Failed adding node: %s', err)
+        return self.master._node_in_nodes(name)
 
     def add_to_master(self, node=None):
-        """Add the local node to master with error checking and logging."""
+        """Add the local node to master with error checking and logging.
+
+        Idempotent, retrying with backoff until the node shows up in the
+        master's _nodes, so it's safe for every pod to do at once.
+        """
         if not node:
             node = self.local
         if self.is_master:
             log.warning("Can't add self to self, master: %s", self.master)
         else:
             self.wait_for_enabled_master()
-            log.info('Adding: %s to master: %s', node, self.master)
-            return self.master.add_node(node)
+            self._add_to_enabled_master(node)
+
+    @util.phase('add')
+    def _add_to_enabled_master(self, node):
+        util.wait_until(
+            lambda: self._join_master(node),
+            target='{} joined to master'.format(node))
@@ -8,13 +8,102 @@ This module contains functions that exist as entrypoints into the package.
 :license: Apache2.
 """
 
-from . import config, manage
+import argparse
+import signal
+import subprocess
+import sys
 
+from . import config, hooks, manage, metrics, tracing, util
 
-def main():
+
+def _seconds(value):
+    return '{:.3f}s'.format(value) if value is not None else None
+
+
+def import_times(module='couchdiscover', top=5):
+    """Imports `module` in a fresh interpreter with `-X importtime`.
+
+    Returns a tuple of the seconds the import took and the `top` modules
+    that took longest by their own time, as (name, seconds).
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    total, modules = None, []
+    for line in proc.stderr.splitlines():
+        fields = line.partition('import time:')[2].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        if name == module:
+            total = int(fields[1]) / 1e6
+        modules.append((name, int(fields[0]) / 1e6))
+    modules.sort(key=lambda m: m[1], reverse=True)
+    return total, modules[:top]
+
+
+def profile_startup(out=sys.stdout):
+    """Reports how long importing couchdiscover takes and how long after
+    starting the first request is sent, then returns without bootstrapping
+    or waiting for CouchDB.
+    """
+    started = util.clock.monotonic()
+    first = {}
+
+    def on_request(event):
+        if not first:
+            first.update(sent=util.clock.monotonic(), event=event)
+
+    error = None
+    hooks.HOOKS.register(pre=on_request)
+    try:
+        manage.ClusterManager(
+            env=config.ENVIRONMENT, engine='sync', connect=False)
+    except Exception as err:
+        error = repr(err)
+    finally:
+        hooks.HOOKS.unregister(pre=on_request)
+    ready = util.clock.monotonic() - started
+    total, slowest = import_times()
+    fields = dict(import_time=_seconds(total), ready_after=_seconds(ready))
+    if first:
+        event = first['event']
+        fields.update(
+            first_request='{} {}'.format(event.method, event.url),
+            first_request_after=_seconds(first['sent'] - started),
+            first_request_latency=_seconds(event.latency))
+    if error:
+        fields['error'] = error
+    out.write('{}\n'.format(util.KeyValueMessage('startup', **fields)))
+    for name, seconds in slowest:
+        out.write('{}\n'.format(util.KeyValueMessage(
+            'slow import', module=name, self_time=_seconds(seconds))))
+    return 1 if error else 0
+
+
+def main(argv=None):
     """main
 
     Main entrypoint executed by bin stub: `couchdiscover`.
     """
-    man = manage.ClusterManager(env=config.ENVIRONMENT)
-    return man.run()
+    parser = argparse.ArgumentParser(
+        prog='couchdiscover',
+        description='Autodiscovery & Clustering for CouchDB 2.0 with '
+                    'Kubernetes')
+    parser.add_argument(
+        '--profile-startup', action='store_true',
+        help='report import time and time to first request, then exit')
+    args = parser.parse_args(argv)
+    if args.profile_startup:
+        return profile_startup()
+    if config.TRACE_OUTPUT:
+        tracing.configure(config.TRACE_OUTPUT)
+    if config.REQUEST_RECORDER_SIZE:
+        hooks.RECORDER.dump_on_signal(signal.SIGUSR1)
+    if config.METRICS_PORT:
+        metrics.serve(config.METRICS_PORT)
+    with tracing.span('boot'):
+        man = manage.ClusterManager(env=config.ENVIRONMENT)
+        man.run_bootstrap()
+    return man.run_forever()
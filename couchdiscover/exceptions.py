@@ -121,10 +121,22 @@ class CouchDiscHTTPError(CouchDiscGeneralError):
         return extra
 
 
+class CouchEnableError(CouchDiscHTTPError):
+    """Error enabling a node."""
+
+
+class CouchFinishError(CouchDiscHTTPError):
+    """Error finishing the cluster."""
+
+
 class CouchAddNodeError(CouchDiscHTTPError):
     """Error adding node to master."""
 
 
+class CouchRemoveNodeError(CouchDiscHTTPError):
+    """Error removing node from _nodes."""
+
+
 class InvalidKubeHostnameError(CouchDiscGeneralError):
     """Invalid kubernetes hostname
 
@@ -141,3 +153,18 @@ class InvalidKubeHostnameError(CouchDiscGeneralError):
 
     _msg = ("The Hostname: {host} doesn't match the signature of a kubernetes"
             " statefulset hostname.")
+
+
+class WaitTimeoutError(CouchDiscGeneralError):
+    """Timed out waiting
+
+    Raised by `util.wait_until` when its timeout passes before the condition
+    it's waiting for is met.
+
+    Example:
+    >>> raise WaitTimeoutError(target='master', elapsed=30.0, attempts=9)
+    WaitTimeoutError: Timed out after 30.0s and 9 attempts waiting for: master
+    """
+
+    _msg = ("Timed out after {elapsed:.1f}s and {attempts} attempts waiting "
+            "for: {target}")
@@ -0,0 +1,211 @@
+"""
+couchdiscover.hooks
+~~~~~~~~~~~~~~~~~~~
+
+This module contains the hooks every HTTP request to CouchDB and the
+kubernetes api passes through, and a ring buffer recording the most recent
+requests.
+
+Pre-request hooks are called with a `RequestEvent` before the request is
+sent and post-request hooks with the same event once it's finished, by then
+holding its latency, bytes in and out, status and exception.  Metrics and
+tracing are implemented as hooks registered on `HOOKS`, anything else
+profiling or exporting requests can register its own.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import collections
+import contextlib
+import json
+import logging
+import signal
+import sys
+import threading
+import time
+
+from . import config, metrics, tracing, util
+
+
+log = logging.getLogger(__name__)
+
+
+def body_size(data):
+    """Returns the size in bytes of a request body, or None when unknown."""
+    if data is None:
+        return 0
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+
+
+class RequestEvent(util.ReprMixin):
+    """A single request from `source`, either 'couch' or 'kube'.
+
+    `url` is templated, eg: '/_nodes/{id}', so events for the same endpoint
+    compare equal.  `attributes` holds details specific to the source and
+    `state` is scratch space for hooks to pass data from pre to post.
+    """
+    _public_attrs = ('source', 'method', 'url', 'status', 'latency')
+
+    def __init__(self, source, method, url, bytes_out=0, **attributes):
+        self.source = source
+        self.method = method
+        self.url = url
+        self.attributes = attributes
+        self.bytes_out = bytes_out
+        self.bytes_in = None
+        self.status = None
+        self.exception = None
+        self.timestamp = None
+        self.latency = None
+        self.state = {}
+
+    def to_dict(self):
+        """Returns the event as a dict ready to be serialized."""
+        return dict(
+            source=self.source, method=self.method, url=self.url,
+            attributes=self.attributes, bytes_out=self.bytes_out,
+            bytes_in=self.bytes_in, status=self.status,
+            exception=(repr(self.exception) if self.exception is not None
+                       else None),
+            timestamp=self.timestamp, latency=self.latency)
+
+
+class RequestHooks:
+    """The pre and post-request hooks, called in the order registered.
+
+    A hook raising is logged and otherwise ignored, so it can't fail the
+    request.
+    """
+
+    def __init__(self):
+        self.pre = []
+        self.post = []
+
+    def register(self, pre=None, post=None):
+        """Adds a `pre` and/or `post` request hook."""
+        if pre is not None:
+            self.pre.append(pre)
+        if post is not None:
+            self.post.append(post)
+
+    def unregister(self, pre=None, post=None):
+        """Removes a `pre` and/or `post` request hook."""
+        if pre in self.pre:
+            self.pre.remove(pre)
+        if post in self.post:
+            self.post.remove(post)
+
+    @staticmethod
+    def _call(hook, event):
+        try:
+            hook(event)
+        except Exception as err:
+            log.warning('Request hook: %r failed: %s', hook, err)
+
+    @contextlib.contextmanager
+    def request(self, event):
+        """Runs the hooks around the request made within the block, timing
+        it and recording the exception it raises, if any.
+        """
+        for hook in list(self.pre):
+            self._call(hook, event)
+        event.timestamp = time.time()
+        start = util.clock.monotonic()
+        try:
+            yield event
+        except Exception as err:
+            event.exception = err
+            raise
+        finally:
+            event.latency = util.clock.monotonic() - start
+            for hook in list(self.post):
+                self._call(hook, event)
+
+
+class RequestRecorder:
+    """A post-request hook keeping the last `size` requests in a ring buffer
+    to be dumped on demand.
+    """
+
+    def __init__(self, size=config.REQUEST_RECORDER_SIZE):
+        self._events = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self._events.append(event.to_dict())
+
+    def __len__(self):
+        return len(self._events)
+
+    def records(self):
+        """Returns the recorded requests as dicts, oldest first."""
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        """Forgets every recorded request."""
+        with self._lock:
+            self._events.clear()
+
+    def dump(self, stream=None):
+        """Writes the recorded requests to `stream`, stderr by default, as
+        lines of JSON.
+        """
+        stream = stream or sys.stderr
+        for record in self.records():
+            stream.write(json.dumps(record, default=str, sort_keys=True))
+            stream.write('\n')
+        stream.flush()
+
+    def dump_on_signal(self, signum):
+        """Dumps the recorded requests to stderr whenever the process gets
+        signal `signum`, must be called from the main thread.
+        """
+        signal.signal(signum, lambda *args: self.dump())
+
+
+def observe_metrics(event):
+    """Post-request hook recording the request's latency."""
+    status = event.status if event.status is not None else 'error'
+    if event.source == 'couch':
+        metrics.COUCH_REQUEST_DURATION.observe(
+            event.latency, method=event.method, uri=event.url, status=status)
+    elif event.source == 'kube':
+        metrics.KUBE_REQUEST_DURATION.observe(
+            event.latency, kind=event.attributes.get('kind'),
+            verb=event.attributes.get('verb'), code=status)
+
+
+def start_span(event):
+    """Pre-request hook starting a span for the request."""
+    if not tracing.TRACER.enabled:
+        return
+    span = tracing.span('{}.request'.format(event.source), method=event.method,
+                        url=event.url, **event.attributes)
+    event.state['span'] = span.__enter__()
+
+
+def end_span(event):
+    """Post-request hook finishing the request's span."""
+    span = event.state.pop('span', None)
+    if span is None:
+        return
+    span.set_attributes(status=event.status, bytes_in=event.bytes_in,
+                        bytes_out=event.bytes_out)
+    if event.exception is not None:
+        span.set_error(event.exception)
+    span.__exit__(None, None, None)
+
+
+HOOKS = RequestHooks()
+RECORDER = RequestRecorder()
+
+HOOKS.register(pre=start_span, post=end_span)
+HOOKS.register(post=observe_metrics)
+if config.REQUEST_RECORDER_SIZE:
+    HOOKS.register(post=RECORDER)
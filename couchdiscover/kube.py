@@ -10,11 +10,23 @@ working with the kubernetes api as higher level objects.
 """
 
 import base64
+import collections
+import collections.abc
+import functools
+import json
+import logging
+import threading
+
+from . import config, hooks, util
+from .exceptions import InvalidKubeHostnameError
 
-import pykube
 
-from . import config, util
-from .exceptions import InvalidKubeHostnameError
+pykube = util.LazyModule('pykube')
+requests = util.LazyModule('requests')
+
+# seconds before the apiserver closes a watch, which is then resumed
+WATCH_TIMEOUT = 300
+log = logging.getLogger(__name__)
 
 
 class KubeHostname:
@@ -106,24 +118,72 @@ class KubeHostname:
         passing an index.
         """
         new = type(self)(self.fqdn)
-        if index:
+        if index is not None:
             new.index = index
         if master:
             new.index = 0
         return new
 
 
+class EnvironmentSnapshot(collections.namedtuple(
+        'EnvironmentSnapshot',
+        ('hosts', 'ports', 'creds', 'cluster_size', 'timestamp'))):
+    """An immutable snapshot of the information resolved from kubernetes.
+
+    Created by `KubeInterface.refresh`, `timestamp` holds the monotonic time
+    the snapshot was resolved at.
+    """
+    __slots__ = ()
+
+    @property
+    def age(self):
+        """Returns the age of the snapshot in seconds."""
+        return util.clock.monotonic() - self.timestamp
+
+
+@functools.lru_cache(maxsize=None)
+def lease_resource():
+    """Returns the pykube object type of a `coordination.k8s.io/v1` Lease,
+    which pykube doesn't have, defined on first use as pykube is only
+    imported then.
+    """
+    class Lease(pykube.objects.NamespacedAPIObject):
+        version = 'coordination.k8s.io/v1'
+        endpoint = 'leases'
+        kind = 'Lease'
+
+    return Lease
+
+
 class KubeAPIClient:
     """Contains the lower level functions for manipulating and retrieving
     objects from the kubernetes api.
+
+    The pykube `HTTPClient` is built on first use.
     """
-    def __init__(self, env=None, namespace=None):
+    def __init__(self, env=None, namespace=None,
+                 cache_ttl=config.KUBE_CACHE_TTL):
         self.env = env
         self.namespace = namespace
-        self.api = self._get_api()
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._api = None
+        self._api_lock = threading.Lock()
+
+    @property
+    def api(self):
+        """Returns the pykube `HTTPClient`, building it on first use."""
+        if self._api is None:
+            with self._api_lock:
+                if self._api is None:
+                    self._api = self._get_api()
+        return self._api
 
     def _get_api(self):
-        if self.env == 'dev':
+        if config.KUBE_API_URL:
+            api = pykube.http.HTTPClient(
+                pykube.KubeConfig.from_url(config.KUBE_API_URL))
+        elif self.env == 'dev':
             api = pykube.http.HTTPClient(
                 pykube.KubeConfig.from_file(config.DEV_KUBECONFIG_PATH))
         else:
@@ -131,59 +191,227 @@ class KubeAPIClient:
                 pykube.KubeConfig.from_service_account())
         return api
 
+    def _request(self, resource, verb, method='GET', **kwargs):
+        """Sends a request for objects of type `resource` through the request
+        hooks, `verb` being one of 'get', 'list', 'watch', 'create' or
+        'replace'.
+
+        The body of a watch is streamed, so its bytes in aren't known.
+        """
+        url = kwargs.get('url', '')
+        if verb in ('get', 'replace'):
+            url = '{}/{{name}}'.format(resource.endpoint)
+        event = hooks.RequestEvent(
+            'kube', method, url, hooks.body_size(kwargs.get('data')),
+            kind=resource.kind, verb=verb)
+        with hooks.HOOKS.request(event):
+            resp = self.api.request(
+                method, version=resource.version, **kwargs)
+            event.status = resp.status_code
+            if not kwargs.get('stream'):
+                event.bytes_in = len(resp.content)
+            return resp
+
     def _get_api_object(self, resource, name=None, selector=None,
-                        namespace=None):
+                        namespace=None, fresh=False):
         if not namespace:
             namespace = self.namespace
         if not issubclass(resource, pykube.objects.APIObject):
             raise pykube.PyKubeError('No object by type: %s', resource)
-        req = pykube.query.Query(
-            self.api, resource, namespace=namespace)
+        if not (name or selector):
+            raise ValueError('No name or selector for: {}'.format(
+                resource.kind))
+        if name and not selector:
+            return self._get_named_object(resource, name, namespace, fresh)
+        params = {'labelSelector': pykube.query.as_selector(selector)}
         if name:
-            req = req.get_by_name(name)
-        if selector:
-            req = req.filter(selector=selector)
-        if req.exists:
-            return req.obj
+            params['fieldSelector'] = 'metadata.name={}'.format(name)
+        resp = self._request(
+            resource, 'list', url=resource.endpoint, namespace=namespace,
+            params=params)
+        self.api.raise_for_status(resp)
+        items = resp.json().get('items')
+        if items:
+            return items[0]
+
+    def _get_named_object(self, resource, name, namespace, fresh=False):
+        """Fetches a single object with one GET, caching it by (kind,
+        namespace, name) for `cache_ttl` seconds, or always with `fresh`.
+
+        A 404 evicts the object and returns None, while a failed request
+        falls back to the cached object if there is one.
+        """
+        key = (resource.kind, namespace, name)
+        cached, fetched = self._cache.get(key, (None, 0))
+        if (cached is not None and not fresh and
+                util.clock.monotonic() - fetched < self.cache_ttl):
+            return cached
+        try:
+            resp = self._request(
+                resource, 'get', url='{}/{}'.format(resource.endpoint, name),
+                namespace=namespace)
+        except requests.RequestException as err:
+            if cached is None:
+                raise
+            log.warning('Using cached %s: %s, request failed: %s',
+                        resource.kind, name, err)
+            return cached
+        if resp.status_code == 404:
+            self._cache.pop(key, None)
+            return None
+        self.api.raise_for_status(resp)
+        obj = resp.json()
+        self._cache[key] = (obj, util.clock.monotonic())
+        return obj
+
+    def _write_api_object(self, resource, verb, obj, namespace=None):
+        """Creates or replaces `obj`, caching and returning the object as
+        stored by the apiserver, or None when it answers 409 Conflict.
+        """
+        namespace = namespace or self.namespace
+        name = obj['metadata']['name']
+        if verb == 'create':
+            method, url = 'POST', resource.endpoint
+        else:
+            method, url = 'PUT', '{}/{}'.format(resource.endpoint, name)
+        resp = self._request(
+            resource, verb, method, url=url, namespace=namespace,
+            data=json.dumps(obj),
+            headers={'Content-Type': 'application/json'})
+        key = (resource.kind, namespace, name)
+        if resp.status_code == 409:
+            self._cache.pop(key, None)
+            return None
+        self.api.raise_for_status(resp)
+        obj = resp.json()
+        self._cache[key] = (obj, util.clock.monotonic())
+        return obj
+
+    def create_api_object(self, resource, obj, namespace=None):
+        """Creates `obj` of type `resource`, returning it as stored, or None
+        if an object by that name already exists.
+        """
+        return self._write_api_object(resource, 'create', obj, namespace)
+
+    def replace_api_object(self, resource, obj, namespace=None):
+        """Replaces `obj` of type `resource` as long as its
+        `metadata.resourceVersion` is still the current one, returning it as
+        stored.
+
+        Returns None when the object changed in between, in which case it
+        has to be read again and the change retried.
+        """
+        return self._write_api_object(resource, 'replace', obj, namespace)
 
-    def get_pod(self, name=None, selector=None, namespace=None):
+    def clear_cache(self):
+        """Forgets every cached object."""
+        self._cache.clear()
+
+    def close(self):
+        """Forgets every cached object and closes the pykube client's
+        connections, it's built again on next use.
+        """
+        self.clear_cache()
+        with self._api_lock:
+            api, self._api = self._api, None
+        if api is not None:
+            api.session.close()
+
+    def list_api_objects(self, resource, name=None, namespace=None):
+        """Lists objects of type `resource`, optionally only those named
+        `name`.
+
+        Returns a tuple of the items and the list's resourceVersion, the
+        latter being the point to start watching from.
+        """
+        params = {}
+        if name:
+            params['fieldSelector'] = 'metadata.name={}'.format(name)
+        resp = self._request(
+            resource, 'list', url=resource.endpoint,
+            namespace=namespace or self.namespace, params=params)
+        self.api.raise_for_status(resp)
+        obj = resp.json()
+        return obj.get('items') or [], obj['metadata']['resourceVersion']
+
+    def watch_api_objects(self, resource, name=None, since=None,
+                          namespace=None, timeout=WATCH_TIMEOUT):
+        """Streams watch events for objects of type `resource` as tuples of
+        (event type, object), starting after resourceVersion `since`.
+
+        The stream ends when the apiserver closes the watch after `timeout`
+        seconds.
+        """
+        params = {'watch': 'true', 'timeoutSeconds': timeout}
+        if name:
+            params['fieldSelector'] = 'metadata.name={}'.format(name)
+        if since:
+            params['resourceVersion'] = since
+        resp = self._request(
+            resource, 'watch', url=resource.endpoint,
+            namespace=namespace or self.namespace, params=params, stream=True)
+        try:
+            self.api.raise_for_status(resp)
+            for line in resp.iter_lines():
+                if line:
+                    event = json.loads(line.decode('utf-8'))
+                    yield event['type'], event['object']
+        finally:
+            resp.close()
+
+    def get_pod(self, name=None, selector=None, namespace=None,
+                fresh=False):
         """Get's pod by name or/or selector."""
-        return self._get_api_object(pykube.Pod, name, selector, namespace)
+        return self._get_api_object(
+            pykube.Pod, name, selector, namespace, fresh)
 
-    def get_service(self, name=None, selector=None, namespace=None):
+    def get_service(self, name=None, selector=None, namespace=None,
+                    fresh=False):
         """Get's service by name or/or selector."""
-        return self._get_api_object(pykube.Service, name, selector, namespace)
+        return self._get_api_object(
+            pykube.Service, name, selector, namespace, fresh)
 
-    def get_endpoint(self, name=None, selector=None, namespace=None):
+    def get_endpoint(self, name=None, selector=None, namespace=None,
+                     fresh=False):
         """Get's endpoint by name or/or selector."""
-        return self._get_api_object(pykube.Endpoint, name, selector, namespace)
+        return self._get_api_object(
+            pykube.Endpoint, name, selector, namespace, fresh)
 
-    def get_statefulset(self, name=None, selector=None, namespace=None):
+    def get_statefulset(self, name=None, selector=None, namespace=None,
+                        fresh=False):
         """Get's statefulset by name or/or selector."""
         return self._get_api_object(
-            pykube.StatefulSet, name, selector, namespace)
+            pykube.StatefulSet, name, selector, namespace, fresh)
 
-    def get_secret(self, name=None, key=None, selector=None, namespace=None):
+    def get_secret(self, name=None, key=None, selector=None, namespace=None,
+                   fresh=False):
         """Get's secret by name or/or selector."""
-        sec = self._get_api_object(pykube.Secret, name, selector, namespace)
-        if key:
+        sec = self._get_api_object(
+            pykube.Secret, name, selector, namespace, fresh)
+        if sec and key:
             sec = self._get_key_decoded(sec, key)
         return sec
 
+    def get_lease(self, name=None, selector=None, namespace=None,
+                  fresh=False):
+        """Get's lease by name or/or selector."""
+        return self._get_api_object(
+            lease_resource(), name, selector, namespace, fresh)
+
     def get_configmap(self, name=None, key=None, selector=None,
-                      namespace=None):
+                      namespace=None, fresh=False):
         """Get's configmap by name or/or selector."""
-        cm = self._get_api_object(pykube.ConfigMap, name, selector, namespace)
-        if key:
-            cm = cm['data'].get(key)
+        cm = self._get_api_object(
+            pykube.ConfigMap, name, selector, namespace, fresh)
+        if cm and key:
+            cm = cm.get('data', {}).get(key)
         return cm
 
     @staticmethod
     def _get_key_decoded(obj, key):
-        val = obj['data'].get(key)
+        val = obj.get('data', {}).get(key)
         if val:
-            obj = base64.b64decode(val).decode()
-        return obj
+            return base64.b64decode(val).decode()
 
     @staticmethod
     def _get_container(statefulset=None, container=None):
@@ -198,7 +426,61 @@ class KubeAPIClient:
 
     @staticmethod
     def _key_container_env(container):
-        return {item['name']: item for item in container['env']}
+        return {item['name']: item for item in container.get('env', [])}
+
+    def get_environment(self, statefulset, container, fresh=False):
+        """Get's the environment for a container of a statefulset.
+
+        Environment returned is a `LazyEnvironment` key'd by environment
+        variable name, and who's values are resolved when first read in the
+        case of externally referenced configmaps and secrets.  `statefulset`
+        can be either the name of a statefulset or an already fetched
+        statefulset object.  With `fresh`, nothing is read from the object
+        cache.
+        """
+        if isinstance(statefulset, str):
+            statefulset = self.get_statefulset(statefulset, fresh=fresh)
+        cont = self._get_container(statefulset, container)
+        env = self._key_container_env(cont)
+        return LazyEnvironment(self, env, fresh)
+
+
+class LazyEnvironment(collections.abc.Mapping):
+    """A read only mapping of a container's environment, who's values are
+    only resolved when read.
+
+    Secrets and configmaps are fetched at most once per mapping, no matter
+    how many variables reference keys in them.
+    """
+
+    def __init__(self, api, env, fresh=False):
+        self._api = api
+        self._env = env
+        self._fresh = fresh
+        self._values = {}
+        self._refs = {}
+
+    def __repr__(self):
+        clss = type(self).__name__
+        return '{}(keys: {}, resolved: {})'.format(
+            clss, sorted(self._env), sorted(self._values))
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values[key] = self._lookup_env_value(self._env[key])
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._env)
+
+    def __len__(self):
+        return len(self._env)
+
+    def _get_ref(self, getter, name):
+        key = (getter.__name__, name)
+        if key not in self._refs:
+            self._refs[key] = getter(name=name, fresh=self._fresh)
+        return self._refs[key]
 
     def _lookup_env_value(self, env):
         if env.get('value'):
@@ -210,32 +492,186 @@ class KubeAPIClient:
                 return ''
             elif v_from.get('secretKeyRef'):
                 ref = v_from.get('secretKeyRef')
-                return self.get_secret(name=ref['name'], key=ref['key'])
+                sec = self._get_ref(self._api.get_secret, ref['name'])
+                if sec:
+                    return self._api._get_key_decoded(sec, ref['key'])
             elif v_from.get('configMapKeyRef'):
                 ref = v_from.get('configMapKeyRef')
-                return self.get_configmap(name=ref['name'], key=ref['key'])
+                cm = self._get_ref(self._api.get_configmap, ref['name'])
+                if cm:
+                    return cm.get('data', {}).get(ref['key'])
 
-    def get_environment(self, statefulset, container):
-        """Get's the environment for a container of a statefulset.
 
-        Environment returned is a dictionary key'd by environment variable
-        name, and who's value has been resolved in the case of externally
-        referenced configmaps and secrets.
+class Informer:
+    """Keeps a local, in memory store of kubernetes objects up to date.
+
+    Does one list of the objects, then streams watch events into the store
+    from the list's resourceVersion onwards, relisting only when the
+    apiserver reports the resourceVersion as expired.  Reads from the store
+    never touch the network.  Callables registered with `subscribe` are
+    called with the event type and object for every change applied.
+
+    Example:
+    >>> informer = Informer(api, pykube.Endpoint, name='couchdb')
+    >>> informer.start()
+    >>> informer.wait_for_sync(timeout=10)
+    >>> informer.get('couchdb')
+    """
+    retry_delay = 5
+
+    def __init__(self, api, resource, name=None, namespace=None):
+        self.api = api
+        self.resource = resource
+        self.name = name
+        self.namespace = namespace
+        self.resource_version = None
+        self._store = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        clss = type(self).__name__
+        return '{}({}, name: {}, resource_version: {})'.format(
+            clss, self.resource.kind, self.name, self.resource_version)
+
+    @property
+    def synced(self):
+        """Returns True once the initial list has been stored."""
+        return self._synced.is_set()
+
+    @property
+    def running(self):
+        """Returns True while the watch thread is alive."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def get(self, name=None):
+        """Returns the stored object named `name`, or None."""
+        with self._lock:
+            return self._store.get(name or self.name)
+
+    def items(self):
+        """Returns a list of all stored objects."""
+        with self._lock:
+            return list(self._store.values())
+
+    def subscribe(self, callback):
+        """Registers `callback(event_type, obj)` to be called on changes."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Removes a callback added by `subscribe`."""
+        self._subscribers.remove(callback)
+
+    def start(self):
+        """Starts the watch in a daemon thread."""
+        if not self.running:
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=repr(self), daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the watch once the current stream returns."""
+        self._stopped.set()
+
+    def wait_for_sync(self, timeout=None):
+        """Blocks until the initial list has been stored or `timeout`."""
+        return util.clock.wait(self._synced, timeout)
+
+    def _notify(self, event_type, obj):
+        for callback in list(self._subscribers):
+            try:
+                callback(event_type, obj)
+            except Exception:
+                log.exception('Error in subscriber: %s', callback)
+
+    def _apply(self, event_type, obj):
+        name = obj['metadata']['name']
+        with self._lock:
+            if event_type == 'DELETED':
+                self._store.pop(name, None)
+            else:
+                self._store[name] = obj
+            self.resource_version = obj['metadata']['resourceVersion']
+        self._notify(event_type, obj)
+
+    def _relist(self):
+        items, version = self.api.list_api_objects(
+            self.resource, self.name, self.namespace)
+        store = {obj['metadata']['name']: obj for obj in items}
+        with self._lock:
+            self._store, old = store, self._store
+            self.resource_version = version
+        self._synced.set()
+        for name in old.keys() - store.keys():
+            self._notify('DELETED', old[name])
+        for name, obj in store.items():
+            if old.get(name) != obj:
+                self._notify('MODIFIED' if name in old else 'ADDED', obj)
+
+    def _watch(self):
+        events = self.api.watch_api_objects(
+            self.resource, self.name, self.resource_version, self.namespace)
+        for event_type, obj in events:
+            if self._stopped.is_set():
+                break
+            if event_type == 'ERROR':
+                # 410 Gone: our resourceVersion is too old to resume from
+                if obj.get('code') == 410:
+                    self.resource_version = None
+                else:
+                    log.warning('Watch error: %s, retrying in %ss',
+                                obj.get('message'), self.retry_delay)
+                    util.clock.wait(self._stopped, self.retry_delay)
+                break
+            self._apply(event_type, obj)
+
+    def _run(self):
+        """Lists and watches until stopped, backing off on errors.
+
+        An unexpected error leaves the store in doubt, so it's no longer
+        reported as synced, sending readers to the api, until relisted.
         """
-        statefulset = self.get_statefulset(statefulset)
-        cont = self._get_container(statefulset, container)
-        env = self._key_container_env(cont)
-        return {k: self._lookup_env_value(v) for k, v in env.items()}
+        while not self._stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self._relist()
+                self._watch()
+            except (requests.RequestException, pykube.PyKubeError,
+                    ValueError) as err:
+                log.warning('%s failed: %s, retrying in %ss',
+                            self, err, self.retry_delay)
+                util.clock.wait(self._stopped, self.retry_delay)
+            except Exception:
+                log.exception('Unexpected error in %s, relisting in %ss',
+                              self, self.retry_delay)
+                self._synced.clear()
+                self.resource_version = None
+                util.clock.wait(self._stopped, self.retry_delay)
 
 
 class KubeInterface(util.ReprMixin):
     """This class exposes the information we need from kubernetes as lazy
-    evaluated properties, caching provided by pykube.
+    evaluated properties.
+
+    Everything is resolved at once into an immutable `EnvironmentSnapshot`
+    which is reused until it's older than `ttl` seconds or `refresh` is
+    called explicitly.  A `ttl` of None keeps the snapshot forever.
+
+    Once `watch` is called, `hosts` and `ports` are read from an `Informer`
+    watching the service's endpoint instead.
     """
     _public_attrs = ('hosts', 'ports', 'creds', 'cluster_size')
 
-    def __init__(self, host, env=None):
+    def __init__(self, host, env=None, ttl=config.SNAPSHOT_TTL):
         self._host = host
+        self._snapshot = None
+        self.ttl = ttl
+        self.informer = None
         self.api = KubeAPIClient(env=env, namespace=self._host.namespace)
 
     def _fqdn_from_node(self, node):
@@ -243,33 +679,180 @@ class KubeInterface(util.ReprMixin):
         host.node = node
         return str(host)
 
+    @staticmethod
+    def _subsets(endpoint):
+        # an endpoint without pods has no subsets at all
+        return (endpoint or {}).get('subsets') or ()
+
+    def _get_hosts(self, endpoint):
+        hosts = [self._fqdn_from_node(address['hostname'])
+                 for subset in self._subsets(endpoint)
+                 for address in subset.get('addresses') or ()]
+        return tuple(sorted(hosts))
+
+    @classmethod
+    def _get_ports(cls, endpoint):
+        """Returns the ports of the first subset listing them, which those
+        of pods that aren't ready do too, or None if there isn't one.
+        """
+        for subset in cls._subsets(endpoint):
+            if subset.get('ports'):
+                return tuple(sorted(port['port'] for port in subset['ports']))
+
+    def _wait_for_ports(self):
+        service = self._host.service
+
+        def endpoint_ports():
+            return self._get_ports(
+                self.api.get_endpoint(service, fresh=True))
+
+        log.info('Waiting for the endpoint of: %s to list ports', service)
+        return util.wait_until(
+            endpoint_ports, target='{} ports'.format(service)).value
+
+    @staticmethod
+    def _get_creds(env):
+        user = env.get('COUCHDB_ADMIN_USER') or config.DEFAULT_CREDS[0]
+        password = env.get('COUCHDB_ADMIN_PASS') or config.DEFAULT_CREDS[1]
+        return (user, password)
+
+    @staticmethod
+    def _get_cluster_size(statefulset, env):
+        size = env.get('COUCHDB_CLUSTER_SIZE')
+        if not size:
+            size = statefulset['spec']['replicas']
+        return int(size)
+
+    def refresh(self):
+        """Resolves and returns a new `EnvironmentSnapshot`.
+
+        This bypasses the api client's object cache, costing one request for
+        the endpoint, one for the statefulset and one for every secret or
+        configmap referenced by the environment.  While the endpoint has no
+        pods, the ports of the last snapshot are kept, or waited for without
+        one.
+        """
+        statefulset = self._host.statefulset
+        endp = self.api.get_endpoint(self._host.service, fresh=True)
+        ports = self._get_ports(endp)
+        if ports is None:
+            last = self._snapshot
+            ports = last.ports if last else self._wait_for_ports()
+        ss = self.api.get_statefulset(statefulset, fresh=True)
+        env = self.api.get_environment(ss, statefulset, fresh=True)
+        self._snapshot = EnvironmentSnapshot(
+            hosts=self._get_hosts(endp),
+            ports=ports,
+            creds=self._get_creds(env),
+            cluster_size=self._get_cluster_size(ss, env),
+            timestamp=util.clock.monotonic()
+        )
+        return self._snapshot
+
+    def refresh_hosts(self):
+        """Returns the current `EnvironmentSnapshot` with the hosts and ports
+        of a fresh fetch of the endpoint, costing one request.
+
+        The timestamp is kept, so the rest is still resolved again once the
+        snapshot expires.
+        """
+        snap = self.snapshot
+        endp = self.api.get_endpoint(self._host.service, fresh=True)
+        self._snapshot = snap._replace(
+            hosts=self._get_hosts(endp),
+            ports=self._get_ports(endp) or snap.ports)
+        return self._snapshot
+
+    @property
+    def snapshot(self):
+        """Returns the current `EnvironmentSnapshot`, resolving a new one when
+        missing or expired.
+        """
+        snap = self._snapshot
+        if snap is None or (self.ttl is not None and snap.age > self.ttl):
+            snap = self.refresh()
+        return snap
+
+    def watch(self, timeout=None):
+        """Starts watching the endpoint of the CouchDB service, blocking until
+        the informer has synced or `timeout`.
+        """
+        if self.informer is None:
+            self.informer = Informer(
+                self.api, pykube.Endpoint, self._host.service)
+        self.informer.start()
+        self.informer.wait_for_sync(timeout)
+        return self.informer
+
+    def unwatch(self):
+        """Stops watching the endpoint, falling back to the snapshot."""
+        if self.informer is not None:
+            self.informer.stop()
+            self.informer = None
+
+    def close(self):
+        """Stops watching and releases the snapshot and the api client's
+        cache and connections, everything is resolved again on next use.
+        """
+        self.unwatch()
+        self._snapshot = None
+        self.api.close()
+
+    def subscribe(self, callback):
+        """Registers `callback(hosts)` to be called with the new hosts when
+        membership of the CouchDB service changes.  Starts the watch if it
+        isn't already running.
+        """
+        informer = self.watch()
+        last = [self.hosts]
+
+        def on_change(event_type, obj):
+            hosts = self.hosts
+            if hosts != last[0]:
+                last[0] = hosts
+                callback(hosts)
+
+        informer.subscribe(on_change)
+        return on_change
+
+    def _peek(self, attr):
+        endp = self._watched_endpoint()
+        if endp is not None and attr == 'hosts':
+            return self._get_hosts(endp)
+        if endp is not None and attr == 'ports':
+            ports = self._get_ports(endp)
+            if ports:
+                return ports
+        if self._snapshot is None:
+            return util.UNRESOLVED
+        return getattr(self._snapshot, attr)
+
+    def _watched_endpoint(self):
+        informer = self.informer
+        if informer is not None and informer.synced:
+            return informer.get()
+
     @property
     def hosts(self):
         """Returns a tuple of full fqdn's for all nodes in the CouchDB
         statefulset.
         """
-        service = self._host.service
-        endp = self.api.get_endpoint(service)
-        hosts = [self._fqdn_from_node(address['hostname'])
-                 for address in endp['subsets'][0]['addresses']]
-        return tuple(sorted(hosts))
+        endp = self._watched_endpoint()
+        if endp is not None:
+            return self._get_hosts(endp)
+        return self.snapshot.hosts
 
     @property
     def ports(self):
         """Returns a tuple of ports for the CouchDB statefulset."""
-        service = self._host.service
-        endp = self.api.get_endpoint(service)
-        ports = [port['port'] for port in endp['subsets'][0]['ports']]
-        return tuple(sorted(ports))
+        endp = self._watched_endpoint()
+        ports = self._get_ports(endp) if endp is not None else None
+        return ports or self.snapshot.ports
 
     @property
     def creds(self):
         """Returns a tuple of user/pass for the CouchDB statefulset."""
-        statefulset = self._host.statefulset
-        env = self.api.get_environment(statefulset, statefulset)
-        user = env.get('COUCHDB_ADMIN_USER', config.DEFAULT_CREDS[0])
-        password = env.get('COUCHDB_ADMIN_PASS', config.DEFAULT_CREDS[1])
-        return (user, password)
+        return self.snapshot.creds
 
     @property
     def cluster_size(self):
@@ -278,8 +861,4 @@ class KubeInterface(util.ReprMixin):
         number of replicas in the statefulset.  For most purposes, you can rely
         on default behavior here.
         """
-        statefulset = self._host.statefulset
-        ss = self.api.get_statefulset(statefulset)
-        env = self.api.get_environment(statefulset, statefulset)
-        size = ss['spec']['replicas']
-        return env.get('COUCHDB_CLUSTER_SIZE', size)
+        return self.snapshot.cluster_size
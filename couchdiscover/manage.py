@@ -9,16 +9,43 @@ with their configuration.
 :license: Apache2.
 """
 
-import time
+import gc
 import logging
+import os
 import socket
+import sys
 
-from . import config, couch, kube, util
-from .exceptions import InvalidKubeHostnameError
+from . import (
+    config, coordination, couch, kube, reconcile, tracing, transport, util)
+from .exceptions import CouchDiscHTTPError, InvalidKubeHostnameError
+
+# the asyncio engine is only imported when it's used
+aio = util.LazyModule('couchdiscover.aio')
 
 ONE_DAY = 60 * 60 * 24
 log = logging.getLogger(__name__)
 
+# all that's left of the process with `IDLE_MODE` 'exec', exiting on SIGTERM
+# as it's likely pid 1 and ignoring the request recorder's SIGUSR1
+SLEEPER = '''
+import signal, sys
+for signum in (signal.SIGTERM, signal.SIGINT):
+    signal.signal(signum, lambda *args: sys.exit(0))
+signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+while True:
+    signal.pause()
+'''
+
+
+def exec_sleeper():
+    """Replaces the process with a bare interpreter running `SLEEPER`, so
+    none of the modules, clients or memory of couchdiscover stay resident.
+    """
+    logging.shutdown()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execv(sys.executable, [sys.executable, '-S', '-E', '-c', SLEEPER])
+
 
 class ContainerEnvironment(util.ReprMixin):
     """Represents a self configuring environment object that can be passed to
@@ -30,6 +57,11 @@ class ContainerEnvironment(util.ReprMixin):
         self.env = env
         self._setup_environment(host)
 
+    def _peek(self, attr):
+        if attr in ('cluster_size', 'ports', 'creds'):
+            return self.kube._peek(attr)
+        return super()._peek(attr)
+
     def _get_host(self, host=None):
         if not host:
             if self.env == 'dev':
@@ -50,11 +82,26 @@ class ContainerEnvironment(util.ReprMixin):
     def _setup_environment(self, host=None):
         self.host = self._get_host(host)
         self.kube = kube.KubeInterface(self.host, env=self.env)
+        if config.WATCH_ENDPOINTS:
+            self.kube.watch(timeout=config.SNAPSHOT_TTL)
 
     def reload(self):
         """Reload environment."""
         self._setup_environment()
 
+    def refresh(self):
+        """Resolve a fresh snapshot of the kubernetes environment."""
+        return self.kube.refresh()
+
+    def refresh_hosts(self):
+        """Fetch the ready hosts again, keeping the rest of the snapshot."""
+        return self.kube.refresh_hosts()
+
+    @property
+    def snapshot(self):
+        """Returns the cached kubernetes environment snapshot."""
+        return self.kube.snapshot
+
     @property
     def index(self):
         """Represents the ordinal index 0-N of current node."""
@@ -80,6 +127,18 @@ class ContainerEnvironment(util.ReprMixin):
         """Returns the expected cluster size of the CouchDB statefulset."""
         return self.kube.cluster_size
 
+    @property
+    def hosts(self):
+        """Returns the hosts of the ready nodes of the CouchDB statefulset."""
+        return self.kube.hosts
+
+    @property
+    def peers(self):
+        """Returns the hosts every other node in the cluster will have."""
+        return tuple(str(self.host.clone(index=index))
+                     for index in range(self.cluster_size)
+                     if index != self.index)
+
     @property
     def first_node(self):
         """Returns True if first node in cluster."""
@@ -99,45 +158,273 @@ class ContainerEnvironment(util.ReprMixin):
 class ClusterManager(util.ReprMixin):
     """Represents the cluster manager, containing main logic that drives the
     self configuring of a CouchDB 2.0 cluster.
+
+    `engine` selects between the blocking `couch.CouchManager` ('sync') and
+    the asyncio based `aio.AsyncCouchManager` ('async').  `join_mode`
+    selects between every pod adding itself to the master ('peer'), the
+    master adding every pod ('coordinator') and the master adding the pods
+    that asked to join on a kubernetes Lease ('lease').  The latter two
+    always use the blocking manager as the master runs its own pool of
+    workers.  With `connect` False, the blocking manager doesn't wait for
+    CouchDB until its clients are connected.
     """
     _public_attrs = ('env', 'couch')
 
-    def __init__(self, env=None, host=None):
+    def __init__(self, env=None, host=None, engine=config.ENGINE,
+                 join_mode=config.JOIN_MODE, connect=True):
         self.env = ContainerEnvironment(env, host)
-        self.couch = couch.CouchManager(self.env)
+        self.join_mode = join_mode
+        if engine == 'async' and join_mode in ('coordinator', 'lease'):
+            log.warning('%s mode uses the sync engine', join_mode.title())
+            engine = 'sync'
+        self.engine = engine
+        if engine == 'async':
+            self.couch = aio.AsyncCouchManager(self.env)
+        else:
+            self.couch = couch.CouchManager(self.env, connect=connect)
 
-    def sleep_forever(self):
+    def release(self):
+        """Releases every client, cache and pooled connection held, which
+        are built again if used afterwards.
+        """
+        self.env.kube.close()
+        transport.get_transport().close()
+        self.couch = None
+        gc.collect()
+
+    def sleep_forever(self, mode=config.IDLE_MODE):
         """Work here is done, sleep forever.
 
         This would preferrably exit, but kubernetes only allows RestartPolicy
-        to be applied per pod.
+        to be applied per pod.  So everything held is released first or,
+        with `mode` 'exec', the process replaced by a minimal sleeper.
         """
         log.info('Done with: %s, sleeping forever', self.couch)
+        if mode == 'exec' and config.METRICS_PORT:
+            log.warning('Serving metrics, sleeping instead of exec')
+            mode = 'sleep'
+        if mode == 'exec':
+            exec_sleeper()
+        self.release()
         while True:
-            time.sleep(ONE_DAY)
+            util.clock.sleep(ONE_DAY)
 
-    def run(self):
+    def _enable_unless_finished(self):
+        """Enables the local node unless the cluster is already finished,
+        retrying until it's enabled.
+
+        Returns whether bootstrapping should go on.
+        """
+        if self.couch.finished:
+            log.info('Cluster already finished')
+            return False
+
+        def local_enabled():
+            try:
+                if not self.couch.disabled:
+                    return True
+                log.info('Cluster disabled, enabling')
+                self.couch.enable()
+                return 'disabled' not in self.couch.refresh()
+            except CouchDiscHTTPError as err:
+                log.warning('Failed enabling: %s', err)
+                self.couch.local.invalidate()
+                return False
+
+        util.wait_until(local_enabled, target='enabled local')
+        return True
+
+    async def _enable_unless_finished_async(self):
+        """Coroutine version of `_enable_unless_finished`."""
+        if self.couch.finished:
+            log.info('Cluster already finished')
+            return False
+
+        async def local_enabled():
+            try:
+                if 'disabled' not in await self.couch.local.refresh():
+                    return True
+                log.info('Cluster disabled, enabling')
+                await self.couch.enable()
+                return 'disabled' not in await self.couch.local.refresh()
+            except CouchDiscHTTPError as err:
+                log.warning('Failed enabling: %s', err)
+                return False
+
+        await aio.wait_until(local_enabled, target='enabled local')
+        return True
+
+    def bootstrap(self):
         """Main logic here, this is where we begin once all environment
-        information has been retrieved."""
+        information has been retrieved.
+
+        Every step is idempotent and nothing depends on the order pods start
+        in, so this is safe with `podManagementPolicy: Parallel`.  Each node
+        adds itself to the master, and the master finishes the cluster once
+        its membership confirms every node has joined.
+        """
         log.info('Starting couchdiscover: %s', self.couch)
-        if self.couch.disabled:
-            log.info('Cluster disabled, enabling')
-            self.couch.enable()
-        elif self.couch.finished:
-            log.info('Cluster already finished')
-            self.sleep_forever()
+        if not self._enable_unless_finished():
+            return
 
         if self.env.first_node:
             log.info("Looks like I'm the first node")
-            if self.env.single_node_cluster:
-                log.info('Single node cluster detected')
-                self.couch.finish()
+            self.couch.wait_for_membership(self.env.cluster_size)
+            self.couch.finish()
         else:
             log.info("Looks like I'm not the first node")
             self.couch.add_to_master()
-            if self.env.last_node:
-                log.info("Looks like I'm the last node")
-                self.couch.finish()
+
+    async def bootstrap_async(self):
+        """The same logic as `bootstrap` using the async engine, where the
+        local and master nodes are connected to concurrently.
+        """
+        await self.couch.connect()
+        log.info('Starting couchdiscover: %s', self.couch)
+        if not await self._enable_unless_finished_async():
+            return
+
+        if self.env.first_node:
+            log.info("Looks like I'm the first node")
+            await self.couch.wait_for_membership(self.env.cluster_size)
+            await self.couch.finish()
+        else:
+            log.info("Looks like I'm not the first node")
+            await self.couch.add_to_master()
+
+    def bootstrap_coordinator(self):
+        """Coordinator mode, where every node enables itself and the first
+        node adds the others as they become ready, finishing the cluster
+        once they're all members.
+        """
+        log.info('Starting couchdiscover as coordinator: %s', self.couch)
+        if not self._enable_unless_finished():
+            return
+
+        if not self.env.first_node:
+            log.info("Looks like I'm not the first node, waiting to be added")
+            return
+
+        expected = set(self.env.peers)
+        results = {}
+
+        def add_ready_peers():
+            if self.env.kube.informer is None:
+                self.env.refresh_hosts()
+            added = {host for host, res in results.items() if res.ok}
+            ready = [host for host in self.env.hosts
+                     if host in expected - added]
+            results.update(self.couch.add_peers(ready))
+            added = [host for host, res in results.items() if res.ok]
+            log.info(util.KeyValueMessage(
+                'adding peers', added=len(added), expected=len(expected)))
+            return len(added) == len(expected)
+
+        with util.timed_phase('add'):
+            util.wait_until(add_ready_peers, target='peers added')
+        self.couch.wait_for_membership(self.env.cluster_size)
+        self.couch.finish()
+
+    def bootstrap_lease(self):
+        """Lease mode, where every node enables itself and asks to join on the
+        statefulset's Lease, see `coordination.JoinLease`.  The first node
+        publishes its state there and adds the nodes asking in batches as it
+        sees them, finishing the cluster once they're all members.
+
+        No node polls the master, they watch the Lease for being added
+        instead.  The master stops adding nodes there once the cluster is
+        finished, so a node started afterwards is left to its reconciler.
+        """
+        log.info('Starting couchdiscover with lease: %s', self.couch)
+        if not self._enable_unless_finished():
+            return
+
+        host = str(self.env.host)
+        lease = coordination.JoinLease.for_env(self.env)
+        lease.watch(config.WAIT_CAP)
+        try:
+            if not self.env.first_node:
+                log.info("Looks like I'm not the first node, asking to join")
+                lease.request_join(host)
+                lease.wait_until(
+                    lambda: (host in lease.joined or
+                             lease.state == 'finished'),
+                    target='{} joined by master'.format(host))
+                if host not in lease.joined:
+                    self._log_late_join()
+                return
+
+            log.info("Looks like I'm the first node")
+            # joins recorded by a previous master can't be trusted
+            lease.publish('enabled', host, clear=('joined',))
+            expected = set(self.env.peers)
+            joined = set()
+
+            def add_requested_peers():
+                pending = (lease.requested & expected) - joined
+                if pending:
+                    results = self.couch.add_peers(sorted(pending))
+                    joined.update(
+                        peer for peer, res in results.items() if res.ok)
+                    lease.mark_joined(joined)
+                log.info(util.KeyValueMessage(
+                    'adding peers', joined=len(joined),
+                    expected=len(expected)))
+                return joined == expected
+
+            with util.timed_phase('add'):
+                lease.wait_until(add_requested_peers, target='peers joined')
+            self.couch.wait_for_membership(self.env.cluster_size)
+            self.couch.finish()
+            # joined is kept, a node may only see the Lease once finished
+            lease.publish('finished', host, clear=('requested',))
+        finally:
+            lease.unwatch()
+
+    @staticmethod
+    def _log_late_join():
+        if config.RECONCILE:
+            log.info('Cluster finished before joining, leaving adding this '
+                     "node to the master's reconciler")
+        else:
+            log.warning('Cluster finished before joining and RECONCILE is '
+                        'disabled, nothing will add this node')
+
+    def reconcile_forever(self):
+        """Keeps the cluster's membership in line with the statefulset, see
+        `reconcile.Reconciler`.
+        """
+        manager = self.couch
+        if not isinstance(manager, couch.CouchManager):
+            # the local node is up, so its wait isn't timed again
+            manager = couch.CouchManager(self.env, connect=False)
+            manager.local.connect()
+        reconcile.Reconciler(self.env, manager).run()
+
+    def run_bootstrap(self):
+        """Bootstraps the cluster with the configured join mode and engine."""
+        with tracing.span('bootstrap', host=str(self.env.host),
+                          join_mode=self.join_mode, engine=self.engine):
+            if self.join_mode == 'coordinator':
+                self.bootstrap_coordinator()
+            elif self.join_mode == 'lease':
+                self.bootstrap_lease()
+            elif self.engine == 'async':
+                aio.run(self.bootstrap_async())
             else:
-                log.info("Looks like I'm not the last node")
+                self.bootstrap()
+
+    def run(self):
+        """Bootstraps the cluster, then either reconciles membership forever
+        when the master, or sleeps forever.
+        """
+        self.run_bootstrap()
+        self.run_forever()
+
+    def run_forever(self):
+        """Reconciles membership forever when the master, otherwise sleeps
+        forever, once bootstrapped.
+        """
+        if config.RECONCILE and self.env.first_node:
+            self.reconcile_forever()
         self.sleep_forever()
@@ -0,0 +1,289 @@
+"""
+couchdiscover.metrics
+~~~~~~~~~~~~~~~~~~~~~
+
+This module contains a minimal Prometheus client, the metrics couchdiscover
+records and an HTTP server exposing them in the Prometheus text format.
+
+Metrics are always recorded, which costs a dict update per observation, and
+only served when `serve` is called, see `config.METRICS_PORT`, which is also
+when the HTTP server is imported.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import contextlib
+import logging
+import functools
+import math
+import threading
+import time
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60,
+                   120, 300, float('inf'))
+log = logging.getLogger(__name__)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value))
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(k, _escape(v)) for k, v in pairs))
+
+
+class Metric:
+    """Base of the metric types, values are kept per tuple of label values
+    in the order of `labelnames`.
+    """
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is None:
+            registry = REGISTRY
+        if registry is not False:
+            registry.register(self)
+
+    def __repr__(self):
+        clss = type(self).__name__
+        return '{}({})'.format(clss, self.name)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} expects labels: {}, got: {}'.format(
+                self.name, self.labelnames, tuple(labels)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def get(self, **labels):
+        """Returns the current value for `labels`."""
+        return self._values.get(self._key(labels))
+
+    def clear(self):
+        """Forgets every value."""
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """Yields tuples of (name, label pairs, value)."""
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+    def exposition(self):
+        """Returns the metric in the Prometheus text format."""
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.type)]
+        lines.extend('{}{} {}'.format(name, _format_labels(pairs),
+                                      _format_value(value))
+                     for name, pairs, value in self.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increments the counter for `labels` by `amount`."""
+        if amount < 0:
+            raise ValueError('Counters can only be incremented')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down."""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        """Sets the gauge for `labels` to `value`."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        """Increments the gauge for `labels` by `amount`."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_state(self, state, states, **labels):
+        """Sets the gauge to 1 for `state` and 0 for the rest of `states`,
+        `state` being the label named 'state'.
+        """
+        with self._lock:
+            for each in set(states) | {state}:
+                key = self._key(dict(labels, state=each))
+                self._values[key] = 1 if each == state else 0
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative `buckets` of upper bounds, along
+    with their sum and count.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None,
+                 buckets=DEFAULT_BUCKETS):
+        buckets = tuple(sorted(buckets))
+        if buckets[-1] != float('inf'):
+            buckets += (float('inf'),)
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        """Records an observation of `value` for `labels`."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, clock=time.monotonic, **labels):
+        """Observes the seconds the block took by `clock` for `labels`, even
+        if it raises.
+        """
+        start = clock()
+        try:
+            yield
+        finally:
+            self.observe(clock() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((k, (list(c), s))
+                            for k, (c, s) in self._values.items())
+        for key, (counts, total) in values:
+            pairs = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                yield ('{}_bucket'.format(self.name),
+                       pairs + [('le', _format_value(bound))], count)
+            yield '{}_sum'.format(self.name), pairs, total
+            yield '{}_count'.format(self.name), pairs, counts[-1]
+
+
+class Registry:
+    """A collection of metrics exposed together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Adds `metric`, raising ValueError if its name is taken."""
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('Duplicate metric: {}'.format(metric.name))
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        """Returns the metric named `name`, or None."""
+        return self._metrics.get(name)
+
+    def clear(self):
+        """Forgets the values of every metric."""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def exposition(self):
+        """Returns every metric in the Prometheus text format."""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return ''.join(metric.exposition() for _, metric in metrics)
+
+
+REGISTRY = Registry()
+
+PHASE_DURATION = Histogram(
+    'couchdiscover_phase_duration_seconds',
+    'Seconds spent in each phase of bootstrapping the cluster.', ('phase',))
+COUCH_REQUEST_DURATION = Histogram(
+    'couchdiscover_couch_request_duration_seconds',
+    'Seconds taken by requests to CouchDB.', ('method', 'uri', 'status'))
+KUBE_REQUEST_DURATION = Histogram(
+    'couchdiscover_kube_request_duration_seconds',
+    'Seconds taken by requests to the kubernetes api.',
+    ('kind', 'verb', 'code'))
+WAIT_RETRIES = Counter(
+    'couchdiscover_wait_retries_total',
+    'Attempts retried while waiting for a condition.')
+CLUSTER_SETUP_STATE = Gauge(
+    'couchdiscover_cluster_setup_state',
+    'The last cluster_setup state seen for each node, 1 for the current.',
+    ('host', 'state'))
+
+
+@functools.lru_cache(maxsize=None)
+def server_class():
+    """Returns the class of the HTTP server exposing a registry, defined on
+    first use so `http.server` is only imported when metrics are served.
+    """
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """Serves the registry of the server at `/metrics`."""
+
+        def log_message(self, fmt, *args):
+            log.debug(fmt, *args)
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = self.server.registry.exposition().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    class MetricsServer(socketserver.ThreadingMixIn, HTTPServer):
+        """An HTTP server exposing `registry`."""
+        daemon_threads = True
+
+        def __init__(self, address, registry=REGISTRY):
+            super().__init__(address, MetricsHandler)
+            self.registry = registry
+
+    return MetricsServer
+
+
+def serve(port, addr='', registry=REGISTRY):
+    """Serves `registry` on `port` from a daemon thread, returning the
+    server.
+    """
+    server = server_class()((addr, port), registry)
+    thread = threading.Thread(
+        target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    log.info('Serving metrics on: %s:%s', addr or '0.0.0.0', port)
+    return server
@@ -0,0 +1,236 @@
+"""
+couchdiscover.reconcile
+~~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the reconciler the master runs once the cluster is
+bootstrapped, keeping the cluster's membership in line with the statefulset.
+
+Desired membership is every ordinal below the statefulset's cluster size,
+actual membership is the master's `_nodes` db.  Each pass diffs the two and
+only acts on the difference, adding missing nodes once they're ready in the
+service's endpoint and reporting stale ones.  A difference has to be seen on
+`hysteresis` consecutive passes before it's acted on, and at most `max_adds`
+nodes are added per `interval`, so a rolling restart or a flapping endpoint
+doesn't churn the cluster.
+
+With `scale_down`, stale nodes for ordinals beyond the cluster size are also
+removed from `_nodes` once they've been stale for `grace` seconds,
+`batch_size` at a time and only when their shards have copies elsewhere.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import collections
+import logging
+import threading
+
+from . import config, tracing, util
+from .exceptions import CouchDiscGeneralError
+
+
+requests = util.LazyModule('requests')
+log = logging.getLogger(__name__)
+
+
+class MembershipDiff(collections.namedtuple(
+        'MembershipDiff', 'desired actual missing stale disconnected')):
+    """The difference between desired and actual membership as sets of
+    hosts, `disconnected` being members the master can't currently reach.
+    """
+    __slots__ = ()
+
+    @property
+    def converged(self):
+        """Returns True if there's nothing to add or remove."""
+        return not (self.missing or self.stale)
+
+
+class Reconciler(util.ReprMixin):
+    """Periodically reconciles the cluster's membership with the statefulset
+    through `manager`, a `couch.CouchManager` for the master.
+
+    When the environment is watching the service's endpoint, a change to it
+    wakes the reconciler up early instead of waiting for the next pass.
+    """
+    _public_attrs = ('interval', 'hysteresis', 'max_adds', 'scale_down',
+                     'passes')
+
+    def __init__(self, env, manager, interval=config.RECONCILE_INTERVAL,
+                 hysteresis=config.RECONCILE_HYSTERESIS,
+                 max_adds=config.RECONCILE_MAX_ADDS,
+                 scale_down=config.SCALE_DOWN, grace=config.SCALE_DOWN_GRACE,
+                 batch_size=config.SCALE_DOWN_BATCH):
+        self.env = env
+        self.manager = manager
+        self.interval = interval
+        self.hysteresis = max(1, hysteresis)
+        self.max_adds = max_adds
+        self.scale_down = scale_down
+        self.grace = grace
+        self.batch_size = max(1, batch_size)
+        self.passes = 0
+        self._seen = {}
+        self._stale_since = {}
+        self._last_change = None
+        self._refreshed_for = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def _node_host(self, node):
+        return node.split('@', 1)[-1]
+
+    def _desired(self):
+        return set(self.env.peers) | {str(self.env.host)}
+
+    def diff(self):
+        """Returns the current `MembershipDiff`, or None if the master's
+        membership couldn't be fetched.
+
+        The desired membership comes from the cached snapshot, which is only
+        resolved again once it expires or to confirm a difference that
+        changed since the last pass, and the endpoint's hosts from the watch
+        when there is one.
+        """
+        local = self.manager.local
+        nodes = local.nodes()
+        if nodes is None:
+            return None
+        actual = {self._node_host(node) for node in nodes}
+        desired = self._desired()
+        if desired == actual:
+            self._refreshed_for = None
+        elif (desired - actual, actual - desired) != self._refreshed_for:
+            self.env.refresh()
+            desired = self._desired()
+            self._refreshed_for = (desired - actual, actual - desired)
+        membership = local.membership() or {}
+        connected = {self._node_host(node)
+                     for node in membership.get('all_nodes', ())}
+        return MembershipDiff(
+            desired=desired, actual=actual,
+            missing=desired - actual, stale=actual - desired,
+            disconnected=(actual & desired) - connected if connected
+            else set())
+
+    def _confirm(self, kind, hosts):
+        """Counts the consecutive passes each of `hosts` has been seen as
+        `kind`, returning those seen at least `hysteresis` times.
+        """
+        confirmed = set()
+        for host in hosts:
+            key = (kind, host)
+            self._seen[key] = self._seen.get(key, 0) + 1
+            if self._seen[key] >= self.hysteresis:
+                confirmed.add(host)
+        for key in [k for k in self._seen if k[0] == kind]:
+            if key[1] not in hosts:
+                del self._seen[key]
+        return confirmed
+
+    def _rate_limited(self):
+        return (self._last_change is not None and
+                util.clock.monotonic() - self._last_change < self.interval)
+
+    def _add_missing(self, missing):
+        ready = set(self.env.hosts)
+        hosts = sorted(host for host in missing if host in ready)
+        waiting = len(missing) - len(hosts)
+        if not hosts:
+            return {}
+        if self._rate_limited():
+            log.debug('Rate limited, deferring adding: %s', hosts)
+            return {}
+        hosts = hosts[:self.max_adds]
+        log.info(util.KeyValueMessage(
+            'reconcile adding nodes', hosts=hosts, waiting=waiting))
+        self._last_change = util.clock.monotonic()
+        results = self.manager.add_peers(hosts)
+        for host, result in results.items():
+            if result.ok:
+                self._seen.pop(('missing', host), None)
+        return results
+
+    def _track_stale(self, stale):
+        """Reports newly stale hosts, remembering when each was first seen."""
+        now = util.clock.monotonic()
+        for host in set(self._stale_since) - stale:
+            del self._stale_since[host]
+        for host in sorted(stale - set(self._stale_since)):
+            self._stale_since[host] = now
+            log.warning(util.KeyValueMessage(
+                'stale node', host=host,
+                node=self.manager.local.node_name(host),
+                cluster_size=self.env.cluster_size))
+
+    def _remove_departed(self, stale):
+        now = util.clock.monotonic()
+        departed = self.manager.departed(stale)
+        due = [host for host in departed
+               if now - self._stale_since[host] >= self.grace]
+        if not due:
+            return {}
+        if self._rate_limited():
+            log.debug('Rate limited, deferring removing: %s', due)
+            return {}
+        self._last_change = now
+        results = self.manager.remove_nodes(
+            due[:self.batch_size], self.batch_size)
+        for host, removed in results.items():
+            if removed:
+                self._stale_since.pop(host, None)
+                self._seen.pop(('stale', host), None)
+        return results
+
+    def reconcile_once(self):
+        """Runs a single pass, returning the `MembershipDiff` it acted on."""
+        self.passes += 1
+        with tracing.span('reconcile', passes=self.passes) as span:
+            try:
+                diff = self.diff()
+                if diff is not None:
+                    self._apply(diff)
+                    span.set_attributes(missing=sorted(diff.missing),
+                                        stale=sorted(diff.stale))
+            except (CouchDiscGeneralError, requests.RequestException) as err:
+                span.set_error(err)
+                log.warning('Reconcile pass failed: %s', err)
+                return None
+        if diff is None:
+            log.warning('Membership unavailable, skipping reconcile pass')
+        return diff
+
+    def _apply(self, diff):
+        if diff.disconnected:
+            log.warning(util.KeyValueMessage(
+                'disconnected nodes', hosts=sorted(diff.disconnected)))
+        if diff.converged:
+            self._seen.clear()
+            self._stale_since.clear()
+            return
+        self._add_missing(self._confirm('missing', diff.missing))
+        stale = self._confirm('stale', diff.stale)
+        self._track_stale(stale)
+        if self.scale_down:
+            self._remove_departed(stale)
+
+    def wakeup(self, *args):
+        """Triggers the next pass early, usable as a subscriber callback."""
+        self._wakeup.set()
+
+    def stop(self):
+        """Stops `run` after the current pass."""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def run(self):
+        """Reconciles every `interval` seconds, or sooner when woken up,
+        until stopped.
+        """
+        if self.env.kube.informer is not None:
+            self.env.kube.subscribe(self.wakeup)
+        log.info('Reconciling membership: %s', self)
+        while not self._stopped.is_set():
+            self.reconcile_once()
+            util.clock.wait(self._wakeup, self.interval)
+            self._wakeup.clear()
@@ -0,0 +1,196 @@
+"""
+couchdiscover.tracing
+~~~~~~~~~~~~~~~~~~~~~
+
+This module contains a lightweight tracing layer, recording spans of the
+phases, waits and HTTP requests of each boot as a tree and writing every
+finished span out as a line of JSON.
+
+The current span is kept in a context variable, so spans nest across calls
+and coroutines without being passed around, and `bind` carries it over to
+worker threads.  Tracing is disabled until `configure` is given an output,
+see `config.TRACE_OUTPUT`, and while disabled `span` returns a shared no-op
+span, costing a function call and an attribute check.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+_current = contextvars.ContextVar('couchdiscover_span', default=None)
+
+
+def _new_id():
+    return os.urandom(8).hex()
+
+
+class Span:
+    """A timed operation within a trace, the child of `parent` if given."""
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id',
+                 'attributes', 'error', 'start', 'end', '_token')
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else _new_id() + _new_id()
+        self.span_id = _new_id()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.start = None
+        self.end = None
+        self._token = None
+
+    def __repr__(self):
+        return 'Span({}, {})'.format(self.name, self.span_id)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time()
+        _current.reset(self._token)
+        if exc is not None and self.error is None:
+            self.set_error(exc)
+        self.tracer.export(self)
+        return False
+
+    def set_attribute(self, key, value):
+        """Sets attribute `key` to `value`."""
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        """Sets every attribute in `attributes`."""
+        self.attributes.update(attributes)
+
+    def set_error(self, exc):
+        """Records `exc` as the reason this span failed."""
+        self.error = '{}: {}'.format(type(exc).__name__, exc)
+
+    def to_dict(self):
+        """Returns the span as a dict ready to be serialized."""
+        return dict(
+            name=self.name, trace_id=self.trace_id, span_id=self.span_id,
+            parent_id=self.parent_id, start=self.start, end=self.end,
+            duration=self.end - self.start, attributes=self.attributes,
+            error=self.error, thread=threading.current_thread().name)
+
+
+class NoopSpan:
+    """Stands in for `Span` while tracing is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def set_error(self, exc):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class JSONLinesExporter:
+    """Writes each span to `stream` as a line of JSON."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_output(cls, output):
+        """Returns an exporter for `output`, either 'stderr', 'stdout' or a
+        path to append to.
+        """
+        if output in ('stderr', '-'):
+            return cls(sys.stderr)
+        if output == 'stdout':
+            return cls(sys.stdout)
+        return cls(open(os.path.expanduser(output), 'a', buffering=1))
+
+    def __call__(self, span):
+        line = json.dumps(span.to_dict(), default=str, sort_keys=True)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+class Tracer:
+    """Creates spans and hands every finished one to `exporter`, a callable
+    taking the span.  Disabled when `exporter` is None.
+    """
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def span(self, name, **attributes):
+        """Returns a context manager timing a span named `name`, the child
+        of the current one.
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+        return Span(self, name, _current.get(), attributes)
+
+    def export(self, span):
+        exporter = self.exporter
+        if exporter is None:
+            return
+        try:
+            exporter(span)
+        except Exception as err:
+            log.warning('Failed exporting span: %s, %s', span, err)
+
+
+TRACER = Tracer()
+
+
+def configure(output=None):
+    """Enables tracing to `output`, see `JSONLinesExporter.from_output`, or
+    disables it when `output` is falsy.
+    """
+    TRACER.exporter = JSONLinesExporter.from_output(output) if output else None
+    return TRACER
+
+
+def span(name, **attributes):
+    """Starts a span named `name` on the global tracer."""
+    return TRACER.span(name, **attributes)
+
+
+def current_span():
+    """Returns the current span, or None."""
+    return _current.get()
+
+
+def bind(func):
+    """Returns `func` bound to a copy of the current context, so spans it
+    starts on another thread are children of the current span.
+    """
+    if TRACER.exporter is None:
+        return func
+    return functools.partial(contextvars.copy_context().run, func)
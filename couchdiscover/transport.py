@@ -0,0 +1,89 @@
+"""
+couchdiscover.transport
+~~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the pooled HTTP transport shared by everything that
+talks to CouchDB.
+
+:copyright: (c) 2017 by Joe Black.
+:license: Apache2.
+"""
+
+import threading
+
+from . import config, util
+
+
+requests = util.LazyModule('requests')
+
+
+class Transport:
+    """A pooled HTTP transport shared between CouchDB clients.
+
+    Keeps up to `pool_size` keep-alive connections for each of up to
+    `pool_hosts` hosts in a single `requests.Session`.  Credentials are
+    passed per request rather than stored on the session, so clients can
+    swap them without throwing their connections away.
+    """
+
+    def __init__(self, pool_size=config.HTTP_POOL_SIZE,
+                 pool_hosts=config.HTTP_POOL_HOSTS,
+                 timeout=config.HTTP_TIMEOUT):
+        self.pool_size = pool_size
+        self.pool_hosts = pool_hosts
+        self.timeout = timeout
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def __repr__(self):
+        clss = type(self).__name__
+        return '{}(pool_size: {}, pool_hosts: {}, timeout: {})'.format(
+            clss, self.pool_size, self.pool_hosts, self.timeout)
+
+    def _get_session(self):
+        sess = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_hosts, pool_maxsize=self.pool_size)
+        sess.mount('http://', adapter)
+        sess.mount('https://', adapter)
+        sess.headers.update({'Content-Type': 'application/json'})
+        return sess
+
+    @property
+    def session(self):
+        """Returns the shared `requests.Session`, building it on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._get_session()
+        return self._session
+
+    def request(self, verb, url, **kwargs):
+        """Sends a request over the shared session, applying the default
+        timeout.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(verb, url, **kwargs)
+
+    def close(self):
+        """Closes every pooled connection, the session is built again on next
+        use.
+        """
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Returns the process wide shared `Transport`."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = Transport()
+    return _transport
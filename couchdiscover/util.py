@@ -8,23 +8,49 @@ This module contains various utility functions and Mixins.
 :license: Apache2.
 """
 
+import collections
+import contextlib
+import functools
+import importlib
+import inspect
 import logging
+import random
+import time
 
+from . import config, metrics, tracing
+from .exceptions import WaitTimeoutError
 
-# needs to have a reference to the wrapped object @ self._wrapped
-def passthrough(func):
-    """A Decorator that will call the same named function on the wrapped
-    object.
 
-    Expected interface requires a `_wrapped` attribute on the wrapper object
-    to contain a pointer to the wrapped object.
+UNRESOLVED = '<unresolved>'
+log = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Stands in for the module `name`, importing it on first attribute
+    access so heavy dependencies only load on the code paths using them.
+
+    Example:
+    >>> pykube = LazyModule('pykube')
+    >>> pykube.Endpoint  # imports pykube
     """
-    def wrap(self, *args, **kwargs):
-        """This function allows arguments to be passed."""
-        caller = func.__name__
-        method = getattr(self._wrapped, caller)
-        return method(*args, **kwargs)
-    return wrap
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return 'LazyModule({}, {})'.format(self._name, state)
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
 
 
 def setup_logging(level, fmt, date):
@@ -42,17 +68,231 @@ def setup_logging(level, fmt, date):
     return log
 
 
+class Clock:
+    """The source of time for the package, see `set_clock`."""
+
+    @staticmethod
+    def monotonic():
+        """Returns the seconds of a clock that never goes backwards."""
+        return time.monotonic()
+
+    @staticmethod
+    def sleep(seconds):
+        """Blocks the calling thread for `seconds`."""
+        time.sleep(seconds)
+
+    @staticmethod
+    def wait(event, timeout=None):
+        """Blocks the calling thread until `event` is set or `timeout`
+        seconds pass, returning whether it's set.
+        """
+        return event.wait(timeout)
+
+
+clock = Clock()
+
+
+def set_clock(new):
+    """Replaces the `Clock` everything in the package reads time from and
+    sleeps on, returning the previous one.  Used to run on virtual time.
+    """
+    global clock
+    old, clock = clock, new
+    return old
+
+
+@contextlib.contextmanager
+def timed_phase(name):
+    """Records how long the block takes as bootstrap phase `name`, tracing
+    it as a span of the same name.  A `name` of None records nothing.
+
+    Phases mustn't nest, so each second of a boot is attributed to one.
+    """
+    if name is None:
+        yield tracing.NOOP_SPAN
+        return
+    with metrics.PHASE_DURATION.time(clock.monotonic, phase=name):
+        with tracing.span(name) as span:
+            yield span
+
+
+def phase(name):
+    """A decorator recording each call of the function, or coroutine
+    function, as bootstrap phase `name`, see `timed_phase`.
+    """
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrap(*args, **kwargs):
+                with timed_phase(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrap(*args, **kwargs):
+                with timed_phase(name):
+                    return func(*args, **kwargs)
+        return wrap
+    return decorate
+
+
+def uri_template(uri):
+    """Returns `uri` with its database and document ids replaced by
+    placeholders, eg: '/_nodes/{id}', to keep metric labels bounded.
+    """
+    path = (uri or '/').split('?', 1)[0]
+    parts = path.strip('/').split('/') if path.strip('/') else []
+    template = []
+    for i, part in enumerate(parts):
+        if part.startswith('_'):
+            template.append(part)
+        else:
+            template.append('{db}' if i == 0 else '{id}')
+    return '/' + '/'.join(template)
+
+
 class ReprMixin:
     """A mixin that does automatic repr configuration.
 
     Expected interface requires a `_public_attrs` attribute which is an
     iterable of public properties you want to expose through `__repr__`.
+
+    `__repr__` must never do I/O, so properties that fetch their value should
+    be rendered from cached state by overriding `_peek`.
     """
     _public_attrs = ()
 
+    def _peek(self, attr):
+        """Returns the value of `attr` to render in `__repr__`."""
+        return getattr(self, attr)
+
     def __repr__(self):
         clss = type(self).__name__
-        attrs = ['{}: {}'.format(a, getattr(self, a))
+        attrs = ['{}: {}'.format(a, self._peek(a))
                  for a in self._public_attrs]
         attrs = ', '.join(attrs)
         return '{}({})'.format(clss, attrs)
+
+
+class KeyValueMessage:
+    """A structured log message of an event followed by key=value fields.
+
+    The message is only formatted if a handler actually emits the record, so
+    fields can be passed as objects and are rendered lazily.  The fields are
+    also available to formatters as `record.msg.fields`.
+
+    Example:
+    >>> log.info(KeyValueMessage('waiting for master', master=master, n=3))
+    waiting for master master=CouchInitClient(...) n=3
+    """
+    __slots__ = ('event', 'fields')
+
+    def __init__(self, event, **fields):
+        self.event = event
+        self.fields = fields
+
+    @staticmethod
+    def _format_value(val):
+        val = str(val)
+        if not val or ' ' in val or '"' in val:
+            val = '"{}"'.format(val.replace('"', '\\"'))
+        return val
+
+    def __str__(self):
+        pairs = ['{}={}'.format(k, self._format_value(v))
+                 for k, v in sorted(self.fields.items())]
+        return ' '.join([self.event] + pairs)
+
+
+class Backoff:
+    """Exponential backoff with jitter.
+
+    Delays start at `initial` seconds and grow by `factor` up to `cap`.  Each
+    delay is drawn at random from the upper half of the current step so that
+    many pods started together don't poll in lockstep.
+    """
+
+    def __init__(self, initial=config.WAIT_INITIAL, cap=config.WAIT_CAP,
+                 factor=2.0, jitter=True):
+        self.initial = initial
+        self.cap = cap
+        self.factor = factor
+        self.jitter = jitter
+
+    def __repr__(self):
+        clss = type(self).__name__
+        return '{}(initial: {}, cap: {}, factor: {})'.format(
+            clss, self.initial, self.cap, self.factor)
+
+    def delays(self):
+        """Yields an endless sequence of delays in seconds."""
+        step = self.initial
+        while True:
+            if self.jitter:
+                yield random.uniform(step / 2, step)
+            else:
+                yield step
+            step = min(self.cap, step * self.factor)
+
+
+WaitResult = collections.namedtuple(
+    'WaitResult', ('value', 'attempts', 'elapsed'))
+
+
+class Wait:
+    """The bookkeeping of a single wait, shared by `wait_until` and its
+    coroutine counterpart.
+
+    `step` is passed the result of each attempt and returns either the
+    finished `WaitResult` or the number of seconds to sleep before the next
+    attempt, raising `WaitTimeoutError` once `timeout` has passed.
+    """
+
+    def __init__(self, target='condition', timeout=config.WAIT_TIMEOUT,
+                 backoff=None):
+        self.target = target
+        self.timeout = timeout
+        self.attempts = 0
+        self.start = clock.monotonic()
+        self._delays = (backoff or Backoff()).delays()
+
+    def step(self, value):
+        """Records an attempt who's result was `value`."""
+        self.attempts += 1
+        elapsed = clock.monotonic() - self.start
+        if value:
+            log.info(KeyValueMessage(
+                'wait finished', target=self.target, attempts=self.attempts,
+                elapsed='{:.2f}s'.format(elapsed)))
+            return WaitResult(value, self.attempts, elapsed)
+        metrics.WAIT_RETRIES.inc()
+        delay = next(self._delays)
+        if self.timeout is not None:
+            remaining = self.timeout - elapsed
+            if remaining <= 0:
+                raise WaitTimeoutError(
+                    target=self.target, elapsed=elapsed,
+                    attempts=self.attempts)
+            delay = min(delay, remaining)
+        log.info(KeyValueMessage(
+            'waiting', target=self.target, attempt=self.attempts,
+            retry_in='{:.2f}s'.format(delay)))
+        return delay
+
+
+def wait_until(predicate, target='condition', timeout=config.WAIT_TIMEOUT,
+               backoff=None):
+    """Calls `predicate` until it returns something truthy, sleeping between
+    attempts according to `backoff`.
+
+    Returns a `WaitResult` of the final value, number of attempts and seconds
+    elapsed.  Raises `WaitTimeoutError` once `timeout` seconds have passed,
+    a `timeout` of None waits forever.
+    """
+    wait = Wait(target, timeout, backoff)
+    with tracing.span('wait', target=target) as span:
+        while True:
+            span.set_attribute('attempts', wait.attempts + 1)
+            result = wait.step(predicate())
+            if isinstance(result, WaitResult):
+                return result
+            clock.sleep(result)
@@ -27,9 +27,9 @@ setup(
     license='Apache 2.0',
     zip_safe=False,
     packages=find_packages(),
+    python_requires='>=3.7',
     package_data={'': ['LICENSE']},
     install_requires=[
-        'CouchDB',
         'requests',
         'pykube>=0.16a1'
     ],
@@ -3,10 +3,10 @@ import glob
 
 from invoke import Collection, task
 
-from . import py, docker, test
+from . import py, docker, test, bench
 
 
-collections = [py, docker, test]
+collections = [py, docker, test, bench]
 
 ns = Collection()
 for c in collections:
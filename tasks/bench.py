@@ -0,0 +1,48 @@
+import json
+
+from invoke import task
+
+
+SIZES = '1,3,10,50,200'
+
+
+@task(default=True)
+def bootstrap(ctx, sizes=SIZES, engine='sync', join_mode='peer',
+              timeout=300, verbose=False):
+    """Benchmarks bootstrapping a cluster of each of `sizes` pods."""
+    results = []
+    for size in sizes.split(','):
+        cmd = ('python3 -m benchmarks.bootstrap --json --size {} --engine {} '
+               '--join-mode {} --timeout {}'.format(
+                   size, engine, join_mode, timeout))
+        res = ctx.run(cmd, hide='out', warn=True)
+        results.append(json.loads(res.stdout.splitlines()[-1]))
+
+    row = '{:>6} {:>10} {:>14} {:>10} {:>10}  {}'
+    print(row.format('size', 'finished', 'bootstrapped', 'requests',
+                     'rss(MiB)', 'errors'))
+    for result in results:
+        finished = result['time_to_finished']
+        print(row.format(
+            result['size'],
+            'n/a' if finished is None else '{:.3f}s'.format(finished),
+            '{:.3f}s'.format(result['time_to_bootstrapped']),
+            result['requests'],
+            '{:.1f}'.format(result['peak_rss_kb'] / 1024),
+            len(result['errors'])))
+    if verbose:
+        for result in results:
+            print('\nsize: {}'.format(result['size']))
+            for endpoint, count in result['endpoints'].items():
+                print('{:>8}  {}'.format(count, endpoint))
+            for error in result['errors']:
+                print('  error: {}'.format(error))
+
+
+@task
+def simulate(ctx, size=50, start_order='parallel', failure_rate=0.0,
+             join_mode='peer', seed=0):
+    """Simulates bootstrapping `size` pods on a virtual clock."""
+    ctx.run('python3 -m benchmarks.simulate --size {} --start-order {} '
+            '--failure-rate {} --join-mode {} --seed {}'.format(
+                size, start_order, failure_rate, join_mode, seed))
@@ -9,3 +9,8 @@ def test(ctx):
 @task
 def clean(ctx):
     ctx.run("rm -rf test/*.{conf,txt}")
+
+
+@task
+def unit(ctx):
+    ctx.run('python -m unittest discover -s tests')
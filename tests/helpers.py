@@ -0,0 +1,180 @@
+"""Fakes shared by the tests."""
+
+import collections
+import json
+import types
+import unittest
+from unittest import mock
+from urllib.parse import unquote, urlsplit
+
+import requests
+
+from couchdiscover import config, kube, metrics, transport, util
+
+
+def host(index):
+    return 'couchdb-{}.couchdb.default.svc.cluster.local'.format(index)
+
+
+class FakeResponse:
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode('utf-8')
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+def node(index):
+    return 'couchdb@' + host(index)
+
+
+class FakeTransport:
+    """Answers like enabled CouchDB nodes sharing one `_nodes` db, holding
+    the first node, and one `_dbs` db holding the shard map of each db in
+    `shards`.  Raises `requests.ConnectionError` for every path or
+    host:port in `down`, fails deleting the nodes in `conflicts` and the
+    next `failures[action]` cluster_setup posts of each action.  Every
+    host is in cluster_setup `state` unless it's given one in `states`.
+    """
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.state = 'cluster_enabled'
+        self.states = {}
+        self.failures = collections.Counter()
+        self.sent = []
+        self.members = {node(0)}
+        self.shards = {}
+        self.conflicts = set()
+
+    def _node_row(self, name):
+        if name in self.members:
+            return {'id': name, 'key': name, 'value': {'rev': '1-a'}}
+        return {'key': name, 'error': 'not_found'}
+
+    def _set_state(self, hostname, state):
+        if hostname in self.states:
+            self.states[hostname] = state
+        else:
+            self.state = state
+
+    def _bulk_result(self, doc):
+        if doc['_id'] in self.conflicts:
+            return {'id': doc['_id'], 'error': 'conflict'}
+        self.members.discard(doc['_id'])
+        return {'id': doc['_id'], 'ok': True, 'rev': '2-b'}
+
+    def request(self, verb, url, **kwargs):
+        self.sent.append((verb, url))
+        parts = urlsplit(url)
+        path = unquote(parts.path)
+        body = json.loads(kwargs.get('data') or 'null')
+        if path in self.down or parts.netloc in self.down:
+            raise requests.ConnectionError('connection refused: ' + url)
+        if path == '/_all_dbs':
+            admin = parts.port == config.DEFAULT_PORTS[1]
+            return FakeResponse(['_nodes'] if admin else [])
+        if path == '/_cluster_setup':
+            if body and body['action'] == 'add_node':
+                self.members.add('couchdb@' + body['host'])
+                return FakeResponse({'ok': True})
+            if body and self.failures[body['action']]:
+                self.failures[body['action']] -= 1
+                return FakeResponse({'error': 'unknown_error'}, 500)
+            if body and body['action'] == 'enable_cluster':
+                self._set_state(parts.hostname, 'cluster_enabled')
+                return FakeResponse({'ok': True})
+            if body and body['action'] == 'finish_cluster':
+                self._set_state(parts.hostname, 'cluster_finished')
+                return FakeResponse({'ok': True})
+            return FakeResponse(
+                {'state': self.states.get(parts.hostname, self.state)})
+        if path == '/_nodes/_all_docs':
+            names = body['keys'] if body else sorted(self.members)
+            return FakeResponse(
+                {'rows': [self._node_row(name) for name in names]})
+        if path == '/_nodes/_bulk_docs':
+            return FakeResponse(
+                [self._bulk_result(doc) for doc in body['docs']])
+        if path.startswith('/_nodes/'):
+            name = path[len('/_nodes/'):]
+            if name in self.members:
+                return FakeResponse({'_id': name, '_rev': '1-a'})
+            return FakeResponse({'error': 'not_found'}, 404)
+        if path == '/_dbs/_all_docs':
+            return FakeResponse({'rows': [
+                {'id': db, 'doc': {'_id': db, 'by_range': by_range}}
+                for db, by_range in sorted(self.shards.items())]})
+        if path == '/_membership':
+            nodes = sorted(self.members)
+            return FakeResponse({'all_nodes': nodes, 'cluster_nodes': nodes})
+        return FakeResponse({'couchdb': 'Welcome', 'version': '2.0.0'})
+
+
+class FakeClock(util.Clock):
+
+    def __init__(self):
+        self.now = 0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def wait(self, event, timeout=None):
+        if not event.is_set() and timeout is not None:
+            self.now += timeout
+        return event.is_set()
+
+
+def phase_seconds(name):
+    """Returns the count and sum of the observations of phase `name`."""
+    counts, total = metrics.PHASE_DURATION.get(phase=name) or ([0], 0.0)
+    return counts[-1], total
+
+
+class FakeEnv:
+    """The environment of the node at `index` of a statefulset of `size`
+    pods which are all ready.
+    """
+
+    def __init__(self, size, index=0):
+        self.host = kube.KubeHostname(host(index))
+        self.ports = config.DEFAULT_PORTS
+        self.creds = config.DEFAULT_CREDS
+        self.cluster_size = size
+        self.peers = tuple(host(i) for i in range(size) if i != index)
+        self.hosts = tuple(host(i) for i in range(size))
+        self.first_node = index == 0
+        self.kube = types.SimpleNamespace(informer=None)
+        self.refreshes = 0
+        self.host_refreshes = 0
+
+    def refresh(self):
+        self.refreshes += 1
+
+    def refresh_hosts(self):
+        self.host_refreshes += 1
+
+
+class ClockTestCase(unittest.TestCase):
+
+    def use_clock(self, clock=None):
+        """Runs the test on `clock`, a new `FakeClock` by default."""
+        clock = clock or FakeClock()
+        old = util.set_clock(clock)
+        self.addCleanup(util.set_clock, old)
+        return clock
+
+
+class TransportTestCase(ClockTestCase):
+    """Serves every CouchDB request from a `FakeTransport`."""
+
+    def setUp(self):
+        self.transport = FakeTransport()
+        patcher = mock.patch.object(transport, '_transport', self.transport)
+        patcher.start()
+        self.addCleanup(patcher.stop)
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from couchdiscover import aio
+
+from helpers import FakeEnv, TransportTestCase, host
+
+
+class LoopBefore39(asyncio.SelectorEventLoop):
+    """A loop without `shutdown_default_executor`, as before Python 3.9."""
+
+    @property
+    def shutdown_default_executor(self):
+        raise AttributeError('shutdown_default_executor')
+
+
+class RunTests(unittest.TestCase):
+
+    def _run(self):
+        async def main():
+            return await aio.run_blocking(sum, [1, 2, 3])
+        return aio.run(main())
+
+    def test_run(self):
+        self.assertEqual(self._run(), 6)
+
+    def test_run_without_shutdown_default_executor(self):
+        loop = LoopBefore39()
+        with mock.patch.object(asyncio, 'new_event_loop', return_value=loop):
+            self.assertEqual(self._run(), 6)
+        self.assertTrue(loop.is_closed())
+
+
+class AsyncCouchManagerTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.use_clock()
+
+    def test_master_is_connected_once_waited_for(self):
+        manager = aio.AsyncCouchManager(FakeEnv(2, index=1))
+
+        async def main():
+            await manager.connect()
+            sent = [url for verb, url in self.transport.sent
+                    if host(0) in url]
+            await manager.wait_for_enabled_master()
+            return sent
+
+        self.assertEqual(aio.run(main()), [])
+        self.assertTrue(manager.master.enabled)
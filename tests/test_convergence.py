@@ -0,0 +1,62 @@
+import itertools
+import unittest
+
+from couchdiscover import convergence
+from couchdiscover.exceptions import WaitTimeoutError
+
+
+class FakeClient:
+    """A node whose `_nodes` already holds every member, whose Erlang nodes
+    connect after `connect_after` membership checks, and whose changes feed
+    sends one change followed by endless heartbeats.
+    """
+
+    def __init__(self, expected, connect_after):
+        self.nodes = ['couchdb@node-{}'.format(i) for i in range(expected)]
+        self.connect_after = connect_after
+        self.calls = 0
+
+    def membership(self):
+        self.calls += 1
+        connected = self.nodes if self.calls > self.connect_after else [
+            self.nodes[0]]
+        return {'all_nodes': connected, 'cluster_nodes': self.nodes}
+
+    def request(self, server='data', uri=None):
+        return {'update_seq': len(self.nodes)}
+
+    def follow_changes(self, db, since='now', heartbeat=10):
+        return itertools.chain([{'id': self.nodes[-1], 'seq': 3}],
+                               itertools.repeat(None))
+
+
+class MembershipWaiterTests(unittest.TestCase):
+
+    def test_known_is_cluster_nodes_and_connected_is_all_nodes(self):
+        client = FakeClient(3, connect_after=10)
+        waiter = convergence.MembershipWaiter(client, 3, timeout=5)
+        waiter._start = 0
+        self.assertFalse(waiter._check('initial'))
+        self.assertTrue(waiter._all_known())
+        self.assertEqual(waiter.progress.cluster_nodes, 3)
+        self.assertEqual(waiter.progress.all_nodes, 1)
+
+    def test_heartbeats_recheck_membership(self):
+        # members are known from the start and connect during the feed
+        client = FakeClient(3, connect_after=2)
+        waiter = convergence.MembershipWaiter(client, 3, timeout=5)
+        waiter._all_known = lambda: False
+        progress = waiter.wait()
+        self.assertEqual(progress.all_nodes, 3)
+        self.assertEqual(progress.source, 'heartbeat')
+
+    def test_times_out_on_heartbeats(self):
+        client = FakeClient(3, connect_after=float('inf'))
+        waiter = convergence.MembershipWaiter(client, 3, timeout=0.2)
+        waiter._all_known = lambda: False
+        with self.assertRaises(WaitTimeoutError):
+            waiter.wait()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,354 @@
+import json
+import unittest
+from unittest import mock
+from urllib.parse import unquote, urlsplit
+
+from couchdiscover import config, couch, reconcile
+from couchdiscover.exceptions import (
+    CouchAddNodeError, CouchDiscHTTPError, CouchRemoveNodeError)
+
+from helpers import (
+    FakeEnv, FakeResponse, FakeTransport, TransportTestCase, host, node,
+    phase_seconds)
+
+
+class UnreachableCouchTests(TransportTestCase):
+
+    def test_status_raises_once_unreachable(self):
+        client = couch.CouchInitClient(host=host(0))
+        self.assertEqual(client.status, 'cluster_enabled')
+        self.transport.down.add('/_cluster_setup')
+        with self.assertRaises(CouchDiscHTTPError):
+            client.refresh()
+
+    def test_peer_failing_status_is_not_ok(self):
+        manager = couch.CouchManager(FakeEnv(2))
+        self.transport.down.add('/_cluster_setup')
+        result = manager._add_peer(host(1), timeout=1)
+        self.assertFalse(result.ok)
+        self.assertIsInstance(result.error, CouchDiscHTTPError)
+
+    def test_reconcile_pass_survives_unreachable_peer(self):
+        manager = couch.CouchManager(FakeEnv(2))
+        self.transport.down.add('/_cluster_setup')
+        reconciler = reconcile.Reconciler(
+            manager.env, manager, hysteresis=1)
+        diff = reconciler.reconcile_once()
+        self.assertEqual(diff.missing, {host(1)})
+
+
+class NodesTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.transport.members.add(node(1))
+        self.client = couch.CouchInitClient(host=host(0))
+        del self.transport.sent[:]
+
+    def test_nodes_present_is_one_request(self):
+        present = self.client.nodes_present([host(0), host(1), host(2)])
+        self.assertEqual(present, {host(0): True, host(1): True,
+                                   host(2): False})
+        self.assertEqual([verb for verb, url in self.transport.sent
+                          if url.endswith('/_nodes/_all_docs')], ['post'])
+        self.assertEqual(len(self.transport.sent), 1)
+
+    def test_node_in_nodes_gets_its_doc(self):
+        self.assertTrue(self.client._node_in_nodes(node(1)))
+        self.assertFalse(self.client._node_in_nodes(node(2)))
+        self.assertEqual(
+            [unquote(url.rsplit('/', 1)[-1])
+             for verb, url in self.transport.sent],
+            [node(1), node(2)])
+
+    def test_unreachable_nodes_are_not_present(self):
+        self.transport.down.add('/_nodes/_all_docs')
+        self.assertEqual(self.client.nodes_present([host(1)]),
+                         {host(1): False})
+
+
+class StatusCacheTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.transport.state = 'cluster_disabled'
+        self.client = couch.CouchInitClient(FakeEnv(2), host(0))
+        del self.transport.sent[:]
+
+    def _status_requests(self):
+        return len([url for verb, url in self.transport.sent
+                    if verb == 'get' and url.endswith('/_cluster_setup')])
+
+    def test_status_is_kept_from_connecting(self):
+        for _ in range(3):
+            self.assertTrue(self.client.disabled)
+            self.assertFalse(self.client.finished)
+        self.assertEqual(self._status_requests(), 0)
+        self.assertEqual(self.client.refresh(), 'cluster_disabled')
+        self.assertEqual(self._status_requests(), 1)
+
+    def test_changing_the_state_invalidates_it(self):
+        self.assertEqual(self.client.status, 'cluster_disabled')
+        self.client.enable()
+        self.assertEqual(self.client.status, 'cluster_enabled')
+        self.client.add_node(couch.CouchInitClient(host=host(1)))
+        self.assertEqual(self.client.status, 'cluster_enabled')
+        self.client.finish()
+        self.assertEqual(self.client.status, 'cluster_finished')
+        self.assertEqual(self._status_requests(), 3)
+
+
+class CouchManagerTests(TransportTestCase):
+
+    def test_master_client_is_built_on_first_use(self):
+        manager = couch.CouchManager(FakeEnv(2, index=1))
+        self.assertEqual(manager.status, 'cluster_enabled')
+        self.assertFalse([url for verb, url in self.transport.sent
+                          if host(0) in url])
+        self.assertEqual(str(manager.master), host(0))
+        self.assertIsNone(couch.CouchManager(FakeEnv(2)).master)
+
+    def test_unexpected_peer_error_is_not_ok(self):
+        manager = couch.CouchManager(FakeEnv(2))
+        with mock.patch.object(
+                couch.CouchInitClient, 'refresh', side_effect=KeyError):
+            results = manager.add_peers([host(1)])
+        self.assertFalse(results[host(1)].ok)
+        self.assertIsInstance(results[host(1)].error, KeyError)
+
+    def test_peer_is_ok_once_in_nodes(self):
+        manager = couch.CouchManager(FakeEnv(2))
+        with mock.patch.object(
+                couch.CouchInitClient, 'host_is_valid', return_value=True):
+            results = manager.add_peers([host(1)])
+        self.assertTrue(results[host(1)].ok)
+        self.assertIn(node(1), self.transport.members)
+
+    def test_skipped_peer_is_not_ok(self):
+        manager = couch.CouchManager(FakeEnv(2))
+        self.transport.down.add(
+            '{}:{}'.format(host(1), config.DEFAULT_PORTS[1]))
+        with mock.patch.object(
+                couch.CouchInitClient, 'host_is_valid', return_value=True):
+            results = manager.add_peers([host(1)])
+        self.assertFalse(results[host(1)].ok)
+        self.assertIsInstance(results[host(1)].error, CouchAddNodeError)
+        self.assertNotIn(('post', 'http://{}:{}/_cluster_setup'.format(
+            host(0), config.DEFAULT_PORTS[0])), self.transport.sent)
+
+    def test_peer_and_reconciler_work_record_no_phases(self):
+        manager = couch.CouchManager(FakeEnv(2))
+        before = [phase_seconds(p) for p in ('add', 'wait_for_couch')]
+        with mock.patch.object(
+                couch.CouchInitClient, 'host_is_valid', return_value=True):
+            manager.add_peers([host(1)])
+        self.assertEqual(
+            [phase_seconds(p) for p in ('add', 'wait_for_couch')], before)
+
+    def test_add_phase_excludes_waiting_for_master(self):
+        clock = self.use_clock()
+        manager = couch.CouchManager(FakeEnv(2, index=1))
+        count, total = phase_seconds('add')
+
+        def wait_for_enabled_master():
+            clock.now += 10
+
+        with mock.patch.object(manager, 'wait_for_enabled_master',
+                               wait_for_enabled_master), \
+                mock.patch.object(couch.CouchInitClient, 'host_is_valid',
+                                  return_value=True):
+            manager.add_to_master()
+        self.assertEqual(phase_seconds('add'), (count + 1, total))
+
+    def test_connecting_can_be_deferred(self):
+        manager = couch.CouchManager(FakeEnv(2, index=1), connect=False)
+        self.assertEqual(self.transport.sent, [])
+        manager.local.connect(timeout=1)
+        self.assertEqual(manager.status, 'cluster_enabled')
+
+
+class RemoveNodesTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.transport.members.update(node(i) for i in range(1, 5))
+        self.manager = couch.CouchManager(FakeEnv(2))
+
+    def _bulk_requests(self):
+        return [url for verb, url in self.transport.sent
+                if url.endswith('/_bulk_docs')]
+
+    def test_departed_excludes_ready_pods_and_the_cluster_size(self):
+        self.manager.env.hosts = (host(0), host(1), host(3))
+        hosts = [host(i) for i in range(5)] + ['example.com']
+        self.assertEqual(self.manager.departed(hosts), [host(2), host(4)])
+
+    def test_skips_nodes_holding_the_only_copy_of_shards(self):
+        self.transport.shards = {
+            'db': {'00000000-7fffffff': [node(0), node(2)],
+                   '80000000-ffffffff': [node(3)]}}
+        removed = self.manager.remove_nodes([host(2), host(3)], 1)
+        self.assertEqual(removed, {host(2): True, host(3): False})
+        self.assertIn(node(3), self.transport.members)
+        self.assertEqual(len(self._bulk_requests()), 1)
+
+    def test_removes_in_batches(self):
+        hosts = [host(i) for i in range(2, 5)]
+        removed = self.manager.remove_nodes(hosts, batch_size=2)
+        self.assertEqual(removed, dict.fromkeys(hosts, True))
+        self.assertEqual(self.transport.members, {node(0), node(1)})
+        self.assertEqual(len(self._bulk_requests()), 2)
+
+    def test_conflict_is_not_removed(self):
+        self.transport.conflicts.add(node(3))
+        removed = self.manager.remove_nodes([host(3), host(4)], 2)
+        self.assertEqual(removed, {host(3): False, host(4): True})
+        with self.assertRaises(CouchRemoveNodeError):
+            self.manager.local.remove_node(host(3))
+
+
+class ServerTypeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = FakeTransport(down={'/_all_dbs'})
+
+    def test_servers_kept_once_every_type_is_detected(self):
+        client = couch.CouchInitClient(
+            host=host(0), transport=self.transport, connect=False)
+        self.assertEqual(set(client.servers), {None})
+        with self.assertRaises(CouchDiscHTTPError):
+            client.request(uri='/_membership')
+        self.assertIsNone(client._servers)
+
+        self.transport.down.clear()
+        by_port = client._setup_servers()
+        self.assertEqual(client.servers, {
+            'data': by_port[config.DEFAULT_PORTS[0]],
+            'admin': by_port[config.DEFAULT_PORTS[1]]})
+        self.assertIs(client._servers, client.servers)
+        self.assertEqual(client.membership()['all_nodes'], [node(0)])
+
+
+class AllDbsTransport:
+    """Serves `/_all_dbs` from `dbs`, honoring its paging parameters unless
+    `paged` is False.
+    """
+
+    def __init__(self, dbs, paged=True):
+        self.dbs = sorted(dbs)
+        self.paged = paged
+        self.params = []
+
+    def request(self, verb, url, params=None, **kwargs):
+        params = params or {}
+        self.params.append(params)
+        dbs = self.dbs
+        if not self.paged:
+            return FakeResponse(dbs)
+        if 'start_key' in params:
+            dbs = [db for db in dbs if db >= json.loads(params['start_key'])]
+        if 'end_key' in params:
+            dbs = [db for db in dbs if db <= json.loads(params['end_key'])]
+        dbs = dbs[params.get('skip', 0):]
+        if params.get('limit'):
+            dbs = dbs[:params['limit']]
+        return FakeResponse(dbs)
+
+
+class AllDbsTests(unittest.TestCase):
+
+    def _server(self, *dbs, paged=True):
+        self.transport = AllDbsTransport(dbs, paged)
+        return couch.CouchServer(host=host(0), transport=self.transport)
+
+    def test_all_dbs_pages(self):
+        server = self._server('a', 'b', 'c', 'd', 'e')
+        self.assertEqual(list(server.all_dbs(page_size=2)),
+                         ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(self.transport.params, [
+            {'limit': 2}, {'start_key': '"b"', 'limit': 2, 'skip': 1},
+            {'start_key': '"d"', 'limit': 2, 'skip': 1}])
+
+    def test_all_dbs_stops_when_limit_is_ignored(self):
+        server = self._server('a', 'b', 'c', paged=False)
+        self.assertEqual(list(server.all_dbs(page_size=2)), ['a', 'b', 'c'])
+        self.assertEqual(len(self.transport.params), 1)
+
+    def test_contains_and_type_ask_for_one_db(self):
+        server = self._server('_nodes', '_users', 'db')
+        self.assertIn('db', server)
+        self.assertNotIn('missing', server)
+        self.assertEqual(server.type, 'admin')
+        self.assertEqual(self._server('_users').type, 'data')
+        self.assertEqual(self.transport.params, [
+            {'start_key': '"_nodes"', 'end_key': '"_nodes"'}])
+
+
+class ScriptedTransport:
+    """Answers each request with the body `bodies` has for its verb and
+    path, recording the requests.
+    """
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.sent = []
+
+    def request(self, verb, url, params=None, data=None, **kwargs):
+        path = unquote(urlsplit(url).path)
+        self.sent.append((verb, path, params,
+                          json.loads(data) if data else None))
+        body = self.bodies.get((verb, path))
+        if body is None:
+            return FakeResponse({'error': 'not_found'}, 404)
+        return FakeResponse(body)
+
+
+class DatabaseTests(unittest.TestCase):
+
+    def _db(self, bodies):
+        self.transport = ScriptedTransport(bodies)
+        server = couch.CouchServer(host=host(0), transport=self.transport)
+        return server['my/db']
+
+    def test_get(self):
+        db = self._db({('get', '/my/db/a b'): {'_id': 'a b', '_rev': '1-a'}})
+        self.assertEqual(db.get('a b'), {'_id': 'a b', '_rev': '1-a'})
+        self.assertIsNone(db.get('missing'))
+        self.assertEqual(db.get('missing', {}), {})
+        self.assertIn('a b', db)
+        with self.assertRaises(KeyError):
+            db['missing']
+
+    def test_get_raises_on_errors(self):
+        db = self._db({})
+        db.server._transport = FakeTransport(down={'/my/db/a'})
+        with self.assertRaises(CouchDiscHTTPError):
+            db.get('a')
+
+    def test_all_docs(self):
+        rows = [{'id': 'a', 'key': 'a', 'value': {'rev': '1-a'}}]
+        db = self._db({('get', '/my/db/_all_docs'): {'rows': rows},
+                       ('post', '/my/db/_all_docs'): {'rows': rows}})
+        self.assertEqual(db.all_docs(include_docs=True), rows)
+        self.assertEqual(db.all_docs(keys=['a']), rows)
+        self.assertEqual(self.transport.sent, [
+            ('get', '/my/db/_all_docs', {'include_docs': 'true'}, None),
+            ('post', '/my/db/_all_docs', {}, {'keys': ['a']})])
+
+    def test_bulk_docs_is_one_request(self):
+        results = [{'id': 'a', 'ok': True, 'rev': '2-b'},
+                   {'id': 'b', 'error': 'conflict'}]
+        db = self._db({('post', '/my/db/_bulk_docs'): results})
+        docs = [{'_id': 'a', '_rev': '1-a', '_deleted': True}, {'_id': 'b'}]
+        self.assertEqual(db.bulk_docs(iter(docs)), results)
+        self.assertEqual(self.transport.sent,
+                         [('post', '/my/db/_bulk_docs', None, {'docs': docs})])
+
+    def test_changes(self):
+        feed = {'results': [{'id': 'a', 'seq': '1'}], 'last_seq': '1'}
+        db = self._db({('get', '/my/db/_changes'): feed})
+        self.assertEqual(db.changes(since=0), feed)
+        self.assertEqual(self.transport.sent,
+                         [('get', '/my/db/_changes', {'since': 0}, None)])
+        with self.assertRaises(CouchDiscHTTPError):
+            self._db({}).changes()
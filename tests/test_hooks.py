@@ -0,0 +1,68 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from couchdiscover import hooks
+
+from helpers import ClockTestCase
+
+
+def event(url, status=200):
+    req = hooks.RequestEvent('couch', 'GET', url, server='http://couchdb')
+    req.status = status
+    return req
+
+
+class RequestRecorderTests(unittest.TestCase):
+
+    def test_keeps_only_the_last_requests(self):
+        recorder = hooks.RequestRecorder(size=2)
+        for url in ('/a', '/b', '/c'):
+            recorder(event(url))
+        self.assertEqual(len(recorder), 2)
+        self.assertEqual([r['url'] for r in recorder.records()],
+                         ['/b', '/c'])
+        recorder.clear()
+        self.assertEqual(recorder.records(), [])
+
+    def test_dump_writes_lines_of_json(self):
+        recorder = hooks.RequestRecorder(size=2)
+        failed = event('/_nodes/{id}', status=None)
+        failed.exception = ValueError('boom')
+        recorder(event('/_up'))
+        recorder(failed)
+        stream = io.StringIO()
+        recorder.dump(stream)
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r['url'] for r in lines], ['/_up', '/_nodes/{id}'])
+        self.assertEqual(lines[1]['exception'], "ValueError('boom')")
+        self.assertEqual(lines[0]['attributes'], {'server': 'http://couchdb'})
+
+
+class RequestHooksTests(ClockTestCase):
+
+    def setUp(self):
+        self.clock = self.use_clock()
+        self.hooks = hooks.RequestHooks()
+
+    def test_failing_hook_doesnt_fail_the_request(self):
+        seen = []
+        self.hooks.register(pre=mock.Mock(side_effect=KeyError),
+                            post=mock.Mock(side_effect=KeyError))
+        self.hooks.register(post=seen.append)
+        with self.assertLogs(hooks.log, 'WARNING') as logs:
+            with self.hooks.request(event('/_up')):
+                self.clock.now = 2
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual([e.latency for e in seen], [2])
+
+    def test_exception_is_recorded_and_raised(self):
+        seen = []
+        self.hooks.register(post=seen.append)
+        with self.assertRaises(ValueError):
+            with self.hooks.request(event('/_up')):
+                raise ValueError('boom')
+        self.assertIsInstance(seen[0].exception, ValueError)
+        self.hooks.unregister(post=seen.append)
+        self.assertEqual(self.hooks.post, [])
@@ -0,0 +1,346 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from couchdiscover import kube, util
+
+from helpers import ClockTestCase, FakeResponse
+
+
+HOST = 'couchdb-0.couchdb.default.svc.cluster.local'
+PORTS = [{'port': 5986}, {'port': 5984}]
+
+
+def endpoint(*subsets):
+    endp = {'kind': 'Endpoints', 'metadata': {'name': 'couchdb'}}
+    if subsets:
+        endp['subsets'] = list(subsets)
+    return endp
+
+
+class FakeAPI:
+    """Serves the statefulset of three pods, and `endpoints` in turn for
+    every fetch of its endpoint, the last one for good.
+    """
+
+    def __init__(self, *endpoints):
+        self.endpoints = list(endpoints)
+
+    def get_endpoint(self, name=None, selector=None, namespace=None,
+                     fresh=False):
+        if len(self.endpoints) > 1:
+            return self.endpoints.pop(0)
+        return self.endpoints[0]
+
+    def get_statefulset(self, name=None, selector=None, namespace=None,
+                        fresh=False):
+        return {'spec': {'replicas': 3}}
+
+    def get_environment(self, statefulset, container, fresh=False):
+        return {}
+
+
+class FakeInformer:
+    """A synced informer holding `obj`."""
+    synced = True
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def get(self):
+        return self.obj
+
+
+class KubeAPIClientTests(ClockTestCase):
+
+    def setUp(self):
+        self.clock = self.use_clock()
+        self.api = kube.KubeAPIClient(namespace='default', cache_ttl=5)
+        self.api._api = mock.Mock()
+        self.responses = []
+        self.sent = []
+
+        def request(resource, verb, method='GET', **kwargs):
+            self.sent.append((verb, kwargs['url'], kwargs.get('params')))
+            resp = self.responses.pop(0)
+            if isinstance(resp, Exception):
+                raise resp
+            return resp
+
+        patcher = mock.patch.object(self.api, '_request', request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_without_name_or_selector(self):
+        with self.assertRaises(ValueError):
+            self.api.get_endpoint()
+        self.assertEqual(self.sent, [])
+
+    def test_named_object_is_fetched_once_per_ttl(self):
+        self.responses = [FakeResponse(endpoint()), FakeResponse(endpoint())]
+        self.assertEqual(self.api.get_endpoint('couchdb'), endpoint())
+        self.clock.now = 4
+        self.api.get_endpoint('couchdb')
+        self.assertEqual(self.sent, [('get', 'endpoints/couchdb', None)])
+        self.clock.now = 5
+        self.api.get_endpoint('couchdb')
+        self.assertEqual(len(self.sent), 2)
+
+    def test_fresh_skips_the_cache(self):
+        self.responses = [FakeResponse(endpoint()), FakeResponse(endpoint())]
+        self.api.get_endpoint('couchdb')
+        self.api.get_endpoint('couchdb', fresh=True)
+        self.assertEqual(len(self.sent), 2)
+
+    def test_watch_closes_the_response(self):
+        resp = mock.Mock(spec=['status_code', 'iter_lines', 'close'])
+        resp.iter_lines.return_value = [
+            b'', b'{"type": "ADDED", "object": {"metadata": {}}}']
+        self.responses = [resp]
+        events = list(self.api.watch_api_objects(Resource, 'couchdb'))
+        self.assertEqual(events, [('ADDED', {'metadata': {}})])
+        resp.close.assert_called_once_with()
+
+    def test_not_found_evicts_the_object(self):
+        self.responses = [FakeResponse(endpoint()),
+                          FakeResponse({'code': 404}, 404)]
+        self.api.get_endpoint('couchdb')
+        self.clock.now = 5
+        self.assertIsNone(self.api.get_endpoint('couchdb'))
+        self.assertEqual(self.api._cache, {})
+
+    def test_failed_request_falls_back_to_the_cached_object(self):
+        self.responses = [FakeResponse(endpoint()),
+                          requests.ConnectionError('refused'),
+                          requests.ConnectionError('refused')]
+        self.api.get_endpoint('couchdb')
+        self.clock.now = 5
+        self.assertEqual(self.api.get_endpoint('couchdb'), endpoint())
+        self.api.clear_cache()
+        with self.assertRaises(requests.ConnectionError):
+            self.api.get_endpoint('couchdb')
+
+
+    def test_environment_fetches_each_reference_once(self):
+        def ref(kind, name, key):
+            return {'valueFrom': {kind: {'name': name, 'key': key}}}
+
+        env = [dict(name='USER', **ref('secretKeyRef', 'creds', 'user')),
+               dict(name='PASS', **ref('secretKeyRef', 'creds', 'pass')),
+               dict(name='SIZE', **ref('configMapKeyRef', 'couch', 'size')),
+               dict(name='MODE', **ref('configMapKeyRef', 'couch', 'mode')),
+               dict(name='UNREAD', **ref('secretKeyRef', 'other', 'key')),
+               {'name': 'PLAIN', 'value': 'yes'}]
+        statefulset = {'spec': {'template': {'spec': {'containers': [
+            {'name': 'couchdb', 'env': env}]}}}}
+        self.responses = [
+            FakeResponse({'data': {'user': 'YWRtaW4=', 'pass': 'cGFzcw=='}}),
+            FakeResponse({'data': {'size': '3', 'mode': 'lease'}})]
+        environment = self.api.get_environment(statefulset, 'couchdb')
+        self.assertEqual(len(environment), 6)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(
+            [environment[k] for k in ('USER', 'PASS', 'SIZE', 'MODE')],
+            ['admin', 'pass', '3', 'lease'])
+        self.assertEqual(environment['PLAIN'], 'yes')
+        self.assertEqual([url for verb, url, params in self.sent],
+                         ['secrets/creds', 'configmaps/couch'])
+
+
+class KubeInterfaceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.kube = kube.KubeInterface(kube.KubeHostname(HOST))
+
+    def test_endpoint_without_ready_pods(self):
+        for endp in (endpoint(), endpoint({'ports': PORTS})):
+            self.assertEqual(self.kube._get_hosts(endp), ())
+        self.assertIsNone(self.kube._get_ports(endpoint()))
+
+    def test_ports_of_pods_that_arent_ready(self):
+        endp = endpoint(
+            {'addresses': [{'hostname': 'couchdb-1'}], 'ports': PORTS},
+            {'notReadyAddresses': [{'hostname': 'couchdb-0'}],
+             'ports': PORTS})
+        self.assertEqual(self.kube._get_hosts(endp),
+                         ('couchdb-1.couchdb.default.svc.cluster.local',))
+        self.assertEqual(self.kube._get_ports(endp), (5984, 5986))
+
+    def test_refresh_waits_for_ports_then_keeps_them(self):
+        self.kube.api = FakeAPI(
+            endpoint(), endpoint({'notReadyAddresses': [], 'ports': PORTS}))
+        snap = self.kube.refresh()
+        self.assertEqual(snap.ports, (5984, 5986))
+        self.kube.api = FakeAPI(endpoint())
+        snap = self.kube.refresh()
+        self.assertEqual((snap.hosts, snap.ports), ((), (5984, 5986)))
+
+    def test_refresh_within_the_cache_ttl_fetches_again(self):
+        statefulset = {
+            'metadata': {'name': 'couchdb'},
+            'spec': {'replicas': 3, 'template': {'spec': {'containers': [
+                {'name': 'couchdb', 'env': [{'name': 'COUCHDB_ADMIN_USER',
+                                             'value': 'admin'}]}]}}}}
+        bodies = {'endpoints/couchdb': endpoint({'ports': PORTS}),
+                  'statefulsets/couchdb': statefulset}
+        sent = []
+
+        def request(resource, verb, method='GET', **kwargs):
+            sent.append(kwargs['url'])
+            return FakeResponse(bodies[kwargs['url']])
+
+        self.kube.api._api = mock.Mock()
+        with mock.patch.object(self.kube.api, '_request', request):
+            self.kube.refresh()
+            self.kube.refresh()
+        self.assertEqual(
+            sent, ['endpoints/couchdb', 'statefulsets/couchdb'] * 2)
+
+    def test_refresh_hosts_fetches_only_the_endpoint(self):
+        self.kube.api = FakeAPI(
+            endpoint({'ports': PORTS}),
+            endpoint({'addresses': [{'hostname': 'couchdb-1'}],
+                      'ports': PORTS}))
+        snap = self.kube.refresh()
+        with mock.patch.object(self.kube.api, 'get_statefulset') as get_ss:
+            new = self.kube.refresh_hosts()
+        get_ss.assert_not_called()
+        self.assertEqual(new.hosts,
+                         ('couchdb-1.couchdb.default.svc.cluster.local',))
+        self.assertEqual(new._replace(hosts=()), snap)
+
+    def test_repr_never_resolves_a_snapshot(self):
+        self.kube.informer = FakeInformer(endpoint(
+            {'notReadyAddresses': [{'hostname': 'couchdb-0'}]}))
+        with mock.patch.object(self.kube, 'refresh') as refresh:
+            text = repr(self.kube)
+        refresh.assert_not_called()
+        self.assertIn('ports: {}'.format(util.UNRESOLVED), text)
+        self.assertIn('hosts: ()', text)
+
+
+class Resource:
+    kind = 'Endpoints'
+    endpoint = 'endpoints'
+
+
+def obj(name, version, **fields):
+    return dict(metadata={'name': name, 'resourceVersion': version},
+                **fields)
+
+
+class FakeWatchAPI:
+    """Answers each list with the next of `lists`, and each watch with the
+    events of the next of `watches`, stopping `informer` once they run out.
+    """
+
+    def __init__(self, lists, watches=()):
+        self.lists = list(lists)
+        self.watches = list(watches)
+        self.since = []
+        self.informer = None
+
+    def list_api_objects(self, resource, name=None, namespace=None):
+        return self.lists.pop(0)
+
+    def watch_api_objects(self, resource, name=None, since=None,
+                          namespace=None):
+        self.since.append(since)
+        if not self.watches:
+            self.informer.stop()
+            return iter(())
+        return iter(self.watches.pop(0))
+
+
+class InformerTests(unittest.TestCase):
+
+    def _informer(self, api):
+        informer = kube.Informer(api, Resource, 'couchdb')
+        api.informer = informer
+        self.waits = []
+        informer._stopped.wait = lambda delay: self.waits.append(
+            (delay, informer.synced))
+        events = []
+        informer.subscribe(lambda kind, o: events.append(
+            (kind, o['metadata']['name'])))
+        return informer, events
+
+    def test_relist_notifies_the_difference(self):
+        api = FakeWatchAPI([
+            ([obj('a', '1'), obj('b', '1')], '2'),
+            ([obj('a', '3'), obj('b', '1'), obj('c', '3')], '4'),
+            ([obj('c', '3')], '5')])
+        informer, events = self._informer(api)
+        informer._relist()
+        self.assertTrue(informer.synced)
+        self.assertEqual(events, [('ADDED', 'a'), ('ADDED', 'b')])
+        del events[:]
+        informer._relist()
+        self.assertEqual(sorted(events), [('ADDED', 'c'), ('MODIFIED', 'a')])
+        del events[:]
+        informer._relist()
+        self.assertEqual(sorted(events), [('DELETED', 'a'), ('DELETED', 'b')])
+        self.assertEqual(informer.resource_version, '5')
+        self.assertEqual([o['metadata']['name'] for o in informer.items()],
+                         ['c'])
+
+    def test_watch_resumes_from_the_last_version(self):
+        api = FakeWatchAPI([([obj('a', '1')], '2')], [
+            [('MODIFIED', obj('a', '3')), ('ADDED', obj('b', '4'))],
+            [('DELETED', obj('a', '5'))]])
+        informer, events = self._informer(api)
+        informer._run()
+        self.assertEqual(api.since, ['2', '4', '5'])
+        self.assertEqual(informer.resource_version, '5')
+        self.assertIsNone(informer.get('a'))
+        self.assertEqual(informer.get('b')['metadata']['resourceVersion'],
+                         '4')
+        self.assertEqual(events, [('ADDED', 'a'), ('MODIFIED', 'a'),
+                                  ('ADDED', 'b'), ('DELETED', 'a')])
+
+    def test_relists_once_the_version_expired(self):
+        api = FakeWatchAPI(
+            [([obj('a', '1')], '2'), ([obj('a', '7')], '8')],
+            [[('ERROR', {'code': 500, 'message': 'oops'})],
+             [('ERROR', {'code': 410, 'message': 'too old'})]])
+        informer, events = self._informer(api)
+        informer._run()
+        self.assertEqual(api.since, ['2', '2', '8'])
+        self.assertEqual(api.lists, [])
+        self.assertEqual(events, [('ADDED', 'a'), ('MODIFIED', 'a')])
+        self.assertEqual(self.waits, [(informer.retry_delay, True)])
+
+    def test_unexpected_error_unsyncs_and_relists(self):
+        api = FakeWatchAPI(
+            [([obj('a', '1')], '2'), ([obj('a', '7')], '8')],
+            [[('MODIFIED', {'metadata': {}})]])
+        informer, events = self._informer(api)
+        with self.assertLogs(kube.log, 'ERROR'):
+            informer._run()
+        self.assertEqual(api.since, ['2', '8'])
+        self.assertEqual(self.waits, [(informer.retry_delay, False)])
+        self.assertTrue(informer.synced)
+        self.assertEqual(informer.get('a')['metadata']['resourceVersion'],
+                         '7')
+
+
+class SubscribeTests(unittest.TestCase):
+
+    def test_callback_only_fires_when_hosts_change(self):
+        def endp(version, *nodes):
+            return obj('couchdb', version, subsets=[{
+                'addresses': [{'hostname': n} for n in nodes],
+                'ports': PORTS}])
+
+        iface = kube.KubeInterface(kube.KubeHostname(HOST))
+        api = FakeWatchAPI([([endp('1', 'couchdb-0')], '1')])
+        iface.informer = informer = kube.Informer(api, Resource, 'couchdb')
+        informer._relist()
+        calls = []
+        with mock.patch.object(informer, 'start'):
+            iface.subscribe(calls.append)
+        informer._apply('MODIFIED', endp('2', 'couchdb-0'))
+        self.assertEqual(calls, [])
+        informer._apply('MODIFIED', endp('3', 'couchdb-0', 'couchdb-1'))
+        self.assertEqual(calls, [(HOST, HOST.replace('-0', '-1', 1))])
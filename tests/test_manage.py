@@ -0,0 +1,253 @@
+from unittest import mock
+
+from couchdiscover import aio, coordination, couch, manage
+
+from helpers import FakeClock, FakeEnv, TransportTestCase, host, node
+
+
+class FakeLease:
+    """An in memory Lease the master published `state` on."""
+
+    def __init__(self, state='finished', requested=(), joined=()):
+        self.state = state
+        self.requested = frozenset(requested)
+        self.joined = frozenset(joined)
+
+    def watch(self, timeout=None):
+        pass
+
+    def unwatch(self):
+        pass
+
+    def publish(self, state, holder, clear=()):
+        self.state = state
+        for key in clear:
+            setattr(self, key, frozenset())
+
+    def request_join(self, host):
+        self.requested |= {host}
+
+    def mark_joined(self, hosts):
+        self.joined |= frozenset(hosts)
+
+    def wait_until(self, predicate, target='condition', timeout=None):
+        assert predicate()
+
+
+class BootstrapLeaseTests(TransportTestCase):
+
+    def _manager(self, env):
+        manager = manage.ClusterManager.__new__(manage.ClusterManager)
+        manager.env = env
+        manager.couch = couch.CouchManager(env)
+        return manager
+
+    def _bootstrap(self, manager, lease):
+        with mock.patch.object(coordination.JoinLease, 'for_env',
+                               return_value=lease):
+            manager.bootstrap_lease()
+
+    def test_master_keeps_joined_once_finished(self):
+        lease = FakeLease('enabled', requested=(host(1), host(2)))
+        with mock.patch.object(
+                couch.CouchInitClient, 'host_is_valid', return_value=True):
+            self._bootstrap(self._manager(FakeEnv(3)), lease)
+        self.assertEqual(lease.state, 'finished')
+        self.assertEqual(lease.requested, frozenset())
+        self.assertEqual(lease.joined, {host(1), host(2)})
+
+        manager = self._manager(FakeEnv(3, index=2))
+        with mock.patch.object(manager, '_log_late_join') as late_join:
+            self._bootstrap(manager, lease)
+        late_join.assert_not_called()
+
+    def test_joins_only_once_enabled(self):
+        self.transport.state = 'cluster_disabled'
+        self.transport.failures['enable_cluster'] = 2
+        self.use_clock()
+        manager = self._manager(FakeEnv(3, index=1))
+        lease = FakeLease('enabled', joined=(host(1),))
+        states = []
+        lease.request_join = lambda host: states.append(self.transport.state)
+        with self.assertLogs(manage.log, 'WARNING'):
+            self._bootstrap(manager, lease)
+        self.assertEqual(states, ['cluster_enabled'])
+
+    def test_late_joiner_left_to_reconciler(self):
+        manager = self._manager(FakeEnv(3, index=2))
+        lease = FakeLease()
+        with self.assertLogs(manage.log, 'INFO') as logs:
+            self._bootstrap(manager, lease)
+        self.assertEqual(lease.requested, {host(2)})
+        self.assertIn("master's reconciler", logs.output[-1])
+        self.assertFalse([url for verb, url in self.transport.sent
+                          if host(0) in url])
+
+
+class EnableTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.transport.state = 'cluster_disabled'
+        self.use_clock()
+
+    def _manager(self, size=1):
+        manager = manage.ClusterManager.__new__(manage.ClusterManager)
+        manager.env = FakeEnv(size)
+        manager.couch = couch.CouchManager(manager.env)
+        return manager
+
+    def test_failed_enable_is_retried(self):
+        self.transport.failures['enable_cluster'] = 2
+        with self.assertLogs(manage.log, 'WARNING') as logs:
+            self.assertTrue(self._manager()._enable_unless_finished())
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(self.transport.state, 'cluster_enabled')
+
+    def test_failed_async_enable_is_retried(self):
+        self.transport.failures['enable_cluster'] = 1
+        manager = manage.ClusterManager.__new__(manage.ClusterManager)
+        manager.env = FakeEnv(1)
+        manager.couch = aio.AsyncCouchManager(manager.env)
+
+        async def enable():
+            await manager.couch.connect()
+            return await manager._enable_unless_finished_async()
+
+        with self.assertLogs(manage.log, 'WARNING'):
+            self.assertTrue(aio.run(enable()))
+        self.assertEqual(self.transport.state, 'cluster_enabled')
+
+    def test_bootstrap_finishes_only_once_enabled(self):
+        self.transport.failures['enable_cluster'] = 1
+        manager = self._manager()
+        with mock.patch.object(manager.couch, 'finish') as finish:
+            manager.bootstrap()
+        finish.assert_called_once_with()
+        self.assertEqual(self.transport.state, 'cluster_enabled')
+
+    def test_coordinator_retries_failed_enable_and_finish(self):
+        self.transport.failures.update(enable_cluster=1, finish_cluster=2)
+        manager = self._manager(size=2)
+        with mock.patch.object(
+                couch.CouchInitClient, 'host_is_valid', return_value=True):
+            manager.bootstrap_coordinator()
+        self.assertEqual(self.transport.state, 'cluster_finished')
+        self.assertEqual(self.transport.members, {node(0), node(1)})
+        self.assertEqual(sum(self.transport.failures.values()), 0)
+        self.assertEqual(manager.env.refreshes, 0)
+        self.assertGreater(manager.env.host_refreshes, 0)
+
+    def test_finished_cluster_is_left_alone(self):
+        self.transport.state = 'cluster_finished'
+        self.assertFalse(self._manager()._enable_unless_finished())
+        self.assertFalse([url for verb, url in self.transport.sent
+                          if verb == 'post'])
+
+
+class MasterStartsClock(FakeClock):
+    """Enables the master in `transport` on the first sleep, recording how
+    many requests were sent by then.
+    """
+
+    def __init__(self, transport):
+        super().__init__()
+        self.transport = transport
+        self.started_at = None
+
+    def sleep(self, seconds):
+        super().sleep(seconds)
+        if self.started_at is None:
+            self.started_at = len(self.transport.sent)
+            self.transport.states[host(0)] = 'cluster_enabled'
+
+
+class ParallelStartTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = self.use_clock(MasterStartsClock(self.transport))
+        patcher = mock.patch.object(
+            couch.CouchInitClient, 'host_is_valid', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _bootstrap(self, index):
+        manager = manage.ClusterManager.__new__(manage.ClusterManager)
+        manager.env = FakeEnv(3, index)
+        manager.couch = couch.CouchManager(manager.env)
+        manager.bootstrap()
+
+    def _adds_to_master(self):
+        return [i for i, (verb, url) in enumerate(self.transport.sent)
+                if verb == 'post' and
+                url == 'http://{}:5984/_cluster_setup'.format(host(0))]
+
+    def test_node_waits_for_a_master_started_last(self):
+        self.transport.states[host(0)] = 'cluster_disabled'
+        self._bootstrap(1)
+        self.assertIsNotNone(self.clock.started_at)
+        adds = self._adds_to_master()
+        self.assertEqual(len(adds), 1)
+        self.assertGreaterEqual(adds[0], self.clock.started_at)
+        self.assertIn(node(1), self.transport.members)
+
+    def test_node_already_in_nodes_is_not_added_again(self):
+        self.transport.members.add(node(2))
+        self._bootstrap(2)
+        self.assertEqual(self._adds_to_master(), [])
+        self.assertEqual(self.transport.members, {node(0), node(2)})
+
+
+class Woken(Exception):
+    pass
+
+
+class WakingClock(FakeClock):
+    """Raises `Woken` on the first sleep, ending `sleep_forever`."""
+
+    def sleep(self, seconds):
+        super().sleep(seconds)
+        raise Woken
+
+
+class IdleTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = self.use_clock(WakingClock())
+        self.transport.close = mock.Mock()
+        self.manager = manage.ClusterManager.__new__(manage.ClusterManager)
+        self.manager.env = FakeEnv(3)
+        self.manager.env.kube = mock.Mock()
+        self.manager.couch = couch.CouchManager(self.manager.env)
+
+    def _sleep_forever(self, mode, metrics_port=0):
+        with mock.patch.object(manage, 'exec_sleeper') as exec_sleeper, \
+                mock.patch.object(manage.config, 'METRICS_PORT', metrics_port):
+            with self.assertRaises(Woken):
+                self.manager.sleep_forever(mode)
+        return exec_sleeper
+
+    def test_release_closes_the_clients(self):
+        kube = self.manager.env.kube
+        self.manager.release()
+        kube.close.assert_called_once_with()
+        self.transport.close.assert_called_once_with()
+        self.assertIsNone(self.manager.couch)
+
+    def test_sleep_releases_first(self):
+        exec_sleeper = self._sleep_forever('sleep')
+        exec_sleeper.assert_not_called()
+        self.manager.env.kube.close.assert_called_once_with()
+        self.transport.close.assert_called_once_with()
+        self.assertEqual(self.clock.now, manage.ONE_DAY)
+
+    def test_exec_replaces_the_process(self):
+        exec_sleeper = self._sleep_forever('exec')
+        exec_sleeper.assert_called_once_with()
+
+    def test_exec_sleeps_while_serving_metrics(self):
+        exec_sleeper = self._sleep_forever('exec', metrics_port=9100)
+        exec_sleeper.assert_not_called()
+        self.transport.close.assert_called_once_with()
@@ -0,0 +1,56 @@
+import unittest
+
+from couchdiscover import metrics
+
+
+class ExpositionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_histogram(self):
+        hist = metrics.Histogram(
+            'boot_seconds', 'Seconds booting.', ('phase',),
+            registry=self.registry, buckets=(1, 5))
+        for value in (0.5, 3, 10):
+            hist.observe(value, phase='add')
+        self.assertEqual(hist.buckets, (1, 5, float('inf')))
+        self.assertEqual(self.registry.exposition(), '\n'.join([
+            '# HELP boot_seconds Seconds booting.',
+            '# TYPE boot_seconds histogram',
+            'boot_seconds_bucket{phase="add",le="1.0"} 1.0',
+            'boot_seconds_bucket{phase="add",le="5.0"} 2.0',
+            'boot_seconds_bucket{phase="add",le="+Inf"} 3.0',
+            'boot_seconds_sum{phase="add"} 13.5',
+            'boot_seconds_count{phase="add"} 3.0',
+            '']))
+
+    def test_label_values_are_escaped(self):
+        counter = metrics.Counter(
+            'requests_total', 'Requests.', ('uri',), registry=self.registry)
+        counter.inc(uri='/a"b\\c\nd')
+        self.assertIn(r'requests_total{uri="/a\"b\\c\nd"} 1.0',
+                      counter.exposition())
+
+    def test_special_values(self):
+        gauge = metrics.Gauge('value', 'A value.', registry=self.registry)
+        for value, text in ((float('inf'), '+Inf'), (float('-inf'), '-Inf'),
+                            (float('nan'), 'NaN')):
+            gauge.set(value)
+            self.assertTrue(gauge.exposition().endswith(
+                '\nvalue {}\n'.format(text)))
+
+    def test_metrics_are_sorted_by_name(self):
+        metrics.Counter('b_total', 'B.', registry=self.registry).inc()
+        metrics.Counter('a_total', 'A.', registry=self.registry).inc(2)
+        lines = self.registry.exposition().splitlines()
+        self.assertEqual([line for line in lines if not line.startswith('#')],
+                         ['a_total 2.0', 'b_total 1.0'])
+
+    def test_labels_are_checked(self):
+        counter = metrics.Counter(
+            'requests_total', 'Requests.', ('uri',), registry=False)
+        with self.assertRaises(ValueError):
+            counter.inc(method='GET')
+        with self.assertRaises(ValueError):
+            counter.inc(-1, uri='/')
@@ -0,0 +1,88 @@
+from couchdiscover import couch, reconcile
+
+from helpers import FakeEnv, TransportTestCase, host, node
+
+
+class RefreshTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        manager = couch.CouchManager(FakeEnv(2))
+        self.reconciler = reconcile.Reconciler(manager.env, manager)
+
+    def test_refreshes_only_to_confirm_a_difference(self):
+        env = self.reconciler.env
+        self.transport.members.add(node(1))
+        for _ in range(3):
+            self.assertTrue(self.reconciler.reconcile_once().converged)
+        self.assertEqual(env.refreshes, 0)
+
+        self.transport.members.discard(node(1))
+        self.assertEqual(self.reconciler.reconcile_once().missing, {host(1)})
+        self.assertEqual(env.refreshes, 1)
+
+    def test_persistent_difference_is_confirmed_once(self):
+        env = self.reconciler.env
+        self.transport.members.update({node(1), node(2)})
+        for _ in range(5):
+            self.assertEqual(self.reconciler.reconcile_once().stale,
+                             {host(2)})
+        self.assertEqual(env.refreshes, 1)
+
+        self.transport.members.add(node(3))
+        self.reconciler.reconcile_once()
+        self.assertEqual(env.refreshes, 2)
+
+
+class RunTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = self.use_clock()
+        manager = couch.CouchManager(FakeEnv(2))
+        self.reconciler = reconcile.Reconciler(
+            manager.env, manager, interval=30)
+
+    def test_passes_wait_on_the_clock(self):
+        waits = []
+
+        def wait(event, timeout=None):
+            waits.append(timeout)
+            if len(waits) == 3:
+                self.reconciler.stop()
+            return event.is_set()
+
+        self.clock.wait = wait
+        self.reconciler.run()
+        self.assertEqual(waits, [30] * 3)
+        self.assertEqual(self.reconciler.passes, 3)
+
+
+class ScaleDownTests(TransportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.transport.members.update({node(1), node(2)})
+        self.clock = self.use_clock()
+        manager = couch.CouchManager(FakeEnv(2))
+        self.reconciler = reconcile.Reconciler(
+            manager.env, manager, interval=5, hysteresis=1,
+            scale_down=True, grace=300)
+
+    def _pass_at(self, now):
+        self.clock.now = now
+        return self.reconciler.reconcile_once()
+
+    def test_removes_departed_node_after_grace(self):
+        self.assertEqual(self._pass_at(0).stale, {host(2)})
+        self._pass_at(299)
+        self.assertIn(node(2), self.transport.members)
+        self._pass_at(300)
+        self.assertNotIn(node(2), self.transport.members)
+        self.assertTrue(self._pass_at(310).converged)
+
+    def test_keeps_stale_node_while_ready(self):
+        self.reconciler.env.hosts += (host(2),)
+        self._pass_at(0)
+        self._pass_at(1000)
+        self.assertIn(node(2), self.transport.members)
@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import simulate  # noqa: E402
+
+
+class VirtualClockTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = simulate.VirtualClock()
+        self.woke = []
+
+    def _participants(self, *targets):
+        self.clock.add_participants(len(targets))
+        for target in targets:
+            threading.Thread(target=self._participant, args=(target,),
+                             daemon=True).start()
+
+    def _participant(self, target):
+        self.clock.participate()
+        try:
+            target()
+        finally:
+            self.clock.leave()
+
+    def _sleep(self, seconds):
+        def target():
+            self.clock.sleep(seconds)
+            self.woke.append((seconds, self.clock.monotonic()))
+        return target
+
+    def test_time_jumps_to_each_wake_up(self):
+        start = time.monotonic()
+        self._participants(self._sleep(3600), self._sleep(60))
+        self.assertEqual(self.clock.run(), 3600)
+        self.assertEqual(self.woke, [(60, 60), (3600, 3600)])
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_run_stops_at_the_horizon(self):
+        self._participants(self._sleep(100))
+        self.assertEqual(self.clock.run(until=10), 0)
+        self.assertEqual(self.woke, [])
+
+    def test_wait_times_out_on_virtual_time(self):
+        event = threading.Event()
+        results = []
+
+        def target():
+            results.append((self.clock.wait(event, 30),
+                            self.clock.monotonic()))
+
+        self._participants(target)
+        self.clock.run()
+        self.assertEqual(results, [(False, 30)])
+
+    def test_wait_returns_once_the_event_is_set(self):
+        event = threading.Event()
+        results = []
+
+        def target():
+            results.append((self.clock.wait(event, 30),
+                            self.clock.monotonic()))
+            self.clock.sleep(5)
+
+        def setter():
+            # sets the event from outside the simulation, like a watch
+            self.clock.sleep(1)
+            event.set()
+
+        self.clock.settle = 0.05
+        threading.Thread(target=setter, daemon=True).start()
+        while not self.clock._sleepers:
+            time.sleep(0.001)
+        self._participants(target)
+        self.assertEqual(self.clock.run(), 6)
+        self.assertEqual(results, [(True, 1)])
+
+
+class SimulationTests(unittest.TestCase):
+
+    def _simulate(self, *args):
+        out = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.simulate', '--json',
+             '--log-level', 'ERROR'] + list(args),
+            cwd=ROOT, stderr=subprocess.DEVNULL)
+        return json.loads(out.decode())
+
+    def test_small_cluster_finishes(self):
+        for mode in simulate.JOIN_MODES:
+            result = self._simulate('--size', '3', '--join-mode', mode)
+            self.assertTrue(result['finished'], mode)
+            self.assertEqual(result['restarts'], 0)
+            self.assertGreater(result['requests']['master'], 0)
@@ -0,0 +1,67 @@
+import io
+import json
+import threading
+import unittest
+
+from couchdiscover import tracing
+
+
+class TracerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.spans = []
+        self.tracer = tracing.Tracer(self.spans.append)
+
+    def test_spans_nest(self):
+        with self.tracer.span('boot') as boot:
+            with self.tracer.span('enable', node=0) as enable:
+                self.assertIs(tracing.current_span(), enable)
+            with self.tracer.span('add'):
+                pass
+        self.assertIsNone(tracing.current_span())
+        self.assertEqual([s.name for s in self.spans],
+                         ['enable', 'add', 'boot'])
+        self.assertIsNone(boot.parent_id)
+        self.assertEqual({s.parent_id for s in self.spans[:2]},
+                         {boot.span_id})
+        self.assertEqual({s.trace_id for s in self.spans}, {boot.trace_id})
+        self.assertEqual(enable.attributes, {'node': 0})
+
+    def test_error_is_recorded(self):
+        with self.assertRaises(KeyError):
+            with self.tracer.span('add'):
+                raise KeyError('peer')
+        self.assertEqual(self.spans[0].error, "KeyError: 'peer'")
+
+    def test_bound_threads_continue_the_trace(self):
+        old = tracing.TRACER.exporter
+        self.addCleanup(setattr, tracing.TRACER, 'exporter', old)
+        tracing.TRACER.exporter = self.spans.append
+
+        def work():
+            with tracing.span('peer'):
+                pass
+
+        with tracing.span('add') as add:
+            thread = threading.Thread(target=tracing.bind(work))
+            thread.start()
+            thread.join()
+        self.assertEqual(self.spans[0].parent_id, add.span_id)
+
+    def test_disabled_tracer_returns_the_noop_span(self):
+        tracer = tracing.Tracer()
+        self.assertFalse(tracer.enabled)
+        with tracer.span('boot') as span:
+            span.set_attributes(node=0)
+            self.assertIsNone(tracing.current_span())
+        self.assertIs(span, tracing.NOOP_SPAN)
+
+    def test_exporter_writes_lines_of_json(self):
+        stream = io.StringIO()
+        tracer = tracing.Tracer(tracing.JSONLinesExporter(stream))
+        with tracer.span('boot', node=0):
+            pass
+        line = json.loads(stream.getvalue())
+        self.assertEqual(line['name'], 'boot')
+        self.assertEqual(line['attributes'], {'node': 0})
+        self.assertGreaterEqual(line['duration'], 0)
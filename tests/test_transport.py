@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from couchdiscover import couch, transport
+
+
+class TransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = transport.Transport(pool_size=4, pool_hosts=2)
+
+    def test_session_pools_connections(self):
+        adapter = self.transport.session.get_adapter('http://couchdb-0')
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertIs(self.transport.session, self.transport.session)
+
+    def test_session_is_built_once_by_concurrent_threads(self):
+        built = []
+        get_session = self.transport._get_session
+        start = threading.Barrier(8)
+
+        def slow_get_session():
+            built.append(None)
+            time.sleep(0.01)
+            return get_session()
+
+        def use():
+            start.wait()
+            sessions.append(self.transport.session)
+
+        sessions = []
+        with mock.patch.object(
+                self.transport, '_get_session', slow_get_session):
+            threads = [threading.Thread(target=use) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(built), 1)
+        self.assertEqual(len({id(s) for s in sessions}), 1)
+
+    def test_close_drops_the_session(self):
+        session = self.transport.session
+        with mock.patch.object(session, 'close') as close:
+            self.transport.close()
+        close.assert_called_once_with()
+        self.assertIsNot(self.transport.session, session)
+        self.transport.close()
+        self.transport.close()
+
+    def test_set_creds_keeps_the_session(self):
+        server = couch.CouchServer(host='couchdb-0', transport=self.transport)
+        session = self.transport.session
+        with mock.patch.object(session, 'request') as request:
+            server.request('get', '/_up')
+            server.set_creds(('admin', 'changed'))
+            server.request('get', '/_up')
+        self.assertIs(self.transport.session, session)
+        self.assertEqual(
+            [call[1]['auth'] for call in request.call_args_list],
+            [('admin', 'secret'), ('admin', 'changed')])
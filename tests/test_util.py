@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import couchdiscover
+from couchdiscover import util
+from couchdiscover.exceptions import WaitTimeoutError
+
+from helpers import ClockTestCase
+
+
+class BackoffTests(unittest.TestCase):
+
+    def test_delays_grow_up_to_the_cap(self):
+        backoff = util.Backoff(initial=1, cap=5, jitter=False)
+        delays = backoff.delays()
+        self.assertEqual([next(delays) for _ in range(5)], [1, 2, 4, 5, 5])
+
+    def test_jitter_stays_in_the_upper_half_of_each_step(self):
+        delays = util.Backoff(initial=1, cap=8).delays()
+        for step in (1, 2, 4, 8, 8, 8):
+            delay = next(delays)
+            self.assertGreaterEqual(delay, step / 2)
+            self.assertLessEqual(delay, step)
+
+
+class WaitUntilTests(ClockTestCase):
+
+    def setUp(self):
+        self.clock = self.use_clock()
+        self.sleeps = []
+        sleep = self.clock.sleep
+
+        def record(seconds):
+            self.sleeps.append(seconds)
+            sleep(seconds)
+
+        self.clock.sleep = record
+
+    def test_returns_the_truthy_result(self):
+        results = iter([None, 0, 'done'])
+        result = util.wait_until(lambda: next(results), timeout=10,
+                                 backoff=util.Backoff(1, 4, jitter=False))
+        self.assertEqual(result, util.WaitResult('done', 3, 3))
+        self.assertEqual(self.sleeps, [1, 2])
+
+    def test_raises_at_the_deadline(self):
+        with self.assertRaises(WaitTimeoutError):
+            util.wait_until(lambda: False, timeout=10,
+                            backoff=util.Backoff(3, 3, jitter=False))
+        self.assertEqual(self.sleeps, [3, 3, 3, 1])
+        self.assertEqual(self.clock.now, 10)
+
+
+class LazyModuleTests(unittest.TestCase):
+
+    def test_module_is_imported_on_first_use(self):
+        module = util.LazyModule('json')
+        self.assertIn('not loaded', repr(module))
+        self.assertEqual(module.dumps([1]), '[1]')
+        self.assertIn('loaded', repr(module))
+        self.assertNotIn('not loaded', repr(module))
+
+    def test_importing_manage_defers_heavy_modules(self):
+        heavy = ('requests', 'pykube', 'couchdiscover.aio')
+        code = ('import sys, couchdiscover.manage; '
+                'print(sorted(set(sys.argv[1:]) & set(sys.modules)))')
+        root = os.path.dirname(os.path.dirname(couchdiscover.__file__))
+        out = subprocess.check_output(
+            [sys.executable, '-c', code] + list(heavy), cwd=root)
+        self.assertEqual(out.decode().strip(), '[]')